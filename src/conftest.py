@@ -1,9 +1,51 @@
 import pytest
 
 
+def pytest_addoption(parser):
+    parser.addoption("--benchmarks", action="store_true", help="run the validation pipeline benchmarks")
+    parser.addoption(
+        "--benchmark-output", default="benchmarks.json", help="file the benchmarks results are written to, as json"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Benchmarks take minutes, they only run when asked for"""
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks run with --benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.fixture()
 def anon_client(db):
     """A Django anonymous client."""
     from django.test.client import Client
 
     return Client()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def sirene_snapshot(tmp_path_factory):
+    """A SIRENE snapshot built from tst_files/sirene_stock.csv"""
+    from django.conf import settings
+    from django.test import override_settings
+
+    from mass_validator.validator.snapshot import build_snapshot
+
+    path = tmp_path_factory.mktemp("sirene") / "snapshot.sqlite3"
+    with open(settings.BASE_DIR / "tst_files" / "sirene_stock.csv", newline="") as csv_file:
+        build_snapshot(csv_file, path)
+    with override_settings(SIRENE_SNAPSHOT_PATH=str(path)):
+        yield path
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Validation reports are cached, tests must not see each other's uploads"""
+    from django.core.cache import cache
+
+    cache.clear()
+    yield
+    cache.clear()
@@ -74,6 +74,17 @@ DATABASES = {
     }
 }
 
+FILE_UPLOAD_HANDLERS = [
+    "mass_validator.upload_handlers.HashingUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
+# Validation reports are cached by upload digest, 0 disables the cache. Bigger reports (bytes) are not cached.
+VALIDATION_REPORT_CACHE = env("VALIDATION_REPORT_CACHE", default="default")
+VALIDATION_REPORT_CACHE_TTL = env.int("VALIDATION_REPORT_CACHE_TTL", default=60 * 60)
+VALIDATION_REPORT_CACHE_MAX_SIZE = env.int("VALIDATION_REPORT_CACHE_MAX_SIZE", default=1024 * 1024)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -126,6 +137,90 @@ TD_COMPANY_ELASTICSEARCH_URL = env("TD_COMPANY_ELASTICSEARCH_URL")
 TD_COMPANY_ELASTICSEARCH_INDEX = env("TD_COMPANY_ELASTICSEARCH_INDEX")
 TD_COMPANY_ELASTICSEARCH_CACERTS_CONTENT = env("TD_COMPANY_ELASTICSEARCH_CACERTS_CONTENT")
 
+# Elasticsearch client, one keep-alive connection pool per process
+TD_COMPANY_ELASTICSEARCH_MAXSIZE = env.int("TD_COMPANY_ELASTICSEARCH_MAXSIZE", default=10)
+TD_COMPANY_ELASTICSEARCH_TIMEOUT = env.int("TD_COMPANY_ELASTICSEARCH_TIMEOUT", default=10)
+TD_COMPANY_ELASTICSEARCH_MAX_RETRIES = env.int("TD_COMPANY_ELASTICSEARCH_MAX_RETRIES", default=3)
+TD_COMPANY_ELASTICSEARCH_RETRY_ON_TIMEOUT = env.bool("TD_COMPANY_ELASTICSEARCH_RETRY_ON_TIMEOUT", default=True)
+
+# Number of sirets checked per elasticsearch round trip
+SIRET_CHECK_CHUNK_SIZE = env.int("SIRET_CHECK_CHUNK_SIZE", default=100)
+# "sync" checks batches one after the other, "async" runs up to SIRET_CHECK_CONCURRENCY batches at once
+SIRET_CHECK_ENGINE = env("SIRET_CHECK_ENGINE", default="sync")
+SIRET_CHECK_CONCURRENCY = env.int("SIRET_CHECK_CONCURRENCY", default=8)
+# bigger files are split in shards checked by several workers
+SIRET_CHECK_SHARD_SIZE = env.int("SIRET_CHECK_SHARD_SIZE", default=200)
+
+# "elasticsearch", or "snapshot" to answer from a local SIRENE snapshot built with `build_sirene_snapshot`
+SIRET_CHECK_BACKEND = env("SIRET_CHECK_BACKEND", default="elasticsearch")
+SIRENE_SNAPSHOT_PATH = env("SIRENE_SNAPSHOT_PATH", default=str(BASE_DIR / "sirene_snapshot.sqlite3"))
+# query elasticsearch for sirets missing from the snapshot
+SIRENE_SNAPSHOT_ES_FALLBACK = env.bool("SIRENE_SNAPSHOT_ES_FALLBACK", default=True)
+
+# Bloom filter of active sirets built with `build_siret_bloom`, disabled when empty.
+# "accept" trusts probable hits, sending misses to the lookup path, in case the filter is older than the index.
+# "confirm" trusts definite misses as inactive, sending probable hits to the lookup path.
+SIRET_BLOOM_FILTER_PATH = env("SIRET_BLOOM_FILTER_PATH", default="")
+SIRET_BLOOM_POLICY = env("SIRET_BLOOM_POLICY", default="accept")
+
+# Tasks progress is written at most every PROGRESS_MIN_INTERVAL seconds, unless it moved by PROGRESS_MIN_DELTA %
+PROGRESS_MIN_INTERVAL = env.float("PROGRESS_MIN_INTERVAL", default=0.5)
+PROGRESS_MIN_DELTA = env.int("PROGRESS_MIN_DELTA", default=10)
+
+# Siret status cache: in-process LRU, then redis on CELERY_BROKER_URL. Ttls in seconds.
+SIRET_CACHE_ENABLED = env.bool("SIRET_CACHE_ENABLED", default=True)
+SIRET_CACHE_LOCAL_MAXSIZE = env.int("SIRET_CACHE_LOCAL_MAXSIZE", default=50_000)
+SIRET_CACHE_LOCAL_ACTIVE_TTL = env.int("SIRET_CACHE_LOCAL_ACTIVE_TTL", default=60 * 60)
+SIRET_CACHE_LOCAL_INACTIVE_TTL = env.int("SIRET_CACHE_LOCAL_INACTIVE_TTL", default=10 * 60)
+SIRET_CACHE_REDIS_ACTIVE_TTL = env.int("SIRET_CACHE_REDIS_ACTIVE_TTL", default=7 * 24 * 60 * 60)
+SIRET_CACHE_REDIS_INACTIVE_TTL = env.int("SIRET_CACHE_REDIS_INACTIVE_TTL", default=24 * 60 * 60)
+
+# Large-file mode, for connected users: files above 500 rows are validated by a celery task, chunk by chunk.
+# Uploads and json exports are handed over to and from the workers through the VALIDATION_REPORT_CACHE, for
+# LARGE_FILE_RESULT_TTL seconds at most: that cache must be shared by web and worker containers, redis in production.
+LARGE_FILE_MAX_ROWS = env.int("LARGE_FILE_MAX_ROWS", default=100_000)
+LARGE_FILE_CHUNK_SIZE = env.int("LARGE_FILE_CHUNK_SIZE", default=1000)
+LARGE_FILE_PAGE_SIZE = env.int("LARGE_FILE_PAGE_SIZE", default=100)
+LARGE_FILE_RESULT_TTL = env.int("LARGE_FILE_RESULT_TTL", default=24 * 60 * 60)
+
+# Uploaded xlsx and ods archives are rejected before being read when too costly to decompress: uncompressed size in
+# bytes, compression ratio of parts above 1 MB, and sheets count. Sheets announcing more rows than the rows limit plus
+# UPLOAD_DECLARED_ROWS_MARGIN (blank formatted rows) are rejected as too long, the others as soon as a row past that
+# limit is read. The roles tab may hold UPLOAD_MAX_ROLES_PER_ETAB times more rows than the establishments tab.
+UPLOAD_MAX_UNCOMPRESSED_SIZE = env.int("UPLOAD_MAX_UNCOMPRESSED_SIZE", default=256 * 1024 * 1024)
+UPLOAD_MAX_COMPRESSION_RATIO = env.int("UPLOAD_MAX_COMPRESSION_RATIO", default=100)
+UPLOAD_MAX_SHEETS = env.int("UPLOAD_MAX_SHEETS", default=10)
+UPLOAD_DECLARED_ROWS_MARGIN = env.int("UPLOAD_DECLARED_ROWS_MARGIN", default=5000)
+UPLOAD_MAX_ROLES_PER_ETAB = env.int("UPLOAD_MAX_ROLES_PER_ETAB", default=10)
+
+# "rows" validates rows one by one, "columnar" runs each check once per distinct column value
+VALIDATION_ENGINE = env("VALIDATION_ENGINE", default="rows")
+# Email validation results memoized per process, by address and by domain
+EMAIL_CHECK_CACHE_MAXSIZE = env.int("EMAIL_CHECK_CACHE_MAXSIZE", default=100_000)
+EMAIL_CHECK_DOMAIN_CACHE_MAXSIZE = env.int("EMAIL_CHECK_DOMAIN_CACHE_MAXSIZE", default=10_000)
+# Uploads stage durations, in a Server-Timing header, a json line of the mass_validator.timing logger and metrics
+STAGE_TIMING_ENABLED = env.bool("STAGE_TIMING_ENABLED", default=True)
+
+# Bearer token required by /metrics, closed when empty. /metrics only holds the web processes metrics: celery workers
+# serve theirs on METRICS_WORKER_PORT, 0 disables it, an internal port to scrape in each worker container. Set
+# PROMETHEUS_MULTIPROC_DIR with several processes in a container, gunicorn workers or a celery prefork pool.
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+METRICS_WORKER_PORT = env.int("METRICS_WORKER_PORT", default=0)
+
+# Upload traces exporter, disabled when empty: "console", "file" (json lines appended to TRACING_FILE) or "otlp"
+TRACING_EXPORTER = env("TRACING_EXPORTER", default="")
+TRACING_FILE = env("TRACING_FILE", default="traces.jsonl")
+# OTLP/HTTP traces endpoint, OTEL_EXPORTER_OTLP_TRACES_ENDPOINT or http://localhost:4318/v1/traces when empty
+TRACING_OTLP_ENDPOINT = env("TRACING_OTLP_ENDPOINT", default="")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"message": {"format": "%(message)s"}},
+    "handlers": {"console": {"class": "logging.StreamHandler", "formatter": "message"}},
+    "loggers": {"mass_validator.timing": {"handlers": ["console"], "level": "INFO", "propagate": False}},
+}
+
 USERNAME = env("USER_NAME")
 PASSWORD = env("PASSWORD")
 
@@ -11,3 +11,11 @@ EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 # Celery config
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_RESULT_BACKEND = "redis"
+
+# Reports and large-file error pages are written by workers and read by the web process, they need a shared cache
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CELERY_BROKER_URL,
+    }
+}
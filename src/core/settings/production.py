@@ -19,3 +19,10 @@ EMAIL_USE_TLS = env("EMAIL_USE_TLS")
 # Celery config
 CELERY_BROKER_URL = env("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = env("CELERY_BROKER_URL")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": env("CELERY_BROKER_URL"),
+    }
+}
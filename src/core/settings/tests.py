@@ -15,3 +15,10 @@ CELERY_TASK_ALWAYS_EAGER = True
 
 USERNAME = "joe"
 PASSWORD = "pass"
+
+# sirets are checked against a snapshot built from tst_files/sirene_stock.csv, see conftest
+SIRET_CHECK_BACKEND = "snapshot"
+SIRENE_SNAPSHOT_ES_FALLBACK = False
+
+CELERY_RESULT_BACKEND = "cache+memory://"
+CELERY_TASK_STORE_EAGER_RESULT = True
@@ -1,12 +1,16 @@
 from django.urls import path
 
 from mass_validator.views import (
+    CheckLargeFileView,
     CheckSiretView,
     CreateResultView,
+    LargeFileResultView,
     LogMeIn,
     UpdateResultView,
     ValidateCreationFileView,
     ValidateUpdateFileView,
+    large_file_export,
+    metrics_export,
 )
 
 urlpatterns = [
@@ -20,5 +24,9 @@ urlpatterns = [
     path("result/<str:task_id>/", CreateResultView.as_view(), name="pollable_result"),
     path("siret-result/<str:task_id>/", CheckSiretView.as_view(), name="sirets_result"),
     path("update-result", UpdateResultView.as_view(), name="update_result"),
+    path("large-result/<str:task_id>/", LargeFileResultView.as_view(), name="large_file_result"),
+    path("large-status/<str:task_id>/", CheckLargeFileView.as_view(), name="large_file_status"),
+    path("large-export/<str:task_id>/", large_file_export, name="large_file_export"),
     path("log-me-in", LogMeIn.as_view(), name="log_me_in"),
+    path("metrics", metrics_export, name="metrics"),
 ]
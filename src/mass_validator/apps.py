@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MassValidatorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mass_validator"
+
+    def ready(self):
+        # connects celery signals
+        from . import metrics, tracing  # noqa: F401
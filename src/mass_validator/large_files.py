@@ -0,0 +1,195 @@
+"""
+Large-file mode: files above `MAX_ETAB_ROWS` rows are validated chunk by chunk by a celery task.
+
+Uploads are handed over to the workers through the report cache, which web and worker processes share, and so is the
+json export of valid update files. Rows are streamed from the file and errors are stored by pages in the report cache,
+neither the request nor the worker holds the rows or their errors in memory. Only sets of sirets are kept along the
+way, for cross tabs checks.
+"""
+
+import io
+import json
+import uuid
+
+from django.conf import settings
+
+from .reports import get_report_cache
+from .validator.constants import MAX_ETAB_ROWS
+from .validator.helpers import iter_chunks
+from .validator.row_models import EtabCreateRows, EtabUpdateRows, RoleRows
+
+KIND_CREATE = "create"
+KIND_UPDATE = "update"
+
+# rows classes of the tabs of each kind of file
+ROWS_CLASSES = {KIND_CREATE: [EtabCreateRows, RoleRows], KIND_UPDATE: [EtabUpdateRows]}
+
+
+def upload_key(key):
+    return f"large_file:upload:{key}"
+
+
+def save_upload(file):
+    """Store an uploaded file in the report cache for `LARGE_FILE_RESULT_TTL` seconds and return its key"""
+    key = uuid.uuid4().hex
+    get_report_cache().set(upload_key(key), b"".join(file.chunks()), settings.LARGE_FILE_RESULT_TTL)
+    return key
+
+
+def open_upload(key):
+    """File object of an upload stored by `save_upload`, `FileNotFoundError` is raised once it expired"""
+    content = get_report_cache().get(upload_key(key))
+    if content is None:
+        raise FileNotFoundError(key)
+    return io.BytesIO(content)
+
+
+def delete_upload(key):
+    get_report_cache().delete(upload_key(key))
+
+
+def export_key(task_id):
+    return f"large_file:{task_id}:export"
+
+
+def save_export(task_id, export):
+    get_report_cache().set(export_key(task_id), export, settings.LARGE_FILE_RESULT_TTL)
+
+
+def get_export(task_id):
+    """Json export of a valid update file validated by task `task_id`, None when there is none or it expired"""
+    return get_report_cache().get(export_key(task_id))
+
+
+def count_rows(rows_class, worksheet, limit):
+    """Number of non empty rows of `worksheet`, counting stops past `limit`"""
+    count = 0
+    for _ in rows_class.iter_worksheet(worksheet):
+        count += 1
+        if count > limit:
+            break
+    return count
+
+
+def is_large_file(worksheet, rows_class):
+    """Whether the first tab `worksheet` holds more than `MAX_ETAB_ROWS` rows, rows past those are not read"""
+    return count_rows(rows_class, worksheet, MAX_ETAB_ROWS) > MAX_ETAB_ROWS
+
+
+def count_file_rows(worksheets, rows_classes):
+    """
+    Rows count of the first tab, which the rows limits apply to, and rows count of all tabs, for progress.
+
+    Counting stops past the rows limits, `LARGE_FILE_MAX_ROWS` rows of the first tab, and `UPLOAD_MAX_ROLES_PER_ETAB`
+    times more of the others, which are only counted when the first tab is within its limit.
+    """
+    limit = settings.LARGE_FILE_MAX_ROWS
+    rows_count = count_rows(rows_classes[0], worksheets[0], limit)
+    if rows_count > limit:
+        return rows_count, rows_count
+    others_limit = limit * settings.UPLOAD_MAX_ROLES_PER_ETAB
+    others = sum(count_rows(rows_class, ws, others_limit) for rows_class, ws in zip(rows_classes[1:], worksheets[1:]))
+    return rows_count, rows_count + others
+
+
+class ErrorPages:
+    """Errors of a large file, stored in the report cache by pages of `LARGE_FILE_PAGE_SIZE`"""
+
+    def __init__(self, task_id, page_size=None):
+        self.task_id = task_id
+        self.page_size = page_size or settings.LARGE_FILE_PAGE_SIZE
+        self.buffer = []
+        self.count = 0
+        self.pages = 0
+
+    def key(self, page):
+        return f"large_file:{self.task_id}:errors:{page}"
+
+    def extend(self, errors):
+        for error in errors:
+            self.buffer.append(error)
+            self.count += 1
+            if len(self.buffer) >= self.page_size:
+                self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.pages += 1
+        get_report_cache().set(self.key(self.pages), self.buffer, settings.LARGE_FILE_RESULT_TTL)
+        self.buffer = []
+
+    def get_page(self, page):
+        return get_report_cache().get(self.key(page), [])
+
+
+def validate_create_file(workbook, pages, on_progress):
+    """
+    Same checks as the creation view, in 3 passes: establishments, roles and admins.
+
+    :return: rows to check against the registry, none if the file has errors
+    """
+    ws_etablissements, ws_roles = workbook.worksheets
+    chunk_size = settings.LARGE_FILE_CHUNK_SIZE
+    rows_done = 0
+
+    etab_sirets = set()
+    for chunk in iter_chunks(EtabCreateRows.iter_worksheet(ws_etablissements), chunk_size):
+        EtabCreateRows.validate_rows(chunk)
+        for row in chunk:
+            pages.extend(row.errors)
+            if row.siret:
+                etab_sirets.add(row.siret)
+        rows_done += len(chunk)
+        on_progress(rows_done, pages.count)
+
+    admin_sirets = set()
+    seen = set()
+    for chunk in iter_chunks(RoleRows.iter_worksheet(ws_roles), chunk_size):
+        RoleRows.validate_rows(chunk, etab_sirets)
+        for row in chunk:
+            pair = f"{row.siret}_{row.email}"
+            if pair in seen:
+                row.mark_as_duplicate()
+            seen.add(pair)
+            if row.siret and row.role == "ADMIN":
+                admin_sirets.add(row.siret)
+            pages.extend(row.errors)
+        rows_done += len(chunk)
+        on_progress(rows_done, pages.count)
+
+    # admins are only checked when both tabs are valid
+    if pages.count:
+        return []
+
+    to_check = []
+    for row in EtabCreateRows.iter_worksheet(ws_etablissements):
+        row.validate_has_admin(admin_sirets)
+        pages.extend(row.errors)
+        to_check.append({"siret": row.siret, "row_number": row.index})
+
+    if pages.count:
+        return []
+    return to_check
+
+
+def validate_update_file(workbook, pages, on_progress, export):
+    """
+    Same checks as the update view, the json export is written to the text file `export`, complete when the file is
+    valid.
+    """
+    chunk_size = settings.LARGE_FILE_CHUNK_SIZE
+    rows_done = 0
+
+    export.write("[")
+    separator = "\n"
+    for chunk in iter_chunks(EtabUpdateRows.iter_worksheet(workbook.worksheets[0]), chunk_size):
+        EtabUpdateRows.validate_rows(chunk)
+        for row in chunk:
+            pages.extend(row.errors)
+            if not pages.count:
+                export.write(separator + json.dumps(row.as_json()))
+                separator = ",\n"
+        rows_done += len(chunk)
+        on_progress(rows_done, pages.count)
+    export.write("\n]\n")
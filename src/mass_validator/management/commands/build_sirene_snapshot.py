@@ -0,0 +1,28 @@
+import io
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mass_validator.validator.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Build the local SIRENE snapshot from a StockEtablissement csv file, zipped or not"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path")
+        parser.add_argument("--output", default=settings.SIRENE_SNAPSHOT_PATH)
+
+    def handle(self, csv_path, output, verbosity=0, **kwargs):
+        start = time.monotonic()
+        if zipfile.is_zipfile(csv_path):
+            with zipfile.ZipFile(csv_path) as archive:
+                name = next(name for name in archive.namelist() if name.endswith(".csv"))
+                with io.TextIOWrapper(archive.open(name), encoding="utf-8", newline="") as csv_file:
+                    count = build_snapshot(csv_file, output)
+        else:
+            with open(csv_path, encoding="utf-8", newline="") as csv_file:
+                count = build_snapshot(csv_file, output)
+        print(f"{count} establishments written to {output} in {time.monotonic() - start:.1f}s")
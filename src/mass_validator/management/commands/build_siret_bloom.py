@@ -0,0 +1,36 @@
+import csv
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mass_validator.validator.bloom import build_bloom_filter
+from mass_validator.validator.constants import ACTIVE
+from mass_validator.validator.snapshot import SIRET_COLUMN, STATE_COLUMN
+
+
+class Command(BaseCommand):
+    help = "Build the active sirets bloom filter from the SIRENE snapshot, or from a StockEtablissement csv file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output")
+        parser.add_argument("--csv", dest="csv_path", help="Read a csv file instead of the snapshot")
+        parser.add_argument("--capacity", type=int, default=35_000_000, help="Expected active sirets, csv only")
+        parser.add_argument("--error-rate", type=float, default=0.001)
+
+    def handle(self, output, csv_path=None, capacity=0, error_rate=0.001, verbosity=0, **kwargs):
+        start = time.monotonic()
+        if csv_path:
+            with open(csv_path, encoding="utf-8", newline="") as csv_file:
+                sirets = (line[SIRET_COLUMN] for line in csv.DictReader(csv_file) if line[STATE_COLUMN] == ACTIVE)
+                count = build_bloom_filter(sirets, output, capacity, error_rate)
+        else:
+            conn = sqlite3.connect(f"file:{settings.SIRENE_SNAPSHOT_PATH}?mode=ro", uri=True)
+            try:
+                (capacity,) = conn.execute("SELECT count(*) FROM etablissements WHERE state = ?", [ACTIVE]).fetchone()
+                rows = conn.execute("SELECT siret FROM etablissements WHERE state = ?", [ACTIVE])
+                count = build_bloom_filter((siret for (siret,) in rows), output, max(capacity, 1), error_rate)
+            finally:
+                conn.close()
+        print(f"{count} active sirets written to {output} in {time.monotonic() - start:.1f}s")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mass_validator.validator.search_api import get_client, pool_stats
+
+
+class Command(BaseCommand):
+    def handle(self, verbosity=0, **kwargs):
+        es = get_client()
+        print(es)
+        print(es.ping())
+        print(pool_stats())
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from mass_validator.validator.siret_cache import get_cache
+
+
+class Command(BaseCommand):
+    help = "Display siret status cache stats, optionally flush it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flush", action="store_true", help="Empty both cache tiers and reset counters")
+
+    def handle(self, verbosity=0, flush=False, **kwargs):
+        cache = get_cache()
+        print(cache.stats())
+        if flush:
+            cache.flush()
+            print("Flushed")
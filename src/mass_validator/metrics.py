@@ -0,0 +1,181 @@
+"""
+Prometheus metrics of uploads, celery tasks and siret checks.
+
+Metrics live in the process recording them. Web processes serve theirs on `/metrics`, celery workers on their own
+`METRICS_WORKER_PORT`, each container is a scrape target of its own. Under gunicorn or celery prefork workers,
+`PROMETHEUS_MULTIPROC_DIR` must point to a directory shared by all the processes of the container, emptied before they
+start: each process then writes its values to files, summed at scrape time. Only counters and histograms are used, they
+need no cleanup when a worker dies.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun, worker_init
+from django.conf import settings
+from elasticsearch7 import ConnectionTimeout
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+from .validator.emails import get_email_checker
+
+SIZE_BUCKETS = (10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000, 50_000_000)
+RATE_BUCKETS = (100, 500, 1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000)
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+ES_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# stages whose durations make the rows rate, see `timing`
+ROWS_STAGES = ("from_worksheet", "validate")
+
+CACHE_REPORT = "report"
+CACHE_SIRET = "siret"
+CACHE_EMAIL = "email"
+
+uploads = Counter("mass_validator_uploads", "Uploaded files", ["kind"])
+upload_size = Histogram("mass_validator_upload_size_bytes", "Uploaded files size", ["kind"], buckets=SIZE_BUCKETS)
+stage_duration = Histogram(
+    "mass_validator_stage_duration_seconds", "Upload validation stages duration", ["kind", "stage"]
+)
+rows = Counter("mass_validator_rows", "Rows read and validated", ["kind"])
+rows_rate = Histogram(
+    "mass_validator_rows_per_second", "Rows read and validated per second, by upload", ["kind"], buckets=RATE_BUCKETS
+)
+task_duration = Histogram(
+    "mass_validator_task_duration_seconds", "Celery tasks run time", ["task"], buckets=TASK_BUCKETS
+)
+task_queue_wait = Histogram(
+    "mass_validator_task_queue_wait_seconds",
+    "Celery tasks time from publication to start",
+    ["task"],
+    buckets=TASK_BUCKETS,
+)
+task_failures = Counter("mass_validator_task_failures", "Failed celery tasks", ["task"])
+es_request_duration = Histogram(
+    "mass_validator_elasticsearch_request_seconds", "Elasticsearch msearch round trips", buckets=ES_BUCKETS
+)
+es_siret_duration = Histogram(
+    "mass_validator_elasticsearch_siret_seconds",
+    "Elasticsearch msearch round trips, per searched siret",
+    buckets=ES_BUCKETS,
+)
+es_errors = Counter("mass_validator_elasticsearch_errors", "Failed elasticsearch requests", ["error"])
+cache_lookups = Counter("mass_validator_cache_lookups", "Cache lookups, hit ratio by cache", ["cache", "result"])
+
+
+def observe_upload(kind, size):
+    uploads.labels(kind).inc()
+    upload_size.labels(kind).observe(size)
+
+
+def observe_stages(kind, stages, counts):
+    """Durations in seconds by stage, and counts, of a `StageTimer`"""
+    for stage, seconds in stages.items():
+        stage_duration.labels(kind, stage).observe(seconds)
+
+    rows_count = counts.get("rows", 0) + counts.get("role_rows", 0)
+    if rows_count:
+        rows.labels(kind).inc(rows_count)
+        seconds = sum(stages.get(stage, 0.0) for stage in ROWS_STAGES)
+        if seconds:
+            rows_rate.labels(kind).observe(rows_count / seconds)
+    observe_email_cache()
+
+
+def observe_cache(cache, hits, misses):
+    if hits:
+        cache_lookups.labels(cache, "hit").inc(hits)
+    if misses:
+        cache_lookups.labels(cache, "miss").inc(misses)
+
+
+_email_seen = {"hits": 0, "misses": 0}
+
+
+def observe_email_cache():
+    """The email memo keeps its own counters, lookups since the previous call are added"""
+    stats = get_email_checker().stats()["address"]
+    new = {}
+    for name in ["hits", "misses"]:
+        # counters restart from 0 after `EmailChecker.clear`
+        new[name] = stats[name] - _email_seen[name] if stats[name] >= _email_seen[name] else stats[name]
+        _email_seen[name] = stats[name]
+    observe_cache(CACHE_EMAIL, new["hits"], new["misses"])
+
+
+@contextmanager
+def elasticsearch_request(sirets_count):
+    start = time.perf_counter()
+    try:
+        yield
+    except ConnectionTimeout:
+        es_errors.labels("timeout").inc()
+        raise
+    except Exception:
+        es_errors.labels("error").inc()
+        raise
+    seconds = time.perf_counter() - start
+    es_request_duration.observe(seconds)
+    if sirets_count:
+        es_siret_duration.observe(seconds / sirets_count)
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    # missing from eager tasks, which are not published
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        task_queue_wait.labels(task.name).observe(max(time.time() - published_at, 0.0))
+
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        task_duration.labels(task.name).observe(time.perf_counter() - started)
+
+
+@task_failure.connect
+def count_task_failure(sender=None, **kwargs):
+    task_failures.labels(sender.name).inc()
+
+
+def registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def exposition():
+    return generate_latest(registry())
+
+
+@worker_init.connect
+def serve_worker_metrics(**kwargs):
+    """
+    Metrics endpoint of a celery worker, on `METRICS_WORKER_PORT` unless 0.
+
+    Served by the main worker process, before the pool processes are forked: their values are read from
+    `PROMETHEUS_MULTIPROC_DIR`.
+    """
+    if settings.METRICS_WORKER_PORT:
+        start_http_server(settings.METRICS_WORKER_PORT, registry=registry())
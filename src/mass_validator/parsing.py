@@ -0,0 +1,212 @@
+"""
+Uploaded files loading and checks, shared by views and tasks.
+"""
+
+import zlib
+from xml.etree.ElementTree import ParseError
+from zipfile import BadZipFile
+
+from django.conf import settings
+
+from .large_files import is_large_file
+from .timing import NO_TIMER
+from .validator.constants import ETABLISSEMENTS_CREATE_FIELDS, MAX_ETAB_ROWS, ROLES_FIELDS
+from .validator.row_models import EtabCreateRows, RoleRows
+from .validator.sources import open_workbook
+from .validator.xlsx_reader import TooManyRowsException
+
+
+class FileReadingException(Exception):
+    pass
+
+
+class TabException(Exception):
+    pass
+
+
+class InvalidHeaderException(Exception):
+    pass
+
+
+# raised by malformed contents while rows are read, after the file was opened: undecodable csv, truncated or corrupted
+# sheet xml in a zip archive. `TooManyRowsException` is raised apart, by rows past the sheet `row_limit`
+ROW_READING_ERRORS = (UnicodeDecodeError, ParseError, zlib.error, EOFError, BadZipFile)
+
+
+def load_file(file):
+    """Open an uploaded xlsx, ods or csv file, see `open_workbook`"""
+    try:
+        return open_workbook(file)
+    except (ValueError, ParseError):
+        raise FileReadingException
+
+
+def limit_rows(worksheet, max_rows):
+    """
+    Reject a sheet announcing far more rows than `max_rows` before reading it, and bound its reading likewise.
+
+    Rows count the header and blank formatted rows, `UPLOAD_DECLARED_ROWS_MARGIN` rows are tolerated. Sheets not
+    announcing their rows raise `TooManyRowsException` while read, see `StreamingWorksheet.row_limit`.
+    """
+    row_limit = max_rows + 1 + settings.UPLOAD_DECLARED_ROWS_MARGIN
+    declared_rows = worksheet.declared_rows
+    if declared_rows is not None and declared_rows > row_limit:
+        raise TooManyRowsException
+    worksheet.row_limit = row_limit
+
+
+def limit_workbook_rows(wb, max_rows):
+    """`limit_rows` of every tab: `max_rows` for the first one, `UPLOAD_MAX_ROLES_PER_ETAB` times more for the others"""
+    limit_rows(wb.worksheets[0], max_rows)
+    for worksheet in wb.worksheets[1:]:
+        limit_rows(worksheet, max_rows * settings.UPLOAD_MAX_ROLES_PER_ETAB)
+
+
+def load_create_xlsx(file, max_rows=None):
+    """:param max_rows: rows limit of the first tab, `LARGE_FILE_MAX_ROWS` by default"""
+    wb = load_file(file)
+    sheetnames = wb.sheetnames
+    if len(sheetnames) != 2:
+        raise TabException
+    if sheetnames[0] != "etablissements":
+        raise TabException
+    if sheetnames[1] != "roles":
+        raise TabException
+    limit_workbook_rows(wb, max_rows or settings.LARGE_FILE_MAX_ROWS)
+    return wb
+
+
+def load_update_xlsx(file, max_rows=None):
+    """:param max_rows: rows limit, `LARGE_FILE_MAX_ROWS` by default"""
+    wb = load_file(file)
+    sheetnames = wb.sheetnames
+
+    if len(sheetnames) != 1:
+        raise TabException
+    if sheetnames[0] != "etablissements":
+        raise TabException
+    limit_workbook_rows(wb, max_rows or settings.LARGE_FILE_MAX_ROWS)
+
+    return wb
+
+
+def first_row(worksheet, max_col):
+    return next(worksheet.iter_rows(max_row=1, max_col=max_col, values_only=True), ())
+
+
+def validate_header(first_row, expected_header):
+    """Validate first worksheet row matches `expected_header`"""
+
+    header = list(first_row)
+
+    if header != expected_header:
+        raise InvalidHeaderException
+
+
+def check_creation_file(file, connected=False, timer=NO_TIMER):
+    """
+    Whole creation file validation: tabs, headers, rows and cross tabs checks.
+
+    Files of connected users above `MAX_ETAB_ROWS` rows are left to the large-file mode, which checks the rows limit.
+    Each step is timed by `timer`, see `timing`.
+
+    :return: json serializable report, with the rows to check against the registry when the file is valid
+    """
+    report = {
+        "errors": [],
+        "parse_error": False,
+        "enough_rows_error": False,
+        "too_many_rows_error": False,
+        "max_rows": settings.LARGE_FILE_MAX_ROWS if connected else MAX_ETAB_ROWS,
+        "large_file": False,
+        "to_check": [],
+    }
+
+    try:
+        with timer.stage("load_workbook"):
+            wb = load_create_xlsx(file, report["max_rows"])
+    except (BadZipFile, KeyError, TabException, FileReadingException):
+        report["parse_error"] = True
+        return report
+    except TooManyRowsException:
+        report["too_many_rows_error"] = True
+        return report
+
+    try:
+        return check_creation_rows(wb, report, connected, timer)
+    except ROW_READING_ERRORS:
+        report["parse_error"] = True
+        return report
+    except TooManyRowsException:
+        report["too_many_rows_error"] = True
+        return report
+
+
+def check_creation_rows(wb, report, connected, timer):
+    """Headers, rows and cross tabs checks of `check_creation_file`, filling in `report`"""
+    ws_etablissements = wb.worksheets[0]
+
+    ws_roles = wb.worksheets[1]
+
+    # performs header validation, exits if it fails
+    try:
+        with timer.stage("validate_header"):
+            etab_first_row = first_row(ws_etablissements, len(ETABLISSEMENTS_CREATE_FIELDS))
+            role_first_row = first_row(ws_roles, len(ROLES_FIELDS))
+            validate_header(etab_first_row, ETABLISSEMENTS_CREATE_FIELDS)
+            validate_header(role_first_row, ROLES_FIELDS)
+    except InvalidHeaderException:
+        report["parse_error"] = True
+        return report
+
+    if connected:
+        with timer.stage("count_rows"):
+            report["large_file"] = is_large_file(ws_etablissements, EtabCreateRows)
+        if report["large_file"]:
+            return report
+
+    with timer.stage("from_worksheet"):
+        etab_rows = EtabCreateRows.from_worksheet(ws_etablissements)
+    timer.count(rows=len(etab_rows.rows))
+
+    with timer.stage("validate"):
+        etab_rows.validate()
+
+    # exits if customer is too lazy
+    if not etab_rows.has_enough_rows:
+        report["enough_rows_error"] = True
+        return report
+
+    # exits if too many rows
+    if etab_rows.has_too_many_rows:
+        report["too_many_rows_error"] = True
+        return report
+
+    with timer.stage("from_worksheet"):
+        role_rows = RoleRows.from_worksheet(ws_roles)
+    timer.count(role_rows=len(role_rows.rows))
+
+    with timer.stage("validate"):
+        role_rows.validate(etab_rows.sirets())
+
+    # main validation
+    errors = []
+    if not etab_rows.is_valid:
+        errors.extend(etab_rows.get_errors())
+    if not role_rows.is_valid:
+        errors.extend(role_rows.get_errors())
+
+    # This validation can occur when both tabs are already validated
+    if etab_rows.is_valid and role_rows.is_valid:
+        with timer.stage("cross_tab"):
+            etab_rows.validate_have_admin(role_rows.admin_sirets())
+        if not etab_rows.is_valid:
+            errors.extend(etab_rows.get_errors())
+
+    report["errors"] = [error.as_dict() for error in errors]
+    timer.count(errors=len(errors))
+
+    # only performs api checks if everything else passes
+    if not errors:
+        report["to_check"] = [{"siret": row.siret, "row_number": row.index} for row in etab_rows]
+    return report
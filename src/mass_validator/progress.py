@@ -0,0 +1,108 @@
+import time
+
+from celery import states
+from django.conf import settings
+
+from core.celery_app import app
+
+STATE_PROGRESS = "PROGRESS"
+
+
+class ProgressReporter:
+    """
+    Coalesced progress reporting for long-running tasks.
+
+    State is written at most once per `PROGRESS_MIN_INTERVAL` seconds, unless progress moved by at least
+    `PROGRESS_MIN_DELTA` percents. Each write is a single `update_state` call, pipelined by the redis result backend,
+    carrying everything the polling view displays.
+    """
+
+    def __init__(self, task, rows_total, clock=time.monotonic):
+        self.task = task
+        self.rows_total = rows_total
+        self.rows_done = 0
+        self.errors = 0
+        self.clock = clock
+        self.started_at = clock()
+        self.last_write_at = None
+        self.last_progress = 0
+        self.writes = 0
+
+    @property
+    def progress(self):
+        if self.rows_total is None:  # rows not counted yet
+            return 0
+        if not self.rows_total:
+            return 100
+        return round(100 * self.rows_done / self.rows_total)
+
+    @property
+    def eta(self):
+        """Remaining seconds estimated from the rows throughput so far"""
+        if not self.rows_done:
+            return None
+        elapsed = self.clock() - self.started_at
+        return round(elapsed / self.rows_done * (self.rows_total - self.rows_done), 1)
+
+    def meta(self):
+        return {
+            "progress": self.progress,
+            "rows_done": self.rows_done,
+            "rows_total": self.rows_total,
+            "errors": self.errors,
+            "eta": self.eta,
+        }
+
+    def update(self, rows_done, errors=0):
+        self.rows_done = rows_done
+        self.errors = errors
+        now = self.clock()
+        due = self.last_write_at is None or now - self.last_write_at >= settings.PROGRESS_MIN_INTERVAL
+        moved = self.progress - self.last_progress >= settings.PROGRESS_MIN_DELTA
+        if due or moved:
+            self.write(STATE_PROGRESS)
+
+    def write(self, state):
+        # tasks called as plain functions have no state to write to
+        if self.task.request.id:
+            self.task.update_state(state=state, meta=self.meta())
+        self.last_write_at = self.clock()
+        self.last_progress = self.progress
+        self.writes += 1
+
+
+def shards_progress(shard_ids, shard_sizes):
+    """Aggregated progress meta of a sharded siret check, rows and errors count distinct sirets like `check_sirets`"""
+    backend = app.backend
+    if hasattr(backend, "mget"):
+        # a single round trip for all the shards
+        values = backend.mget([backend.get_key_for_task(shard_id) for shard_id in shard_ids])
+        metas = [backend.decode_result(value) if value else None for value in values]
+    else:
+        metas = [backend.get_task_meta(shard_id) for shard_id in shard_ids]
+
+    rows_total = sum(shard_sizes)
+    rows_done = 0
+    errors = 0
+    eta = None
+    for meta, size in zip(metas, shard_sizes):
+        if not meta:
+            continue
+        result = meta.get("result")
+        if meta["status"] in states.READY_STATES:
+            rows_done += size
+            # results hold one error per row, progress counts sirets
+            errors += len({el["siret"] for el in result}) if isinstance(result, list) else 0
+        elif isinstance(result, dict):
+            rows_done += result.get("rows_done", 0)
+            errors += result.get("errors", 0)
+            if result.get("eta") is not None:
+                # shards run side by side, the slowest one gives the eta
+                eta = max(eta or 0, result["eta"])
+    return {
+        "progress": round(100 * rows_done / rows_total),
+        "rows_done": rows_done,
+        "rows_total": rows_total,
+        "errors": errors,
+        "eta": eta,
+    }
@@ -0,0 +1,27 @@
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_report_cache():
+    return caches[settings.VALIDATION_REPORT_CACHE]
+
+
+def report_key(kind, digest):
+    return f"validation_report:{kind}:{digest}"
+
+
+def get_report(kind, digest):
+    if not settings.VALIDATION_REPORT_CACHE_TTL or not digest:
+        return None
+    return get_report_cache().get(report_key(kind, digest))
+
+
+def set_report(kind, digest, report):
+    """Cache a validation outcome for `VALIDATION_REPORT_CACHE_TTL` seconds, unless it is too big"""
+    if not settings.VALIDATION_REPORT_CACHE_TTL or not digest:
+        return
+    if len(pickle.dumps(report)) > settings.VALIDATION_REPORT_CACHE_MAX_SIZE:
+        return
+    get_report_cache().set(report_key(kind, digest), report, settings.VALIDATION_REPORT_CACHE_TTL)
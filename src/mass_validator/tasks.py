@@ -1,7 +1,46 @@
-from celery import current_task
+import io
+from itertools import chain
+
+from celery import chord, current_task, group, states
+from celery.utils import uuid
+from django.conf import settings
 
 from core.celery_app import app
-from mass_validator.validator.search_api import check_siret
+from mass_validator.large_files import (
+    KIND_CREATE,
+    ROWS_CLASSES,
+    ErrorPages,
+    count_file_rows,
+    delete_upload,
+    open_upload,
+    save_export,
+    validate_create_file,
+    validate_update_file,
+)
+from mass_validator.parsing import TooManyRowsException, check_creation_file, limit_workbook_rows
+from mass_validator.progress import STATE_PROGRESS, ProgressReporter
+from mass_validator.timing import stage_timer
+from mass_validator.validator.async_search import check_sirets_async
+from mass_validator.validator.helpers import chunks, siret_is_well_formed
+from mass_validator.validator.search_api import get_active_sirets
+from mass_validator.validator.sources import open_workbook
+
+ENGINE_SYNC = "sync"
+ENGINE_ASYNC = "async"
+
+
+def check_sirets_sync(data, on_progress):
+    """Sirets are sent by batches of `SIRET_CHECK_CHUNK_SIZE`, one api round trip per batch"""
+    errors = []
+    done = 0
+
+    for chunk in chunks(data, settings.SIRET_CHECK_CHUNK_SIZE):
+        active_sirets = get_active_sirets([el["siret"] for el in chunk])
+        errors.extend([el for el in chunk if el["siret"] not in active_sirets])
+
+        done += len(chunk)
+        on_progress(done, len(errors))
+    return errors
 
 
 @app.task
@@ -9,18 +48,173 @@ def check_sirets(data):
     """
     Pollable task to check siret existence and validity on api.
 
-    :param data: {"siret": row.siret, "row_number": row.index}
+    The engine is picked by `SIRET_CHECK_ENGINE`: sequential batches, or concurrent batches on an event loop.
+    Malformed sirets are reported without being sent to the api.
+
+    :param data: {"siret": row.siret, "row_numbers": [row.index, ...]}, "row_number" is accepted for a single row
+    :return: one {"siret": siret, "row_number": row_number} error per row
     """
-    errors = []
-    count = len(data)
+    reporter = ProgressReporter(current_task, len(data))
 
-    for idx, el in enumerate(data):
-        siret_exists = check_siret(el["siret"])
+    malformed = [el for el in data if not siret_is_well_formed(el["siret"])]
+    to_check = [el for el in data if siret_is_well_formed(el["siret"])]
+    reporter.update(len(malformed), len(malformed))
 
-        current_task.update_state(state="PROGRESS", meta={"progress": round(100 * ((idx + 1) / count))})
+    def on_progress(done, errors):
+        reporter.update(len(malformed) + done, len(malformed) + errors)
 
-        if not siret_exists:
-            errors.append(el)
-    current_task.update_state(state="DONE", meta={"progress": 100})
+    if settings.SIRET_CHECK_ENGINE == ENGINE_ASYNC:
+        errors = check_sirets_async(to_check, on_progress)
+    else:
+        errors = check_sirets_sync(to_check, on_progress)
 
-    return errors
+    errors = malformed + errors
+    reporter.rows_done = len(data)
+    # sirets in error, the unit of the progress all along
+    reporter.errors = len(errors)
+    reporter.write("DONE")
+
+    return expand_rows(errors)
+
+
+def group_rows(data):
+    """One entry per siret, holding all the row numbers it appears on"""
+    grouped = {}
+    for el in data:
+        grouped.setdefault(el["siret"], []).append(el["row_number"])
+    return [{"siret": siret, "row_numbers": row_numbers} for siret, row_numbers in grouped.items()]
+
+
+def expand_rows(errors):
+    """Back to one error per row, in rows order"""
+    expanded = []
+    for el in errors:
+        if "row_numbers" in el:
+            expanded.extend({"siret": el["siret"], "row_number": row_number} for row_number in el["row_numbers"])
+        else:
+            expanded.append(el)
+    return sorted(expanded, key=lambda el: el.get("row_number") or 0)
+
+
+@app.task
+def merge_siret_errors(results):
+    """Chord callback gathering the errors of each shard, in rows order"""
+    return expand_rows(chain.from_iterable(results))
+
+
+def dispatch_check_sirets(data):
+    """
+    Launch the siret checks and return the pollable task id.
+
+    Sirets are deduplicated first, each one is checked once whatever the number of rows it appears on.
+    Above `SIRET_CHECK_SHARD_SIZE` rows, checks are split in shards run by several workers and merged by a chord
+    callback. The callback id is returned, its state holds the shards ids until they are merged so that
+    their progress can be aggregated.
+    """
+    data = group_rows(data)
+    shard_size = settings.SIRET_CHECK_SHARD_SIZE
+    if len(data) <= shard_size:
+        return check_sirets.delay(data).id
+
+    shards = list(chunks(data, shard_size))
+    shard_ids = [uuid() for _ in shards]
+    callback_id = uuid()
+
+    app.backend.store_result(
+        callback_id,
+        {"progress": 0, "rows_total": len(data), "shards": shard_ids, "shard_sizes": [len(shard) for shard in shards]},
+        states.STARTED,
+    )
+    header = group(check_sirets.s(shard).set(task_id=shard_id) for shard, shard_id in zip(shards, shard_ids))
+    chord(header)(merge_siret_errors.s().set(task_id=callback_id))
+
+    return callback_id
+
+
+@app.task
+def validate_large_file(kind, key):
+    """
+    Pollable task validating a file stored by `save_upload`, see `large_files`.
+
+    Rows are counted first, their total is reported along with the progress. The upload is removed once validated.
+    Creation files without errors go on with a siret check, whose task id is returned.
+
+    :return: {"errors_count", "pages", "siret_task_id", "export", "too_many_rows_error", "max_rows"}
+    """
+    task_id = current_task.request.id
+    reporter = ProgressReporter(current_task, None)
+    pages = ErrorPages(task_id)
+    siret_task_id = None
+    export = None
+    too_many_rows_error = False
+
+    try:
+        workbook = open_workbook(open_upload(key))
+        limit_workbook_rows(workbook, settings.LARGE_FILE_MAX_ROWS)
+        rows_count, reporter.rows_total = count_file_rows(workbook.worksheets, ROWS_CLASSES[kind])
+        if rows_count > settings.LARGE_FILE_MAX_ROWS:
+            raise TooManyRowsException
+        reporter.write(STATE_PROGRESS)
+
+        if kind == KIND_CREATE:
+            to_check = validate_create_file(workbook, pages, reporter.update)
+            if to_check:
+                siret_task_id = dispatch_check_sirets(to_check)
+        else:
+            export = io.StringIO()
+            validate_update_file(workbook, pages, reporter.update, export)
+    except TooManyRowsException:
+        too_many_rows_error = True
+    finally:
+        delete_upload(key)
+    pages.flush()
+    has_export = export is not None and not pages.count and not too_many_rows_error
+    if has_export:
+        save_export(task_id, export.getvalue())
+
+    reporter.rows_done = reporter.rows_total or 0
+    reporter.errors = pages.count
+    reporter.write("DONE")
+
+    return {
+        "errors_count": pages.count,
+        "pages": pages.pages,
+        "siret_task_id": siret_task_id,
+        "export": has_export,
+        "too_many_rows_error": too_many_rows_error,
+        "max_rows": settings.LARGE_FILE_MAX_ROWS,
+    }
+
+
+@app.task
+def validate_creation_upload(key, connected=False):
+    """
+    Pollable task validating a creation file stored by `save_upload`, off the web workers.
+
+    Files are parsed and checked, tabs, headers, rows and cross tabs, then valid files go on with a siret check.
+    Large files of connected users are handed over to `validate_large_file`.
+
+    :return: the report of `check_creation_file`, with the follow-up siret check or large file task id
+    """
+    timer = stage_timer(KIND_CREATE)
+    timer.count(task_id=current_task.request.id if current_task else None)
+    try:
+        report = check_creation_file(open_upload(key), connected, timer)
+    except Exception:
+        delete_upload(key)
+        raise
+
+    large_file = report.pop("large_file")
+    to_check = report.pop("to_check")
+    report["large_file_task_id"] = None
+    report["siret_task_id"] = None
+
+    with timer.stage("dispatch"):
+        if large_file:
+            report["large_file_task_id"] = validate_large_file.delay(KIND_CREATE, key).id
+        else:
+            delete_upload(key)
+            if to_check:
+                report["siret_task_id"] = dispatch_check_sirets(to_check)
+    timer.log()
+    return report
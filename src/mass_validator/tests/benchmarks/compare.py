@@ -0,0 +1,63 @@
+"""
+Compare two benchmark results files, stage by stage.
+
+    python -m mass_validator.tests.benchmarks.compare before.json after.json
+
+Ratios are after / before: below 1 is faster, or lighter.
+"""
+
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def ratio(after, before):
+    if not before or after is None:
+        return None
+    return after / before
+
+
+def compare(before, after):
+    """One line per stage present in both reports: (scenario, stage, seconds ratio, peak memory ratio)"""
+    lines = []
+    for name, scenario in sorted(after["scenarios"].items()):
+        previous = before["scenarios"].get(name)
+        if previous is None:
+            continue
+        for stage, measures in scenario["stages"].items():
+            previous_measures = previous["stages"].get(stage)
+            if previous_measures is None:
+                continue
+            lines.append(
+                (
+                    name,
+                    stage,
+                    ratio(measures["seconds"], previous_measures["seconds"]),
+                    ratio(measures["peak_memory_kb"], previous_measures["peak_memory_kb"]),
+                )
+            )
+    return lines
+
+
+def format_ratio(value):
+    return "-" if value is None else f"{value:.2f}x"
+
+
+def main(argv):
+    if len(argv) != 2:
+        print(__doc__)
+        return 1
+    before, after = load(argv[0]), load(argv[1])
+    print(f"{before['commit'] or '?'} -> {after['commit'] or '?'}")
+    print(f"{'scenario':<24} {'stage':<22} {'time':>8} {'memory':>8}")
+    for name, stage, seconds, memory in compare(before, after):
+        print(f"{name:<24} {stage:<22} {format_ratio(seconds):>8} {format_ratio(memory):>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,51 @@
+import datetime
+import json
+import platform
+import subprocess
+
+import pytest
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request):
+    """Results of every scenario, by scenario name, written as json once all benchmarks ran"""
+    results = {}
+    yield results
+    if not results:
+        return
+
+    report = {
+        "commit": current_commit(),
+        "date": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "scenarios": results,
+    }
+    with open(request.config.getoption("--benchmark-output"), "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+@pytest.fixture()
+def sirene_stand_in(tmp_path, settings):
+    """
+    Sirets are checked against a local SIRENE snapshot instead of elasticsearch, call it with the sirets to list as
+    active.
+    """
+    from mass_validator.validator.snapshot import build_snapshot
+
+    from .workbooks import sirene_stock
+
+    def build(sirets):
+        path = tmp_path / "snapshot.sqlite3"
+        build_snapshot(sirene_stock(sirets), path)
+        settings.SIRET_CHECK_BACKEND = "snapshot"
+        settings.SIRENE_SNAPSHOT_ES_FALLBACK = False
+        settings.SIRENE_SNAPSHOT_PATH = str(path)
+
+    return build
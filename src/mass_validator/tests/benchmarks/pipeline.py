@@ -0,0 +1,96 @@
+"""
+Validation pipeline stages, as run by the views and tasks, each one measured by a `measure(stage)` context manager.
+
+Rows limits are left out: rows are validated with `validate_rows`, as in the large-file mode, and sirets are checked
+whatever the errors, so that every stage runs at every size.
+"""
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from ...parsing import load_create_xlsx, load_update_xlsx
+from ...tasks import check_sirets
+from ...validator.emails import get_email_checker
+from ...validator.row_models import EtabCreateRows, EtabUpdateRows, RoleRows
+
+
+def run_creation(file, measure):
+    with measure("load_create_xlsx"):
+        wb = load_create_xlsx(file)
+    with measure("from_worksheet"):
+        etab_rows = EtabCreateRows.from_worksheet(wb.worksheets[0])
+        role_rows = RoleRows.from_worksheet(wb.worksheets[1])
+    with measure("validate"):
+        EtabCreateRows.validate_rows(etab_rows.rows)
+        role_rows.validate(etab_rows.sirets())
+    with measure("validate_have_admin"):
+        etab_rows.validate_have_admin(role_rows.admin_sirets())
+    with measure("check_sirets"):
+        check_sirets([{"siret": row.siret, "row_number": row.index} for row in etab_rows])
+
+
+def run_update(file, measure):
+    with measure("load_update_xlsx"):
+        wb = load_update_xlsx(file)
+    with measure("from_worksheet"):
+        etab_rows = EtabUpdateRows.from_worksheet(wb.worksheets[0])
+    with measure("validate"):
+        EtabUpdateRows.validate_rows(etab_rows.rows)
+    with measure("as_json"):
+        etab_rows.as_json()
+    with measure("check_sirets"):
+        check_sirets([{"siret": row.siret, "row_number": row.index} for row in etab_rows])
+
+
+class Timer:
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        yield
+        self.seconds[stage] = time.perf_counter() - start
+
+
+class MemoryTracer:
+    """Peak of memory allocated by python during each stage, data kept from previous stages included"""
+
+    def __init__(self):
+        self.peaks = {}
+
+    @contextmanager
+    def __call__(self, stage):
+        tracemalloc.reset_peak()
+        yield
+        self.peaks[stage] = tracemalloc.get_traced_memory()[1]
+
+
+def measure_pipeline(run, make_file, rows):
+    """
+    Run the pipeline twice, timed then traced: tracemalloc slows allocations down too much for both at once.
+    Both runs start with cold email caches.
+
+    :return: {stage: {"seconds", "rows_per_sec", "peak_memory_kb"}}
+    """
+    timer = Timer()
+    get_email_checker().clear()
+    run(make_file(), timer)
+
+    tracer = MemoryTracer()
+    get_email_checker().clear()
+    tracemalloc.start()
+    try:
+        run(make_file(), tracer)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        stage: {
+            "seconds": round(seconds, 4),
+            "rows_per_sec": round(rows / seconds) if seconds else None,
+            "peak_memory_kb": round(tracer.peaks[stage] / 1024),
+        }
+        for stage, seconds in timer.seconds.items()
+    }
@@ -0,0 +1,78 @@
+"""
+Whole validation pipeline, from xlsx upload to sirets check, on synthetic files of 10 to 100k rows.
+
+Run with `pytest mass_validator/tests/benchmarks --benchmarks --benchmark-output=before.json`, then compare two runs
+with `python -m mass_validator.tests.benchmarks.compare before.json after.json`.
+"""
+
+import io
+from functools import cache
+
+import pytest
+
+from mass_validator.validator.columnar import ENGINE_COLUMNAR, ENGINE_ROWS
+
+from .pipeline import measure_pipeline, run_creation, run_update
+from .workbooks import creation_workbook, update_workbook
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = [10, 1_000, 10_000, 100_000]
+ENGINES = [ENGINE_ROWS, ENGINE_COLUMNAR]
+
+ERROR_RATE = 0.02
+DUPLICATE_RATE = 0.01
+ROLES_PER_ETAB = 2
+
+
+@cache
+def creation_file(rows):
+    """Generated once per size, shared by engines"""
+    file, sirets = creation_workbook(
+        rows, error_rate=ERROR_RATE, duplicate_rate=DUPLICATE_RATE, roles_per_etab=ROLES_PER_ETAB
+    )
+    return file.getvalue(), sirets
+
+
+@cache
+def update_file(rows):
+    file, sirets = update_workbook(rows, error_rate=ERROR_RATE)
+    return file.getvalue(), sirets
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("rows", SIZES)
+def test_creation_pipeline(rows, engine, settings, sirene_stand_in, benchmark_results):
+    content, sirets = creation_file(rows)
+    sirene_stand_in(sirets)
+    settings.VALIDATION_ENGINE = engine
+
+    stages = measure_pipeline(run_creation, lambda: io.BytesIO(content), rows)
+
+    benchmark_results[f"create-{engine}-{rows}"] = {
+        "file": "create",
+        "engine": engine,
+        "rows": rows,
+        "roles_per_etab": ROLES_PER_ETAB,
+        "error_rate": ERROR_RATE,
+        "duplicate_rate": DUPLICATE_RATE,
+        "stages": stages,
+    }
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("rows", SIZES)
+def test_update_pipeline(rows, engine, settings, sirene_stand_in, benchmark_results):
+    content, sirets = update_file(rows)
+    sirene_stand_in(sirets)
+    settings.VALIDATION_ENGINE = engine
+
+    stages = measure_pipeline(run_update, lambda: io.BytesIO(content), rows)
+
+    benchmark_results[f"update-{engine}-{rows}"] = {
+        "file": "update",
+        "engine": engine,
+        "rows": rows,
+        "error_rate": ERROR_RATE,
+        "stages": stages,
+    }
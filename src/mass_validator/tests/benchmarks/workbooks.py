@@ -0,0 +1,145 @@
+"""
+Deterministic synthetic workbooks, laid out like the import templates.
+
+Same parameters and seed, same bytes: benchmarks compare commits on identical inputs.
+"""
+
+import csv
+import io
+import random
+
+from openpyxl import Workbook
+
+from ...validator.constants import (
+    COLLECTOR_TYPES,
+    ETABLISSEMENTS_CREATE_FIELDS,
+    ETABLISSEMENTS_UPDATE_FIELDS,
+    ROLES_FIELDS,
+)
+from ...validator.helpers import luhn_checksum_is_valid
+
+# one kind of error per invalid row, in turn
+ERROR_KINDS = ["siret", "companyTypes", "collectorTypes", "contactPhone", "contactEmail"]
+
+
+def make_siret(rng):
+    """A siret passing the Luhn checksum, outside La Poste and test ranges"""
+    while True:
+        digits = f"{rng.randint(1, 9)}{rng.randint(0, 10**12 - 1):012d}"
+        for last in "0123456789":
+            if luhn_checksum_is_valid(digits + last):
+                siret = digits + last
+                break
+        if not siret.startswith(("356000000", "000000")):
+            return siret
+
+
+def make_sirets(rows, seed):
+    rng = random.Random(seed)
+    sirets = set()
+    while len(sirets) < rows:
+        sirets.add(make_siret(rng))
+    return sorted(sirets)
+
+
+def etab_row(i, siret, rng, error_kind=None):
+    company_types = "PRODUCER,COLLECTOR" if i % 3 else "PRODUCER"
+    collector_types = rng.choice(COLLECTOR_TYPES) if i % 3 else None
+    row = {
+        "siret": siret,
+        "gerepId": None,
+        "companyTypes": company_types,
+        "collectorTypes": collector_types,
+        "wasteProcessorTypes": None,
+        "wasteVehiclesTypes": None,
+        "givenName": f"Établissement {i}",
+        "contactEmail": f"contact{i % 500}@entreprise{i % 50}.fr",
+        "contactPhone": f"06{rng.randint(0, 10**8 - 1):08d}",
+        "contact": "Jean Dupont",
+        "website": None,
+    }
+    if error_kind == "siret":
+        row["siret"] = siret[:-1]
+    elif error_kind == "companyTypes":
+        row["companyTypes"] = "PRODUCER,PLOP"
+    elif error_kind == "collectorTypes":
+        row["companyTypes"] = "PRODUCER"
+        row["collectorTypes"] = "DANGEROUS_WASTES"
+    elif error_kind == "contactPhone":
+        row["contactPhone"] = "12 34"
+    elif error_kind == "contactEmail":
+        row["contactEmail"] = "contact@"
+    return row
+
+
+def error_rows(rows, error_rate, rng):
+    """{row position: error kind} for `error_rate` of `rows`"""
+    invalid = rng.sample(range(rows), round(rows * error_rate))
+    return {position: ERROR_KINDS[n % len(ERROR_KINDS)] for n, position in enumerate(sorted(invalid))}
+
+
+def to_bytes(workbook):
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def creation_workbook(rows, error_rate=0.0, duplicate_rate=0.0, roles_per_etab=1, seed=0):
+    """
+    Creation file of `rows` establishments, each one having `roles_per_etab` roles, the first one being ADMIN.
+
+    :param error_rate: share of establishments with one invalid field
+    :param duplicate_rate: share of roles repeated at the end of the roles tab
+    :return: (xlsx file, sirets)
+    """
+    rng = random.Random(seed)
+    sirets = make_sirets(rows, seed)
+    errors = error_rows(rows, error_rate, rng)
+
+    wb = Workbook(write_only=True)
+    etablissements = wb.create_sheet("etablissements")
+    etablissements.append(ETABLISSEMENTS_CREATE_FIELDS)
+    for i, siret in enumerate(sirets):
+        row = etab_row(i, siret, rng, errors.get(i))
+        etablissements.append([row[field] for field in ETABLISSEMENTS_CREATE_FIELDS])
+
+    roles = wb.create_sheet("roles")
+    roles.append(ROLES_FIELDS)
+    role_rows = []
+    for i, siret in enumerate(sirets):
+        for n in range(roles_per_etab):
+            email = f"user{(i * roles_per_etab + n) % 2000}@entreprise{i % 50}.fr"
+            role_rows.append([siret, email, "MEMBER" if n else "ADMIN"])
+    duplicates = rng.sample(role_rows, round(len(role_rows) * duplicate_rate))
+    for row in role_rows + duplicates:
+        roles.append(row)
+
+    return to_bytes(wb), sirets
+
+
+def update_workbook(rows, error_rate=0.0, seed=0):
+    """Update file of `rows` establishments, see `creation_workbook`. Returns (xlsx file, sirets)"""
+    rng = random.Random(seed)
+    sirets = make_sirets(rows, seed)
+    errors = error_rows(rows, error_rate, rng)
+
+    wb = Workbook(write_only=True)
+    etablissements = wb.create_sheet("etablissements")
+    etablissements.append(ETABLISSEMENTS_UPDATE_FIELDS)
+    for i, siret in enumerate(sirets):
+        row = etab_row(i, siret, rng, errors.get(i))
+        etablissements.append([row[field] for field in ETABLISSEMENTS_UPDATE_FIELDS])
+
+    return to_bytes(wb), sirets
+
+
+def sirene_stock(sirets):
+    """SIRENE StockEtablissement csv listing `sirets` as active, to build a snapshot from"""
+    content = io.StringIO()
+    writer = csv.writer(content)
+    writer.writerow(["siren", "nic", "siret", "statutDiffusionEtablissement", "etatAdministratifEtablissement"])
+    for siret in sirets:
+        writer.writerow([siret[:9], siret[9:], siret, "O", "A"])
+    content.seek(0)
+    return content
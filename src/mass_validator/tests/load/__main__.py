@@ -0,0 +1,103 @@
+"""
+Load harness, run from src/:
+
+    python -m mass_validator.tests.load run --uploads 50 --concurrency 10 --workers 4 --es-latency 0.05
+
+runs the application, a celery worker and a fake elasticsearch in this process. To size a real deployment, serve the
+fake elasticsearch, point gunicorn and celery at it, then drive them with `--url`:
+
+    python -m mass_validator.tests.load fake-es --port 9200 --latency 0.05 --error-rate 0.01
+    python -m mass_validator.tests.load run --url http://localhost:8000 --uploads 200 --concurrency 40
+
+Settings default to `core.settings.tests`; with `--url`, use the server settings, the captcha depends on `SECRET_KEY`.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m mass_validator.tests.load", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name in ["run", "fake-es"]:
+        command = commands.add_parser(name)
+        command.add_argument("--latency", "--es-latency", type=float, default=0.0, help="elasticsearch latency, s")
+        command.add_argument("--jitter", "--es-jitter", type=float, default=0.0, help="added random latency, s")
+        command.add_argument("--error-rate", "--es-error-rate", type=float, default=0.0, help="share of 503 answers")
+        command.add_argument("--seed", type=int, default=0)
+
+    fake_es = commands.choices["fake-es"]
+    fake_es.add_argument("--host", default="127.0.0.1")
+    fake_es.add_argument("--port", type=int, default=9200)
+
+    run = commands.choices["run"]
+    run.add_argument("--url", help="application to load, a local one is started if missing")
+    run.add_argument("--workers", type=int, default=2, help="celery worker threads of the local application")
+    run.add_argument("--broker", default="memory://", help="celery broker of the local application")
+    run.add_argument("--uploads", type=int, default=20)
+    run.add_argument("--concurrency", type=int, default=5, help="simultaneous sessions")
+    run.add_argument("--rows", type=int, default=100, help="establishments per file")
+    run.add_argument("--roles-per-etab", type=int, default=2)
+    run.add_argument("--update-share", type=float, default=0.5, help="share of update files")
+    run.add_argument("--file-error-rate", type=float, default=0.0, help="share of invalid rows")
+    run.add_argument("--poll-interval", type=float, default=0.5)
+    run.add_argument("--output", help="json report file")
+    return parser.parse_args(argv)
+
+
+def print_report(report):
+    print(f"{'endpoint':<22} {'count':>6} {'failed':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for section in ["endpoints", "tasks"]:
+        for name, stats in report[section].items():
+            values = [f"{stats[p]:>9}" if stats[p] is not None else f"{'-':>9}" for p in ["p50", "p95", "p99"]]
+            print(f"{name:<22} {stats['count']:>6} {stats['failed']:>6} {' '.join(values)}")
+    print(f"{report['uploads_per_sec']} uploads/s, {report['wall_seconds']} s")
+
+
+def main(argv):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings.tests")
+    import django
+
+    django.setup()
+
+    from .fake_es import FakeElasticsearch
+    from .harness import local_stack, make_uploads, run_load
+
+    args = parse_args(argv)
+    faults = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "seed": args.seed}
+
+    if args.command == "fake-es":
+        es = FakeElasticsearch(host=args.host, port=args.port, **faults)
+        print(f"fake elasticsearch on {es.url}")
+        try:
+            es.server.serve_forever()
+        except KeyboardInterrupt:
+            print(es.counters)
+        return 0
+
+    es = FakeElasticsearch(**faults)
+    uploads = make_uploads(
+        args.uploads, args.rows, args.update_share, args.file_error_rate, args.roles_per_etab, args.seed
+    )
+    if args.url:
+        report = run_load(args.url, uploads, args.concurrency, args.poll_interval)
+    else:
+        with es, local_stack(es.url, workers=args.workers, broker_url=args.broker) as url:
+            report = run_load(url, uploads, args.concurrency, args.poll_interval)
+        report["elasticsearch"] = es.counters
+
+    report["config"] = {key: value for key, value in vars(args).items() if key != "command"}
+    report["date"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
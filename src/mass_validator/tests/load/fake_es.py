@@ -0,0 +1,146 @@
+"""
+Fake elasticsearch HTTP server, answering the `_search` and `_msearch` queries sent by `search_api` and `async_search`.
+
+Every siret is an active establishment, unless listed in `inactive`. Latency and failures are injected per request:
+`latency` seconds plus up to `jitter` seconds, and a 503 response for `error_rate` of the requests, which clients
+retry like a real overloaded cluster.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ...validator.constants import ACTIVE
+
+VERSION = "7.17.0"
+
+
+class FakeElasticsearchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        # elasticsearch clients >= 7.14 check they talk to the genuine product
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length).decode() if length else ""
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.read_body()
+        path = self.path.split("?")[0]
+        if path == "/":
+            self.send_json(
+                200, {"version": {"number": VERSION, "build_flavor": "default"}, "tagline": "You Know, for Search"}
+            )
+        elif path.endswith("/_search"):
+            self.search("")
+        else:
+            self.send_json(404, {"error": "not found", "status": 404})
+
+    def do_POST(self):
+        body = self.read_body()
+        path = self.path.split("?")[0]
+        if path.endswith("/_msearch"):
+            self.msearch(body)
+        elif path.endswith("/_search"):
+            self.search(body)
+        else:
+            self.send_json(404, {"error": "not found", "status": 404})
+
+    def search(self, body):
+        if not self.server.fake.before_request(queries=1):
+            return self.unavailable()
+        query = json.loads(body).get("query", {}) if body else {}
+        self.send_json(200, self.server.fake.response(query))
+
+    def msearch(self, body):
+        # ndjson: a header line, then a query line, per search
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        queries = [line.get("query", {}) for line in lines[1::2]]
+        if not self.server.fake.before_request(queries=len(queries)):
+            return self.unavailable()
+        self.send_json(200, {"took": 1, "responses": [self.server.fake.response(query) for query in queries]})
+
+    def unavailable(self):
+        self.send_json(503, {"error": {"type": "unavailable_shards_exception"}, "status": 503})
+
+
+def queried_siret(query):
+    try:
+        return query["bool"]["must"][0]["match"]["siret"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+class FakeElasticsearch:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, inactive=(), seed=0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.inactive = frozenset(inactive)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "queries": 0, "errors": 0}
+        self.server = ThreadingHTTPServer((host, port), FakeElasticsearchHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def before_request(self, queries):
+        """Count and delay a request, False if it is to fail"""
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["queries"] += queries
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.counters["errors"] += 1
+        if delay:
+            time.sleep(delay)
+        return not failed
+
+    def response(self, query):
+        siret = queried_siret(query)
+        if siret is None or siret in self.inactive:
+            hits = []
+        else:
+            hits = [{"_source": {"siret": siret, "etatAdministratifEtablissement": ACTIVE}}]
+        return {"hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
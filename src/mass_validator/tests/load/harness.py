@@ -0,0 +1,270 @@
+"""
+Concurrent uploads of creation and update files, driven over HTTP like a browser would.
+
+Each upload opens its own session: form page, upload, then for creation files the polling loop of the result page,
+every `poll_interval` seconds like htmx, until sirets are checked. Latencies are recorded per endpoint, and the time
+from upload to final result per file kind.
+
+The captcha is solved with `hash_answer`, as in the views tests: the harness must run with the `SECRET_KEY` of the
+server it targets.
+"""
+
+import math
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import httpx
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from kombu import pools
+
+from core.celery_app import app
+
+from ...fields import hash_answer
+from ...validator import search_api
+from ..benchmarks.workbooks import creation_workbook, update_workbook
+
+KIND_CREATE = "create"
+KIND_UPDATE = "update"
+
+csrf_re = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+# running results re-poll themselves, see _sirets_result.html
+POLLING_MARKER = 'hx-trigger="every'
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values`, None when empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(seconds, failed=0):
+    """Count and percentiles, in milliseconds"""
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "count": len(seconds),
+        "failed": failed,
+        "p50": ms(percentile(seconds, 50)),
+        "p95": ms(percentile(seconds, 95)),
+        "p99": ms(percentile(seconds, 99)),
+        "max": ms(max(seconds, default=None)),
+    }
+
+
+class Recorder:
+    """Thread-safe latencies by endpoint, and completion times by file kind"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.endpoint_errors = {}
+        self.completions = {}
+        self.failures = {}
+
+    def request(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            self.endpoint_errors[endpoint] = self.endpoint_errors.get(endpoint, 0) + (not ok)
+
+    def completed(self, kind, seconds):
+        with self.lock:
+            self.completions.setdefault(kind, []).append(seconds)
+
+    def failed(self, kind):
+        with self.lock:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def report(self):
+        return {
+            "endpoints": {
+                endpoint: summarize(seconds, self.endpoint_errors[endpoint])
+                for endpoint, seconds in sorted(self.latencies.items())
+            },
+            "tasks": {
+                kind: summarize(self.completions.get(kind, []), self.failures.get(kind, 0))
+                for kind in sorted(set(self.completions) | set(self.failures))
+            },
+        }
+
+
+class UploadFailed(Exception):
+    pass
+
+
+class Session:
+    """One simulated user, timing each request by endpoint name"""
+
+    def __init__(self, base_url, recorder, timeout=60):
+        self.client = httpx.Client(base_url=base_url, timeout=timeout)
+        self.recorder = recorder
+        self.uploaded_at = None
+
+    def request(self, endpoint, method, url, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.request(endpoint, time.perf_counter() - start, ok=False)
+            raise UploadFailed(f"{endpoint}: {e}") from e
+        ok = response.status_code in expected
+        self.recorder.request(endpoint, time.perf_counter() - start, ok=ok)
+        if not ok:
+            raise UploadFailed(f"{endpoint}: {response.status_code}")
+        return response
+
+    def upload(self, endpoint, url, content):
+        form = self.request(f"{endpoint}_form", "GET", url)
+        match = csrf_re.search(form.text)
+        if not match:
+            raise UploadFailed(f"{endpoint}: no csrf token")
+        data = {"csrfmiddlewaretoken": match.group(1), "captcha_0": "2", "captcha_1": hash_answer(2)}
+        files = {"file": ("upload.xlsx", content)}
+        self.uploaded_at = time.perf_counter()
+        return self.request(f"{endpoint}_upload", "POST", url, expected=(200, 302), data=data, files=files)
+
+    def close(self):
+        self.client.close()
+
+
+def upload_creation(session, content, poll_interval, max_wait):
+    response = session.upload("create", "/", content)
+    if response.status_code != 302:
+        raise UploadFailed("create_upload: form rejected")
+    result_url = response.headers["location"]
+    task_id = result_url.rstrip("/").rsplit("/", 1)[-1]
+
+    page = session.request("create_result", "GET", result_url, expected=(200, 302))
+    deadline = time.monotonic() + max_wait
+    while POLLING_MARKER in page.text and "HX-Redirect" not in page.headers:
+        if time.monotonic() > deadline:
+            raise UploadFailed("sirets_poll: timeout")
+        time.sleep(poll_interval)
+        page = session.request("sirets_poll", "GET", f"/siret-result/{task_id}/")
+
+
+def upload_update(session, content, poll_interval, max_wait):
+    # validated within the request
+    session.upload("update", "/validate-update/", content)
+
+
+UPLOADS = {KIND_CREATE: upload_creation, KIND_UPDATE: upload_update}
+
+
+def make_uploads(count, rows, update_share, error_rate, roles_per_etab, seed):
+    """
+    (kind, xlsx content) of each upload, in a shuffled order.
+
+    Files are all different: identical uploads would be answered from the reports cache.
+    """
+    updates = round(count * update_share)
+    kinds = [KIND_UPDATE] * updates + [KIND_CREATE] * (count - updates)
+    random.Random(seed).shuffle(kinds)
+
+    uploads = []
+    for i, kind in enumerate(kinds):
+        if kind == KIND_CREATE:
+            file, _ = creation_workbook(rows, error_rate=error_rate, roles_per_etab=roles_per_etab, seed=seed + i)
+        else:
+            file, _ = update_workbook(rows, error_rate=error_rate, seed=seed + i)
+        uploads.append((kind, file.getvalue()))
+    return uploads
+
+
+def run_load(base_url, uploads, concurrency, poll_interval=0.5, max_wait=300):
+    """
+    Send `uploads` with `concurrency` sessions at once.
+
+    :return: report of latencies by endpoint and completion times by file kind, in milliseconds
+    """
+    recorder = Recorder()
+
+    def send(upload):
+        kind, content = upload
+        session = Session(base_url, recorder)
+        try:
+            UPLOADS[kind](session, content, poll_interval, max_wait)
+        except UploadFailed:
+            recorder.failed(kind)
+        else:
+            recorder.completed(kind, time.perf_counter() - session.uploaded_at)
+        finally:
+            session.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, uploads))
+    wall_seconds = time.perf_counter() - start
+
+    report = recorder.report()
+    report["wall_seconds"] = round(wall_seconds, 2)
+    report["uploads_per_sec"] = round(len(uploads) / wall_seconds, 2) if wall_seconds else None
+    return report
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def reset_broker_connections():
+    """Drop connections and producers opened with the previous broker settings"""
+    pools.reset()
+    app._pool = None
+    app.amqp._producer_pool = None
+
+
+@contextmanager
+def local_stack(es_url, workers=2, broker_url="memory://"):
+    """
+    The application served from a thread, tasks run by a celery worker in other threads, sirets searched on `es_url`.
+
+    Yields the application url. With the in-memory broker, the siret cache redis tier is not available: the cache is
+    disabled, every siret goes to elasticsearch.
+    """
+    from celery.contrib.testing.worker import start_worker
+
+    in_memory = broker_url.startswith("memory://")
+    # celery reads its configuration from django settings
+    overrides = override_settings(
+        ALLOWED_HOSTS=["*"],
+        CELERY_BROKER_URL=broker_url,
+        # the in-memory transport polls its queues every second by default, longer than most tasks
+        CELERY_BROKER_TRANSPORT_OPTIONS={"polling_interval": 0.01} if in_memory else {},
+        CELERY_RESULT_BACKEND="cache+memory://" if in_memory else broker_url,
+        CELERY_TASK_ALWAYS_EAGER=False,
+        SIRET_CHECK_BACKEND="elasticsearch",
+        SIRET_CACHE_ENABLED=not in_memory,
+        TD_COMPANY_ELASTICSEARCH_URL=es_url,
+    )
+
+    with overrides:
+        reset_broker_connections()
+        search_api.reset_client()
+        server = make_server(
+            "127.0.0.1", 0, get_wsgi_application(), server_class=ThreadingWSGIServer, handler_class=QuietHandler
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            with start_worker(app, concurrency=workers, pool="threads", perform_ping_check=False, loglevel="ERROR"):
+                yield f"http://127.0.0.1:{server.server_address[1]}"
+        finally:
+            server.shutdown()
+            server.server_close()
+            reset_broker_connections()
+            search_api.reset_client()
@@ -0,0 +1,115 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from ..validator.async_search import check_sirets_async
+from ..validator.search_api import SiretSearchError
+from ..validator.siret_cache import get_cache
+
+INACTIVE = {"22222222222222", "44444444444444"}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(settings):
+    settings.SIRET_CHECK_BACKEND = "elasticsearch"
+    get_cache().flush()
+    yield
+    get_cache().flush()
+
+
+def fake_msearch():
+    in_flight = 0
+    fake_msearch.max_in_flight = 0
+
+    async def msearch(body, index):
+        nonlocal in_flight
+        in_flight += 1
+        fake_msearch.max_in_flight = max(fake_msearch.max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        sirets = [query["query"]["bool"]["must"][0]["match"]["siret"] for query in body[1::2]]
+        state = {True: "F", False: "A"}
+        return {
+            "responses": [
+                {"hits": {"hits": [{"_source": {"etatAdministratifEtablissement": state[s in INACTIVE]}}]}}
+                for s in sirets
+            ]
+        }
+
+    return msearch
+
+
+@patch("mass_validator.validator.async_search.AsyncElasticsearch")
+def test_check_sirets_async(mock_es, settings):
+    settings.SIRET_CHECK_CHUNK_SIZE = 1
+    settings.SIRET_CHECK_CONCURRENCY = 2
+    mock_es.return_value.msearch = fake_msearch()
+    mock_es.return_value.close = AsyncMock()
+    data = [{"siret": f"{i}" * 14, "row_number": i} for i in range(1, 6)]
+    data.append({"siret": "22222222222222", "row_number": 6})
+    progress = []
+
+    errors = check_sirets_async(data, lambda done, errors: progress.append((done, errors)))
+
+    assert errors == [
+        {"siret": "22222222222222", "row_number": 2},
+        {"siret": "44444444444444", "row_number": 4},
+        {"siret": "22222222222222", "row_number": 6},
+    ]
+    assert progress[-1] == (6, 3)
+    assert progress == sorted(progress)
+    assert fake_msearch.max_in_flight == 2
+    assert mock_es.return_value.close.await_count == 1
+
+
+@patch("mass_validator.validator.async_search.AsyncElasticsearch")
+def test_check_sirets_async_cached(mock_es):
+    get_cache().set_many({"11111111111111": True, "22222222222222": False})
+
+    errors = check_sirets_async([{"siret": "11111111111111"}, {"siret": "22222222222222"}])
+
+    assert errors == [{"siret": "22222222222222"}]
+    assert not mock_es.called
+
+
+@patch("mass_validator.validator.async_search.AsyncElasticsearch")
+def test_check_sirets_async_failure(mock_es, settings):
+    settings.SIRET_CHECK_CHUNK_SIZE = 1
+    searched = fake_msearch()
+    cancelled = []
+
+    async def msearch(body, index):
+        siret = body[1]["query"]["bool"]["must"][0]["match"]["siret"]
+        if siret == "11111111111111":
+            raise ConnectionError("es is down")
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(siret)
+            raise
+        return await searched(body, index)
+
+    mock_es.return_value.msearch = msearch
+    mock_es.return_value.close = AsyncMock()
+
+    with pytest.raises(ConnectionError):
+        check_sirets_async([{"siret": "11111111111111"}, {"siret": "22222222222222"}])
+
+    # pending searches are cancelled before the client is closed, nothing is cached for them
+    assert cancelled == ["22222222222222"]
+    assert mock_es.return_value.close.await_count == 1
+    assert get_cache().get_many(["11111111111111", "22222222222222"]) == {}
+
+
+@patch("mass_validator.validator.search_api.ITEM_RETRY_DELAY", 0)
+@patch("mass_validator.validator.async_search.AsyncElasticsearch")
+def test_check_sirets_async_failed_items(mock_es, settings):
+    settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES = 1
+    mock_es.return_value.msearch = AsyncMock(return_value={"responses": [{"error": "shard failure", "status": 500}]})
+    mock_es.return_value.close = AsyncMock()
+
+    with pytest.raises(SiretSearchError):
+        check_sirets_async([{"siret": "11111111111111"}])
+
+    assert mock_es.return_value.msearch.await_count == 2
@@ -0,0 +1,36 @@
+from unittest.mock import patch
+
+from ..validator.bloom import BloomFilter, build_bloom_filter
+from ..validator.search_api import get_active_sirets
+
+
+def test_bloom_filter(tmp_path):
+    path = tmp_path / "bloom.bin"
+    active = [f"{i:014d}" for i in range(1000)]
+
+    count = build_bloom_filter(active, path, capacity=1000, error_rate=0.01)
+
+    bloom = BloomFilter(path)
+    assert count == 1000
+    assert all(siret in bloom for siret in active)
+    false_positives = sum(f"{i:014d}" in bloom for i in range(1000, 11000))
+    assert false_positives < 300
+
+
+@patch("mass_validator.validator.search_api.search_statuses")
+def test_bloom_policies(mock_es, tmp_path, settings):
+    settings.SIRET_CHECK_BACKEND = "elasticsearch"
+    settings.SIRET_CACHE_ENABLED = False
+    settings.SIRET_BLOOM_FILTER_PATH = str(tmp_path / "bloom.bin")
+    build_bloom_filter(["11111111111111"], settings.SIRET_BLOOM_FILTER_PATH, capacity=10)
+    mock_es.side_effect = lambda sirets: dict.fromkeys(sirets, False)
+
+    # probable hits are trusted, definite misses go to elasticsearch
+    assert get_active_sirets(["11111111111111", "22222222222222"]) == {"11111111111111"}
+    mock_es.assert_called_once_with(["22222222222222"])
+
+    # definite misses are inactive, probable hits are confirmed by elasticsearch
+    settings.SIRET_BLOOM_POLICY = "confirm"
+    mock_es.side_effect = lambda sirets: dict.fromkeys(sirets, True)
+    assert get_active_sirets(["11111111111111", "22222222222222"]) == {"11111111111111"}
+    mock_es.assert_called_with(["11111111111111"])
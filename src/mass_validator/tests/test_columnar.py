@@ -0,0 +1,94 @@
+import pytest
+from django.conf import settings as django_settings
+
+from ..validator.columnar import ENGINE_COLUMNAR, ENGINE_ROWS
+from ..validator.row_models import EtabCreateRow, EtabCreateRows, EtabUpdateRows, RoleRow, RoleRows
+from ..validator.xlsx_reader import StreamingWorkbook
+
+TST_FILES = django_settings.BASE_DIR / "tst_files"
+
+SIRETS = ["40290416300043", "00000000014140", "4029041630004", "40290416300044", None]
+COMPANY_TYPES = [["PRODUCER"], ["COLLECTOR", "WASTEPROCESSOR"], ["WASTE_VEHICLES"], ["PLOP"], None]
+COLLECTOR_TYPES = [None, ["DANGEROUS_WASTES"], ["PLOP"]]
+WASTE_PROCESSOR_TYPES = [None, ["DANGEROUS_WASTES_INCINERATION"], ["PLOP"]]
+WASTE_VEHICLES_TYPES = [None, ["BROYEUR"], ["PLOP"]]
+PHONES = [None, "06 12 34 56 78", "12 34"]
+EMAILS = [None, "contact@example.com", "contact@"]
+ROLES = ["ADMIN", "MEMBER", "READER", None]
+
+
+def pick(values, i):
+    value = values[i % len(values)]
+    return list(value) if isinstance(value, list) else value
+
+
+def etab_create_rows():
+    return [
+        EtabCreateRow(
+            index=i + 2,
+            siret=pick(SIRETS, i),
+            companyTypes=pick(COMPANY_TYPES, i // 2) or [],
+            collectorTypes=pick(COLLECTOR_TYPES, i),
+            wasteProcessorTypes=pick(WASTE_PROCESSOR_TYPES, i // 3),
+            wasteVehiclesTypes=pick(WASTE_VEHICLES_TYPES, i // 5),
+            contactPhone=pick(PHONES, i // 7),
+            contactEmail=pick(EMAILS, i // 11),
+        )
+        for i in range(200)
+    ]
+
+
+def role_rows():
+    return [
+        RoleRow(index=i + 2, siret=pick(SIRETS, i), email=pick(EMAILS, i // 3), role=pick(ROLES, i // 2))
+        for i in range(100)
+    ]
+
+
+def validate_with(engine, settings, rows_class, rows, *args):
+    settings.VALIDATION_ENGINE = engine
+    rows_class.validate_rows(rows, *args)
+    return [row.errors for row in rows]
+
+
+def test_etab_create_parity(settings):
+    expected = validate_with(ENGINE_ROWS, settings, EtabCreateRows, etab_create_rows())
+    errors = validate_with(ENGINE_COLUMNAR, settings, EtabCreateRows, etab_create_rows())
+
+    assert any(expected)
+    assert errors == expected
+
+
+def test_role_parity(settings):
+    etab_sirets = {"40290416300043", "00000000014140"}
+
+    expected = validate_with(ENGINE_ROWS, settings, RoleRows, role_rows(), etab_sirets)
+    errors = validate_with(ENGINE_COLUMNAR, settings, RoleRows, role_rows(), etab_sirets)
+
+    assert any(expected)
+    assert errors == expected
+
+
+@pytest.mark.parametrize(
+    "file_name,rows_classes",
+    [
+        ("create_etabs_ok.xlsx", [EtabCreateRows, RoleRows]),
+        ("create_etabs_not_ok.xlsx", [EtabCreateRows, RoleRows]),
+        ("modif_etabs_ok.xlsx", [EtabUpdateRows]),
+        ("modif_etabs_not_ok.xlsx", [EtabUpdateRows]),
+    ],
+)
+def test_files_parity(settings, file_name, rows_classes):
+    def validate(engine):
+        settings.VALIDATION_ENGINE = engine
+        worksheets = StreamingWorkbook(TST_FILES / file_name).worksheets
+        etab_rows = rows_classes[0].from_worksheet(worksheets[0])
+        etab_rows.validate()
+        errors = list(etab_rows.get_errors())
+        if len(rows_classes) > 1:
+            role_rows = rows_classes[1].from_worksheet(worksheets[1])
+            role_rows.validate(etab_rows.sirets())
+            errors.extend(role_rows.get_errors())
+        return errors
+
+    assert validate(ENGINE_COLUMNAR) == validate(ENGINE_ROWS)
@@ -1,9 +1,13 @@
-from ..validator.row_models import EtabCreateRow
+import tracemalloc
+
+import pytest
+
+from ..validator.row_models import NO_ERRORS, EtabCreateRow, EtabCreateRows, RoleRows
 
 
 def test_etab():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
@@ -18,7 +22,7 @@ def test_etab():
 
 def test_etab_wp_1():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
@@ -33,7 +37,7 @@ def test_etab_wp_1():
 
 def test_etab_wp_2():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
@@ -48,7 +52,7 @@ def test_etab_wp_2():
 
 def test_etab_wp_3():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER", "WASTEPROCESSOR"],
         "collectorTypes": None,
@@ -63,7 +67,7 @@ def test_etab_wp_3():
 
 def test_etab_coll_1():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER"],
         "collectorTypes": ["PLOP"],
@@ -78,7 +82,7 @@ def test_etab_coll_1():
 
 def test_etab_coll_2():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER"],
         "collectorTypes": [
@@ -95,7 +99,7 @@ def test_etab_coll_2():
 
 def test_etab_coll_3():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": [
             "PRODUCER",
@@ -115,7 +119,7 @@ def test_etab_coll_3():
 
 def test_etab_vhl_1():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
@@ -130,7 +134,7 @@ def test_etab_vhl_1():
 
 def test_etab_vhl_2():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
@@ -145,7 +149,7 @@ def test_etab_vhl_2():
 
 def test_etab_vhl_3():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "gerepId": None,
         "companyTypes": [
             "PRODUCER",
@@ -159,3 +163,82 @@ def test_etab_vhl_3():
     etab_row = EtabCreateRow.from_dict(1, row)
     etab_row.validate()
     assert etab_row.is_valid
+
+
+def test_etab_siret_checksum():
+    for siret, is_valid in [
+        ("40290416300043", True),
+        ("40290416300044", False),
+        ("4029041630004", False),
+        ("1OO00000000048", False),
+        ("35600000000001", True),  # La Poste, digits sum is a multiple of 5
+        ("35600000000002", False),
+        ("00000000014140", True),  # Trackdéchets test establishment
+    ]:
+        etab_row = EtabCreateRow.from_dict(1, {"siret": siret, "companyTypes": ["PRODUCER"]})
+        etab_row.validate()
+        assert etab_row.is_valid == is_valid, siret
+
+
+def test_etab_errors_storage():
+    valid_row = EtabCreateRow.from_dict(1, {"siret": "40290416300043", "companyTypes": ["PRODUCER"]})
+    invalid_row = EtabCreateRow.from_dict(2, {"siret": "40290416300044", "companyTypes": ["PRODUCER"]})
+    valid_row.validate()
+    invalid_row.validate()
+
+    assert not hasattr(valid_row, "__dict__")
+    assert valid_row.errors is NO_ERRORS
+    assert [error.field_name for error in invalid_row.errors] == ["siret"]
+    assert EtabCreateRow(index=3).errors is NO_ERRORS
+
+
+class ValuesWorksheet:
+    """Worksheet yielding prepared tuples, so that only what parsing and validation allocate is measured"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True):
+        yield from self.rows
+
+
+MEMORY_ROWS = 20_000
+MEMORY_SIRETS = [f"000000{i:08d}" for i in range(MEMORY_ROWS)]
+
+
+@pytest.mark.parametrize(
+    "rows_class,values,max_bytes_per_row",
+    [
+        (
+            EtabCreateRows,
+            [
+                (siret, None, "PRODUCER,COLLECTOR", "DANGEROUS_WASTES", None, None, "Établissement")
+                + (f"contact{i % 500}@entreprise.fr", "0612345678", "Jean Dupont", None)
+                for i, siret in enumerate(MEMORY_SIRETS)
+            ],
+            650,  # 980 before slotted rows, 570 measured after
+        ),
+        (
+            RoleRows,
+            [(siret, f"contact{i % 500}@entreprise.fr", "ADMIN") for i, siret in enumerate(MEMORY_SIRETS)],
+            310,  # 415 before slotted rows, 265 measured after
+        ),
+    ],
+)
+def test_rows_memory(rows_class, values, max_bytes_per_row):
+    worksheet = ValuesWorksheet([("header",), *values])
+    args = (set(MEMORY_SIRETS),) if rows_class is RoleRows else ()
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        # the rows loop of `validate`, which stops short above `MAX_ETAB_ROWS` rows
+        rows = list(rows_class.iter_worksheet(worksheet))
+        rows_class.validate_rows(rows, *args)
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    assert len(rows) == MEMORY_ROWS
+    assert all(row.validated and row.errors is NO_ERRORS for row in rows)
+    assert allocated / MEMORY_ROWS < max_bytes_per_row
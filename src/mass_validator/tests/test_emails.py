@@ -0,0 +1,46 @@
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+
+from ..validator.emails import EmailChecker
+
+ADDRESSES = [
+    "contact@example.com",
+    "jean.dupont+dechets@mairie-paris.fr",
+    "a@localhost",
+    "user@[127.0.0.1]",
+    "user@[999.0.0.1]",
+    "contact@",
+    "@example.com",
+    "contact@example",
+    "contact..double@example.com",
+    '"quoted user"@example.com',
+    "contact@exa_mple.com",
+    "x" * 310 + "@example.com",
+    "",
+]
+
+
+def django_is_valid(email):
+    try:
+        EmailValidator()(email)
+        return True
+    except ValidationError:
+        return False
+
+
+@pytest.mark.parametrize("email", ADDRESSES)
+def test_email_checker_parity(email):
+    assert EmailChecker(10, 10).is_valid(email) == django_is_valid(email)
+
+
+def test_email_checker_memoizes():
+    checker = EmailChecker(maxsize=2, domain_maxsize=10)
+
+    for email in ["a@example.com", "b@example.com", "a@example.com", "c@example.com", "b@example.com"]:
+        assert checker.is_valid(email)
+
+    stats = checker.stats()
+    assert stats["address"] == {"hits": 1, "misses": 4, "size": 2, "hit_rate": 0.2}
+    assert stats["domain"]["misses"] == 1
+    assert stats["domain"]["hits"] == 3
@@ -0,0 +1,69 @@
+import csv
+
+import openpyxl
+import pytest
+from django.conf import settings
+
+from ..validator.constants import ETABLISSEMENTS_CREATE_FIELDS, ROLES_FIELDS
+from ..validator.helpers import column_normalizers, dict_read, phone_formatter, siret_is_well_formed
+
+
+@pytest.mark.parametrize(
+    "phone,expected",
+    [("0612345678", "06 12 34 56 78"), ("061234567", "06 12 34 56 7"), ("", "")],
+)
+def test_phone_formatter(phone, expected):
+    assert phone_formatter(phone) == expected
+
+
+def test_dict_read_etab():
+    row = (
+        " 402 904 163.00043\u200b",
+        None,
+        " Producer ,\u200bcollector",
+        "DANGEROUS_WASTES",
+        None,
+        None,
+        " Etab\xa0Nord ",
+        "Jean.Dupont @Example.COM ",
+        612345678,
+        "\u200b\tJean ",
+        "",
+    )
+
+    assert dict_read(row, ETABLISSEMENTS_CREATE_FIELDS) == {
+        "siret": "40290416300043",
+        "gerepId": None,
+        "companyTypes": ["PRODUCER", "\u200bCOLLECTOR"],
+        "collectorTypes": ["DANGEROUS_WASTES"],
+        "wasteProcessorTypes": None,
+        "wasteVehiclesTypes": None,
+        "givenName": "EtabNord",
+        "contactEmail": "jean.dupont@example.com",
+        "contactPhone": "06 12 34 56 78",
+        "contact": "\tJean",
+        "website": "",
+    }
+
+
+def test_dict_read_roles():
+    normalizers = column_normalizers(tuple(ROLES_FIELDS))
+
+    assert dict_read(("40290416300043", "A@B.FR", " admin\u200b"), ROLES_FIELDS, normalizers) == {
+        "siret": "40290416300043",
+        "email": "a@b.fr",
+        "role": "ADMIN",
+    }
+    assert dict_read((None, None), ROLES_FIELDS, normalizers) == {"siret": None, "email": None}
+
+
+def test_fixture_sirets():
+    """Sirets of the valid creation workbook are well formed and active in the snapshot stock"""
+    workbook = openpyxl.load_workbook(settings.BASE_DIR / "tst_files" / "create_etabs_ok.xlsx", read_only=True)
+    sirets = {str(row[0]) for row in workbook.active.iter_rows(min_row=2, values_only=True) if row[0]}
+    with open(settings.BASE_DIR / "tst_files" / "sirene_stock.csv", newline="") as csv_file:
+        stock = {row["siret"]: row["etatAdministratifEtablissement"] for row in csv.DictReader(csv_file)}
+
+    assert "92100000000007" in sirets
+    assert all(siret_is_well_formed(siret) for siret in sirets)
+    assert all(stock.get(siret) == "A" for siret in sirets)
@@ -0,0 +1,284 @@
+import io
+import json
+from http.cookies import SimpleCookie
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from openpyxl import Workbook
+
+from ..fields import hash_answer
+from ..large_files import (
+    KIND_CREATE,
+    KIND_UPDATE,
+    ErrorPages,
+    count_rows,
+    get_export,
+    open_upload,
+    save_export,
+    save_upload,
+)
+from ..tasks import validate_large_file
+from ..validator.constants import ETABLISSEMENTS_CREATE_FIELDS, ETABLISSEMENTS_UPDATE_FIELDS, ROLES_FIELDS
+from ..validator.row_models import EtabUpdateRows
+from ..validator.sources import open_workbook
+from .test_sources import repeated_rows_ods
+
+pytestmark = pytest.mark.django_db
+
+
+def siret(i):
+    return f"000000{i:08d}"
+
+
+def update_file(rows, invalid=()):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "etablissements"
+    ws.append(ETABLISSEMENTS_UPDATE_FIELDS)
+    for i in range(rows):
+        ws.append([siret(i), "PLOP" if i in invalid else "PRODUCER", None, None, None])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.name = "modif.xlsx"
+    buffer.seek(0)
+    return buffer
+
+
+def create_file(rows, without_admin=()):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "etablissements"
+    ws.append(ETABLISSEMENTS_CREATE_FIELDS)
+    roles = wb.create_sheet("roles")
+    roles.append(ROLES_FIELDS)
+    for i in range(rows):
+        ws.append([siret(i), None, "PRODUCER", None, None, None, f"Etab {i}"])
+        roles.append([siret(i), f"user{i}@example.com", "MEMBER" if i in without_admin else "ADMIN"])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.name = "import.xlsx"
+    buffer.seek(0)
+    return buffer
+
+
+def save(buffer):
+    return save_upload(ContentFile(buffer.getvalue()))
+
+
+@pytest.fixture
+def connected_client(anon_client):
+    value = signing.get_cookie_signer(salt="validator_connected").sign("connected")
+    anon_client.cookies = SimpleCookie({"validator_connected": value})
+    return anon_client
+
+
+def post(client, url, upload, follow=False):
+    return client.post(url, {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}, follow=follow)
+
+
+def test_count_rows():
+    ws = open_workbook(update_file(30)).worksheets[0]
+
+    assert count_rows(EtabUpdateRows, ws, 100) == 30
+    assert count_rows(EtabUpdateRows, ws, 10) == 11
+
+
+def test_error_pages(settings):
+    pages = ErrorPages("task", page_size=2)
+    pages.extend(range(5))
+    pages.flush()
+
+    assert pages.count == 5
+    assert pages.pages == 3
+    assert [pages.get_page(page) for page in [1, 2, 3, 4]] == [[0, 1], [2, 3], [4], []]
+
+
+def test_validate_large_update_file(settings):
+    settings.LARGE_FILE_PAGE_SIZE = 2
+    settings.LARGE_FILE_CHUNK_SIZE = 7
+    key = save(update_file(30, invalid={3, 12, 25}))
+
+    job = validate_large_file.apply(args=[KIND_UPDATE, key])
+
+    assert job.result == {
+        "errors_count": 3,
+        "pages": 2,
+        "siret_task_id": None,
+        "export": False,
+        "too_many_rows_error": False,
+        "max_rows": 100_000,
+    }
+    errors = ErrorPages(job.id).get_page(1) + ErrorPages(job.id).get_page(2)
+    assert [(error.row_number, error.field_name) for error in errors] == [
+        (5, "companyTypes"),
+        (14, "companyTypes"),
+        (27, "companyTypes"),
+    ]
+    with pytest.raises(FileNotFoundError):
+        open_upload(key)
+    assert get_export(job.id) is None
+
+
+def test_validate_large_update_file_export():
+    key = save(update_file(30))
+
+    job = validate_large_file.apply(args=[KIND_UPDATE, key])
+
+    assert job.result["export"]
+    export = json.loads(get_export(job.id))
+    assert len(export) == 30
+    assert export[0] == {
+        "orgId": siret(0),
+        "companyTypes": ["PRODUCER"],
+        "collectorTypes": [],
+        "wasteProcessorTypes": [],
+        "wasteVehiclesTypes": [],
+    }
+
+
+def test_validate_large_ods_file_too_many_rows(settings):
+    settings.LARGE_FILE_MAX_ROWS = 1000
+    key = save(repeated_rows_ods(ETABLISSEMENTS_UPDATE_FIELDS, 1_000_000))
+
+    job = validate_large_file.apply(args=[KIND_UPDATE, key])
+
+    assert job.result["too_many_rows_error"]
+    assert not job.result["export"]
+    with pytest.raises(FileNotFoundError):
+        open_upload(key)
+
+
+def test_validate_large_create_file(settings):
+    settings.SIRET_CHECK_SHARD_SIZE = 1000
+    key = save(create_file(30))
+
+    with patch("mass_validator.tasks.dispatch_check_sirets", return_value="siret-task") as dispatch:
+        job = validate_large_file.apply(args=[KIND_CREATE, key])
+
+    assert job.result == {
+        "errors_count": 0,
+        "pages": 0,
+        "siret_task_id": "siret-task",
+        "export": False,
+        "too_many_rows_error": False,
+        "max_rows": 100_000,
+    }
+    to_check = dispatch.call_args.args[0]
+    assert len(to_check) == 30
+    assert to_check[0] == {"siret": siret(0), "row_number": 2}
+
+
+def test_validate_large_create_file_without_admin():
+    key = save(create_file(30, without_admin={4}))
+
+    with patch("mass_validator.tasks.dispatch_check_sirets") as dispatch:
+        job = validate_large_file.apply(args=[KIND_CREATE, key])
+
+    assert job.result["errors_count"] == 1
+    assert not dispatch.called
+    (error,) = ErrorPages(job.id).get_page(1)
+    assert error.row_number == 6
+    assert error.error_type == "siret_has_no_admin"
+
+
+def test_large_file_anonymous(anon_client):
+    res = post(anon_client, reverse("validate_update_file"), update_file(501))
+
+    assert res.status_code == 200
+    assert res.context["too_many_rows_error"]
+    assert "le maximum étant de 500" in res.content.decode()
+
+
+def test_large_file_connected(connected_client):
+    with patch("mass_validator.views.validate_large_file.delay", return_value=MagicMock(id="task")) as delay:
+        res = post(connected_client, reverse("validate_update_file"), update_file(501))
+
+    assert res.status_code == 302
+    assert res.url == reverse("large_file_result", args=["task"])
+    kind, key = delay.call_args.args
+    assert kind == KIND_UPDATE
+    assert open_upload(key).read()[:2] == b"PK"
+
+
+def test_large_file_too_many_rows(anon_client, settings):
+    settings.LARGE_FILE_MAX_ROWS = 505
+    key = save(create_file(510))
+
+    with patch("mass_validator.tasks.dispatch_check_sirets") as dispatch:
+        job = validate_large_file.apply(args=[KIND_CREATE, key])
+    with patch("mass_validator.views.AsyncResult", return_value=job):
+        res = anon_client.get(reverse("large_file_result", args=[job.id]))
+
+    assert not dispatch.called
+    assert res.context["too_many_rows_error"]
+    assert "le maximum étant de 505" in res.content.decode()
+
+
+def test_large_file_rows_total():
+    key = save(create_file(30))
+
+    with (
+        patch("mass_validator.tasks.dispatch_check_sirets", return_value="siret-task"),
+        patch.object(validate_large_file, "update_state") as update,
+    ):
+        validate_large_file.apply(args=[KIND_CREATE, key])
+
+    # the total is counted by the task and reported with the progress
+    assert update.call_args_list[0].kwargs["meta"]["rows_total"] == 60
+
+
+def test_large_create_file_connected(connected_client):
+    with patch("mass_validator.tasks.validate_large_file.delay", return_value=MagicMock(id="task")) as delay:
+        res = post(connected_client, "/", create_file(501), follow=True)
+
+    assert res.redirect_chain[-1][0] == reverse("large_file_result", args=["task"])
+    kind, key = delay.call_args.args
+    assert kind == KIND_CREATE
+    assert open_upload(key)
+
+
+def test_large_file_connected_small_file(connected_client):
+    with patch("mass_validator.views.validate_large_file.delay") as delay:
+        res = post(connected_client, reverse("validate_update_file"), update_file(30))
+
+    assert not delay.called
+    assert res.status_code == 200
+    assert len(json.loads(res.context["json_export"])) == 30
+
+
+def test_large_file_result_page(anon_client, settings):
+    settings.LARGE_FILE_PAGE_SIZE = 1
+    key = save(update_file(30, invalid={3, 12}))
+    job = validate_large_file.apply(args=[KIND_UPDATE, key])
+
+    with patch("mass_validator.views.AsyncResult", return_value=job):
+        res = anon_client.get(reverse("large_file_result", args=[job.id]), {"page": 2})
+
+    assert res.status_code == 200
+    assert res.context["state"] == "done"
+    assert res.context["errors_count"] == 2
+    assert [error.row_number for error in res.context["errors"]] == [14]
+    assert "Votre fichier comporte 2 erreur(s)" in res.content.decode()
+
+
+def test_large_file_status_running(anon_client):
+    job = MagicMock(result={"progress": 40, "rows_done": 400, "rows_total": 1000, "errors": 3})
+    job.ready.return_value = False
+
+    with patch("mass_validator.views.AsyncResult", return_value=job):
+        res = anon_client.get(reverse("large_file_status", args=["task"]))
+
+    assert res.context["state"] == "running"
+    assert "400 / 1000 lignes vérifiées, 3 erreur(s)" in res.content.decode()
+
+
+def test_large_file_export(connected_client):
+    save_export("task", "[]")
+
+    res = connected_client.get(reverse("large_file_export", args=["task"]))
+
+    assert res.status_code == 200
+    assert b"".join(res.streaming_content) == b"[]"
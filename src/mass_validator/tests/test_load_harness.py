@@ -0,0 +1,57 @@
+import pytest
+from elasticsearch7 import TransportError
+
+from ..validator.search_api import reset_client, search_active_sirets
+from .load.fake_es import FakeElasticsearch
+from .load.harness import local_stack, make_uploads, percentile, run_load
+
+
+@pytest.fixture()
+def fake_es(settings):
+    with FakeElasticsearch(inactive=["22222222222222"]) as es:
+        settings.TD_COMPANY_ELASTICSEARCH_URL = es.url
+        reset_client()
+        yield es
+    reset_client()
+
+
+def test_percentile():
+    values = [0.3, 0.1, 0.2, 0.4]
+
+    assert percentile(values, 50) == 0.2
+    assert percentile(values, 99) == 0.4
+    assert percentile([], 50) is None
+
+
+def test_fake_es_msearch(fake_es):
+    res = search_active_sirets(["11111111111111", "22222222222222"])
+
+    assert res == {"11111111111111"}
+    assert fake_es.counters == {"requests": 1, "queries": 2, "errors": 0}
+
+
+def test_fake_es_errors(fake_es, settings):
+    settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES = 1
+    reset_client()
+    fake_es.error_rate = 1.0
+
+    with pytest.raises(TransportError):
+        search_active_sirets(["11111111111111"])
+
+    # retried once
+    assert fake_es.counters["errors"] == 2
+
+
+def test_run_load():
+    uploads = make_uploads(4, rows=10, update_share=0.5, error_rate=0.0, roles_per_etab=1, seed=0)
+
+    with FakeElasticsearch() as es, local_stack(es.url, workers=2) as url:
+        report = run_load(url, uploads, concurrency=2, poll_interval=0.05)
+
+    assert report["tasks"]["create"]["count"] == 2
+    assert report["tasks"]["update"]["count"] == 2
+    assert report["tasks"]["create"]["failed"] == 0
+    assert report["endpoints"]["create_upload"]["count"] == 2
+    assert report["endpoints"]["update_upload"]["failed"] == 0
+    # creation files sirets were checked on the fake elasticsearch
+    assert es.counters["queries"] == 20
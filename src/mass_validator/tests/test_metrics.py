@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from django.urls import reverse
+from elasticsearch7 import TransportError
+from prometheus_client import REGISTRY
+
+from .. import metrics
+from ..tasks import check_sirets
+from ..validator.search_api import reset_client, search_active_sirets
+from ..validator.siret_cache import get_cache
+from .load.fake_es import FakeElasticsearch
+from .test_timing import post
+from .test_views import MODIF_ETAB_OK
+
+
+def value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(anon_client, settings):
+    settings.METRICS_TOKEN = "s3cr3t"
+
+    res = anon_client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cr3t")
+
+    assert res.status_code == 200
+    assert res["Content-Type"].startswith("text/plain")
+    assert "mass_validator_uploads_total" in res.content.decode()
+
+
+@pytest.mark.django_db
+def test_metrics_token(anon_client, settings):
+    # closed without a token
+    assert anon_client.get(reverse("metrics")).status_code == 403
+
+    settings.METRICS_TOKEN = "s3cr3t"
+
+    assert anon_client.get(reverse("metrics")).status_code == 403
+    assert anon_client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cr3t").status_code == 200
+
+
+def test_worker_metrics(settings):
+    with patch("mass_validator.metrics.start_http_server") as start:
+        metrics.serve_worker_metrics()
+        assert not start.called
+
+        settings.METRICS_WORKER_PORT = 9808
+        metrics.serve_worker_metrics()
+    assert start.call_args.args == (9808,)
+
+
+@pytest.mark.django_db
+def test_upload_metrics(anon_client):
+    uploads = value("mass_validator_uploads_total", kind="update")
+    validations = value("mass_validator_stage_duration_seconds_count", kind="update", stage="validate")
+    rows = value("mass_validator_rows_total", kind="update")
+    report_misses = value("mass_validator_cache_lookups_total", cache="report", result="miss")
+    report_hits = value("mass_validator_cache_lookups_total", cache="report", result="hit")
+
+    post(anon_client, reverse("validate_update_file"), MODIF_ETAB_OK)
+    post(anon_client, reverse("validate_update_file"), MODIF_ETAB_OK)
+
+    assert value("mass_validator_uploads_total", kind="update") == uploads + 2
+    assert value("mass_validator_upload_size_bytes_count", kind="update") >= 2
+    # the second upload is answered from the reports cache
+    assert value("mass_validator_stage_duration_seconds_count", kind="update", stage="validate") == validations + 1
+    assert value("mass_validator_rows_total", kind="update") == rows + 12
+    assert value("mass_validator_cache_lookups_total", cache="report", result="miss") == report_misses + 1
+    assert value("mass_validator_cache_lookups_total", cache="report", result="hit") == report_hits + 1
+
+
+def test_task_metrics():
+    runs = value("mass_validator_task_duration_seconds_count", task=check_sirets.name)
+
+    check_sirets.delay([{"siret": "40290416300044"}])
+
+    assert value("mass_validator_task_duration_seconds_count", task=check_sirets.name) == runs + 1
+
+
+def test_task_queue_wait():
+    waits = value("mass_validator_task_queue_wait_seconds_count", task="some.task")
+    headers = {}
+    metrics.stamp_published_at(headers=headers)
+    task = SimpleNamespace(name="some.task", request=SimpleNamespace(published_at=headers["published_at"]))
+
+    metrics.start_task_timer(task_id="abc", task=task)
+    metrics.stop_task_timer(task_id="abc", task=task)
+
+    assert value("mass_validator_task_queue_wait_seconds_count", task="some.task") == waits + 1
+    assert value("mass_validator_task_duration_seconds_count", task="some.task") >= 1
+
+
+@pytest.fixture()
+def fake_es(settings):
+    settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES = 0
+    with FakeElasticsearch() as es:
+        settings.TD_COMPANY_ELASTICSEARCH_URL = es.url
+        reset_client()
+        yield es
+    reset_client()
+
+
+def test_elasticsearch_metrics(fake_es):
+    requests = value("mass_validator_elasticsearch_request_seconds_count")
+    errors = value("mass_validator_elasticsearch_errors_total", error="error")
+
+    search_active_sirets(["11111111111111", "22222222222222"])
+    fake_es.error_rate = 1.0
+    with pytest.raises(TransportError):
+        search_active_sirets(["11111111111111"])
+
+    assert value("mass_validator_elasticsearch_request_seconds_count") == requests + 1
+    assert value("mass_validator_elasticsearch_siret_seconds_count") >= 1
+    assert value("mass_validator_elasticsearch_errors_total", error="error") == errors + 1
+
+
+def test_siret_cache_metrics(settings):
+    settings.CELERY_BROKER_URL = None
+    cache = get_cache()
+    cache.flush()
+    hits = value("mass_validator_cache_lookups_total", cache="siret", result="hit")
+    misses = value("mass_validator_cache_lookups_total", cache="siret", result="miss")
+
+    cache.set_many({"11111111111111": True})
+    cache.get_many(["11111111111111", "22222222222222"])
+
+    assert value("mass_validator_cache_lookups_total", cache="siret", result="hit") == hits + 1
+    assert value("mass_validator_cache_lookups_total", cache="siret", result="miss") == misses + 1
+    cache.flush()
@@ -0,0 +1,29 @@
+from ..validator.constants import COMPANY_TYPES
+from ..validator.row_models import EtabCreateRow, EtabUpdateRow
+from ..validator.schema import KIND_CHOICES, KIND_EMAIL, FieldRule, compile_rule
+
+
+def test_compile_rule():
+    check = compile_rule(FieldRule("companyTypes", KIND_CHOICES, required=True, choices=COMPANY_TYPES))
+
+    assert check.columns == ("companyTypes",)
+    assert check.is_valid(["PRODUCER", "COLLECTOR"])
+    assert not check.is_valid(["PRODUCER", "PLOP"])
+    assert not check.is_valid(None)
+
+
+def test_compile_optional_rule():
+    check = compile_rule(FieldRule("contactEmail", KIND_EMAIL))
+
+    assert check.is_valid(None)
+    assert check.is_valid("contact@example.com")
+    assert not check.is_valid("contact@")
+    assert not check.row_is_valid(EtabCreateRow(index=2, contactEmail="contact@"))
+
+
+def test_sub_types_require_company_type():
+    row = EtabUpdateRow(index=2, siret="40290416300043", companyTypes=None, collectorTypes=["DANGEROUS_WASTES"])
+
+    row.validate()
+
+    assert [error.field_name for error in row.errors] == ["companyTypes", "collectorTypes"]
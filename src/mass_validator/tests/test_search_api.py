@@ -0,0 +1,152 @@
+from unittest.mock import patch
+
+import pytest
+
+from ..validator import search_api
+from ..validator.search_api import SiretSearchError, get_active_sirets, get_client, pool_stats, reset_client
+from ..validator.siret_cache import get_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(settings):
+    settings.SIRET_CHECK_BACKEND = "elasticsearch"
+    reset_client()
+    get_cache().flush()
+    yield
+    reset_client()
+    get_cache().flush()
+
+
+def hit(state):
+    return {"_source": {"etatAdministratifEtablissement": state}}
+
+
+THROTTLED = {"error": {"type": "es_rejected_execution_exception"}, "status": 429}
+
+
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_get_active_sirets(mock_es):
+    mock_es.return_value.msearch.return_value = {
+        "responses": [
+            {"hits": {"hits": [hit("A")]}},
+            {"hits": {"hits": [hit("F")]}},
+            {"hits": {"hits": []}},
+            {"hits": {"hits": [hit("F"), hit("A")]}},
+        ]
+    }
+
+    res = get_active_sirets(["11111111111111", "22222222222222", "33333333333333", "44444444444444"])
+
+    assert res == {"11111111111111", "44444444444444"}
+    assert mock_es.return_value.msearch.call_count == 1
+    body = mock_es.return_value.msearch.call_args.kwargs["body"]
+    assert len(body) == 8
+    assert body[1] == {"query": {"bool": {"must": [{"match": {"siret": "11111111111111"}}]}}}
+
+
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_get_active_sirets_empty(mock_es):
+    assert get_active_sirets([]) == set()
+    assert not mock_es.called
+
+
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_client_is_reused(mock_es):
+    mock_es.return_value.msearch.return_value = {"responses": [{"hits": {"hits": []}}]}
+
+    get_active_sirets(["11111111111111"])
+    get_active_sirets(["22222222222222"])
+
+    assert mock_es.call_count == 1
+
+
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_client_is_rebuilt_after_fork(mock_es):
+    get_client()
+    search_api._client_pid = -1  # simulate a client inherited from a parent process
+
+    get_client()
+
+    assert mock_es.call_count == 2
+
+
+def test_pool_stats():
+    assert pool_stats()["requests"] == 0
+
+    es = get_client()
+
+    assert es.transport.connection_pool.connections[0].pool.pool.maxsize == 10
+    assert pool_stats() == {"open": 0, "created": 0, "requests": 0, "reused": 0, "failed": 0}
+
+
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_get_active_sirets_cached(mock_es):
+    mock_es.return_value.msearch.side_effect = [
+        {"responses": [{"hits": {"hits": [hit("A")]}}, {"hits": {"hits": []}}]},
+        {"responses": [{"hits": {"hits": [hit("A")]}}]},
+    ]
+
+    assert get_active_sirets(["11111111111111", "22222222222222"]) == {"11111111111111"}
+    # inactive sirets are cached too, only the new one is searched
+    assert get_active_sirets(["11111111111111", "22222222222222", "33333333333333"]) == {
+        "11111111111111",
+        "33333333333333",
+    }
+
+    body = mock_es.return_value.msearch.call_args.kwargs["body"]
+    assert body == [{}, {"query": {"bool": {"must": [{"match": {"siret": "33333333333333"}}]}}}]
+    assert get_cache().counters == {"local_hits": 2, "redis_hits": 0, "misses": 3}
+
+
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_get_active_sirets_cache_disabled(mock_es, settings):
+    settings.SIRET_CACHE_ENABLED = False
+    mock_es.return_value.msearch.return_value = {"responses": [{"hits": {"hits": [hit("A")]}}]}
+
+    get_active_sirets(["11111111111111"])
+    get_active_sirets(["11111111111111"])
+
+    assert mock_es.return_value.msearch.call_count == 2
+
+
+@patch("mass_validator.validator.search_api.ITEM_RETRY_DELAY", 0)
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_failed_items_are_retried(mock_es):
+    mock_es.return_value.msearch.side_effect = [
+        {"responses": [THROTTLED, {"hits": {"hits": [hit("F")]}}]},
+        {"responses": [{"hits": {"hits": [hit("A")]}}]},
+    ]
+
+    assert get_active_sirets(["11111111111111", "22222222222222"]) == {"11111111111111"}
+
+    body = mock_es.return_value.msearch.call_args.kwargs["body"]
+    assert body == [{}, {"query": {"bool": {"must": [{"match": {"siret": "11111111111111"}}]}}}]
+
+
+@patch("mass_validator.validator.search_api.ITEM_RETRY_DELAY", 0)
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_failed_items_are_not_inactive(mock_es, settings):
+    settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES = 1
+    mock_es.return_value.msearch.side_effect = [
+        {"responses": [{"hits": {"hits": []}}, THROTTLED]},
+        {"responses": [THROTTLED]},
+    ]
+
+    with pytest.raises(SiretSearchError) as error:
+        get_active_sirets(["11111111111111", "22222222222222"])
+
+    assert error.value.sirets == ["22222222222222"]
+    assert mock_es.return_value.msearch.call_count == 2
+
+
+@patch("mass_validator.validator.search_api.ITEM_RETRY_DELAY", 0)
+@patch("mass_validator.validator.search_api.Elasticsearch")
+def test_failed_items_are_not_cached(mock_es, settings):
+    settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES = 0
+    mock_es.return_value.msearch.return_value = {"responses": [{"hits": {"hits": []}}, THROTTLED]}
+
+    with pytest.raises(SiretSearchError):
+        get_active_sirets(["11111111111111", "22222222222222"])
+
+    # the siret searched successfully alongside is cached, the failed one is searched again next time
+    assert get_cache().get_many(["11111111111111", "22222222222222"]) == {"11111111111111": False}
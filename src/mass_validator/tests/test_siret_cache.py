@@ -0,0 +1,56 @@
+from unittest.mock import MagicMock, patch
+
+from ..validator.siret_cache import LRUCache, SiretCache
+
+
+def test_lru_eviction():
+    cache = LRUCache(2)
+    cache.set("a", True, 60)
+    cache.set("b", True, 60)
+    cache.get("a")
+    cache.set("c", False, 60)
+
+    assert cache.get("a") is True
+    assert cache.get("b") is None
+    assert cache.get("c") is False
+
+
+def test_lru_expiry():
+    cache = LRUCache(2)
+    with patch("mass_validator.validator.siret_cache.time.monotonic", return_value=100):
+        cache.set("a", True, 10)
+    with patch("mass_validator.validator.siret_cache.time.monotonic", return_value=105):
+        assert cache.get("a") is True
+    with patch("mass_validator.validator.siret_cache.time.monotonic", return_value=111):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_separate_ttls(settings):
+    settings.SIRET_CACHE_LOCAL_ACTIVE_TTL = 100
+    settings.SIRET_CACHE_LOCAL_INACTIVE_TTL = 10
+    cache = SiretCache()
+    with patch("mass_validator.validator.siret_cache.time.monotonic", return_value=0):
+        cache.set_many({"active": True, "inactive": False})
+    with patch("mass_validator.validator.siret_cache.time.monotonic", return_value=50):
+        assert cache.get_many(["active", "inactive"]) == {"active": True}
+    assert cache.counters == {"local_hits": 1, "redis_hits": 0, "misses": 1}
+
+
+def test_counters_share_the_lookup_round_trip(settings):
+    settings.CELERY_BROKER_URL = "redis://localhost:6379/0"
+    cache = SiretCache()
+    cache._redis = MagicMock()
+    pipe = cache._redis.pipeline.return_value.__enter__.return_value
+    pipe.execute.return_value = [[None]]
+
+    cache.get_many(["a"])
+    pipe.execute.return_value = [1, [b"1", None]]
+    cache.get_many(["a", "b"])
+
+    assert cache.get_many(["a"]) == {"a": True}
+
+    # the counters of a lookup are sent along with the next one, no other round trip is made
+    assert pipe.execute.call_count == 2
+    pipe.hincrby.assert_called_once_with("siret_status_stats", "misses", 1)
+    assert cache.counters == {"local_hits": 1, "redis_hits": 1, "misses": 2}
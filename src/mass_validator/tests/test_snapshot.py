@@ -0,0 +1,50 @@
+import io
+from unittest.mock import patch
+
+import pytest
+
+from ..validator.search_api import get_active_sirets
+from ..validator.snapshot import Snapshot, SnapshotMissingException, build_snapshot
+
+STOCK = """siren,nic,siret,etatAdministratifEtablissement
+111111111,11111,11111111111111,A
+222222222,22222,22222222222222,F
+"""
+
+
+def test_build_snapshot(tmp_path):
+    path = tmp_path / "snapshot.sqlite3"
+
+    count = build_snapshot(io.StringIO(STOCK), path, batch_size=1)
+
+    assert count == 2
+    assert Snapshot(path).get_states(["11111111111111", "22222222222222", "33333333333333"]) == {
+        "11111111111111": "A",
+        "22222222222222": "F",
+    }
+
+
+def test_missing_snapshot(tmp_path):
+    with pytest.raises(SnapshotMissingException):
+        Snapshot(tmp_path / "nope.sqlite3").get_states(["11111111111111"])
+
+
+@patch("mass_validator.validator.search_api.search_statuses")
+def test_snapshot_backend(mock_es):
+    # the test settings snapshot is built from tst_files/sirene_stock.csv
+    res = get_active_sirets(["40290416300043", "15600000000048", "33333333333333"])
+
+    assert res == {"40290416300043"}
+    assert not mock_es.called
+
+
+@patch("mass_validator.validator.search_api.search_statuses")
+def test_snapshot_backend_fallback(mock_es, settings):
+    settings.SIRENE_SNAPSHOT_ES_FALLBACK = True
+    settings.SIRET_CACHE_ENABLED = False
+    mock_es.return_value = {"33333333333333": True}
+
+    res = get_active_sirets(["40290416300043", "15600000000048", "33333333333333"])
+
+    assert res == {"40290416300043", "33333333333333"}
+    mock_es.assert_called_once_with(["33333333333333"])
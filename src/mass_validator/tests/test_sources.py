@@ -0,0 +1,207 @@
+import io
+import zipfile
+
+import pytest
+from django.conf import settings
+
+from ..validator.constants import ETABLISSEMENTS_UPDATE_FIELDS, MAX_ETAB_UPDATE_COL
+from ..validator.csv_reader import CsvWorkbook
+from ..validator.ods_reader import MAX_COLUMNS, OdsWorkbook
+from ..validator.row_models import EtabUpdateRows
+from ..validator.sources import (
+    FORMAT_CSV,
+    FORMAT_ODS,
+    FORMAT_XLSX,
+    UnsafeArchiveException,
+    UnsupportedFormatException,
+    check_archive,
+    open_workbook,
+    sniff_format,
+)
+from ..validator.xlsx_reader import StreamingWorkbook, TooManyRowsException
+
+MODIF_ETAB_OK = settings.BASE_DIR / "tst_files" / "modif_etabs_ok.xlsx"
+MODIF_ETAB_OK_CSV = settings.BASE_DIR / "tst_files" / "modif_etabs_ok.csv"
+
+ODS_CONTENT = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+ xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+ xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">
+<office:body><office:spreadsheet>
+<table:table table:name="etablissements">
+<table:table-row>
+<table:table-cell office:value-type="string"><text:p>siret</text:p></table:table-cell>
+<table:table-cell table:number-columns-repeated="2"/>
+<table:table-cell office:value-type="string"><text:p>role</text:p></table:table-cell>
+</table:table-row>
+<table:table-row table:number-rows-repeated="2"><table:table-cell table:number-columns-repeated="1024"/></table:table-row>
+<table:table-row>
+<table:table-cell office:value-type="float" office:value="40290416300043"/>
+<table:table-cell office:value-type="boolean" office:boolean-value="true"/>
+<table:table-cell office:value-type="string"><text:p>a <text:span>b</text:span></text:p></table:table-cell>
+</table:table-row>
+<table:table-row table:number-rows-repeated="1048570"><table:table-cell table:number-columns-repeated="1024"/></table:table-row>
+</table:table>
+<table:table table:name="roles"><table:table-row/></table:table>
+</office:spreadsheet></office:body></office:document-content>
+"""
+
+
+def build_ods(content=ODS_CONTENT):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("mimetype", "application/vnd.oasis.opendocument.spreadsheet")
+        archive.writestr("content.xml", content)
+    return buffer
+
+
+def repeated_rows_ods(header, repeat):
+    """Ods file of a single `etablissements` sheet: `header`, then `repeat` rows of `repeat` cells"""
+    header_cells = "".join(
+        f'<table:table-cell office:value-type="string"><text:p>{name}</text:p></table:table-cell>' for name in header
+    )
+    cell = f'<table:table-cell office:value-type="float" office:value="1" table:number-columns-repeated="{repeat}"/>'
+    sheet = (
+        '<table:table table:name="etablissements">'
+        f"<table:table-row>{header_cells}</table:table-row>"
+        f'<table:table-row table:number-rows-repeated="{repeat}">{cell}</table:table-row>'
+        "</table:table>"
+    )
+    head = ODS_CONTENT[: ODS_CONTENT.index("<office:body>")]
+    return build_ods(
+        f"{head}<office:body><office:spreadsheet>{sheet}</office:spreadsheet></office:body></office:document-content>"
+    )
+
+
+def rewrite_xlsx(path, parts):
+    """Copy of the xlsx file at `path`, `parts` contents replacing or adding to its parts"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for info in source.infolist():
+            if info.filename not in parts:
+                archive.writestr(info, source.read(info))
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+def test_sniff_format():
+    with open(MODIF_ETAB_OK, "rb") as f:
+        assert sniff_format(f) == FORMAT_XLSX
+    assert sniff_format(build_ods()) == FORMAT_ODS
+    assert sniff_format(io.BytesIO(b"siret;role\n")) == FORMAT_CSV
+
+    with pytest.raises(UnsupportedFormatException):
+        open_workbook(io.BytesIO(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"))
+    with pytest.raises(UnsupportedFormatException):
+        open_workbook(io.BytesIO(b"\x00\x01\x02"))
+
+
+def test_ods_rows():
+    workbook = open_workbook(build_ods())
+
+    assert isinstance(workbook, OdsWorkbook)
+    assert workbook.sheetnames == ["etablissements", "roles"]
+    rows = list(workbook.worksheets[0].iter_rows(max_col=3))
+    assert rows == [
+        ("siret", None, None),
+        (None, None, None),
+        (None, None, None),
+        (40290416300043, True, "a b"),
+    ]
+    assert list(workbook.worksheets[0].iter_rows(max_row=1)) == [("siret", None, None, "role")]
+
+
+def test_ods_repeated_rows():
+    worksheet = open_workbook(repeated_rows_ods(["siret"], 1_000_000)).worksheets[0]
+
+    rows = worksheet.iter_rows(min_row=2, max_row=3)
+    assert [len(row) for row in rows] == [MAX_COLUMNS, MAX_COLUMNS]
+    assert list(worksheet.iter_rows(min_row=2, max_row=3, max_col=2)) == [(1, 1), (1, 1)]
+
+    worksheet.row_limit = 10
+    with pytest.raises(TooManyRowsException):
+        next(worksheet.iter_rows(min_row=2, max_col=2))
+    # rows below the limit are read
+    assert len(list(worksheet.iter_rows(max_row=10, max_col=2))) == 10
+
+
+def test_csv_rows_match_xlsx():
+    with open(MODIF_ETAB_OK_CSV, "rb") as f:
+        workbook = open_workbook(f)
+        assert isinstance(workbook, CsvWorkbook)
+        assert workbook.sheetnames == ["etablissements"]
+        csv_rows = EtabUpdateRows.from_worksheet(workbook.worksheets[0])
+
+    xlsx_rows = EtabUpdateRows.from_worksheet(StreamingWorkbook(MODIF_ETAB_OK).worksheets[0])
+
+    assert csv_rows == xlsx_rows
+
+
+def test_csv_row_limit():
+    worksheet = CsvWorkbook(io.BytesIO(b"siret\n" + b"40290416300043\n" * 20), "etablissements").worksheets[0]
+
+    worksheet.row_limit = 10
+    assert len(list(worksheet.iter_rows(max_row=10))) == 10
+    with pytest.raises(TooManyRowsException):
+        list(worksheet.iter_rows())
+
+
+@pytest.mark.parametrize(
+    "content,encoding",
+    [
+        ('siret,companyTypes\n40290416300043,"PRODUCER,COLLECTOR"\n', "utf-8"),
+        ("siret;companyTypes\n40290416300043;PRODUCER,COLLECTOR\n", "utf-8"),
+        ("siret\tcompanyTypes\n40290416300043\tPRODUCER,COLLECTOR\n", "utf-8-sig"),
+        ("siret;companyTypes\n40290416300043;PRODUCER,COLLECTOR\n", "cp1252"),
+    ],
+)
+def test_csv_dialects(content, encoding):
+    workbook = CsvWorkbook(io.BytesIO(content.encode(encoding)), "etablissements")
+
+    rows = list(workbook.worksheets[0].iter_rows(max_col=3))
+
+    assert rows == [("siret", "companyTypes", None), ("40290416300043", "PRODUCER,COLLECTOR", None)]
+
+
+def test_csv_encoding():
+    workbook = CsvWorkbook(io.BytesIO("siret;givenName\n40290416300043;Société\n".encode("cp1252")), "etabs")
+
+    assert workbook.encoding == "cp1252"
+    assert list(workbook.worksheets[0].iter_rows(min_row=2)) == [("40290416300043", "Société")]
+
+
+def test_csv_streams():
+    content = "siret\n" + "40290416300043\n" * 100_000
+    f = io.BytesIO(content.encode())
+    rows = CsvWorkbook(f, "etablissements").worksheets[0].iter_rows(max_col=MAX_ETAB_UPDATE_COL)
+
+    assert next(rows) == ("siret",) + (None,) * (len(ETABLISSEMENTS_UPDATE_FIELDS) - 1)
+    # only the first buffered chunk has been read so far
+    assert f.tell() < len(content)
+    rows.close()
+    assert not f.closed
+
+
+def test_check_archive(settings):
+    with zipfile.ZipFile(MODIF_ETAB_OK) as archive:
+        check_archive(archive, FORMAT_XLSX)
+
+        settings.UPLOAD_MAX_UNCOMPRESSED_SIZE = 10_000
+        with pytest.raises(UnsafeArchiveException):
+            check_archive(archive, FORMAT_XLSX)
+
+        settings.UPLOAD_MAX_UNCOMPRESSED_SIZE = 1_000_000
+        settings.UPLOAD_MAX_SHEETS = 0
+        with pytest.raises(UnsafeArchiveException):
+            check_archive(archive, FORMAT_XLSX)
+
+
+def test_zip_bomb():
+    # 50 MB of blank formatted rows weigh a few dozen KB once compressed
+    rows = b'<row s="1" customFormat="1"/>' * 1_750_000
+    bomb = rewrite_xlsx(MODIF_ETAB_OK, {"xl/worksheets/sheet2.xml": rows})
+
+    with pytest.raises(UnsafeArchiveException, match="compression ratio"):
+        open_workbook(bomb)
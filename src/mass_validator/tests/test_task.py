@@ -1,25 +1,178 @@
+from types import SimpleNamespace
 from unittest.mock import patch
 
 import pytest
+from django.core.files.base import ContentFile
 
-from ..tasks import check_sirets
+from ..large_files import open_upload, save_upload
+from ..progress import ProgressReporter, shards_progress
+from ..tasks import check_sirets, dispatch_check_sirets, merge_siret_errors, validate_creation_upload
 
 pytestmark = pytest.mark.django_db
 
+SIRET = "40290416300043"
 
-@patch("mass_validator.tasks.check_siret")
+
+def siret(i):
+    """Trackdéchets test sirets, well formed"""
+    return f"{i:014d}"
+
+
+@patch("mass_validator.tasks.get_active_sirets")
 def test_check_sirets_fails(mock_get):
-    mock_get.return_value = False
+    mock_get.return_value = set()
 
-    res = check_sirets([{"siret": "1234"}])
+    res = check_sirets([{"siret": SIRET}])
 
-    assert res == [{"siret": "1234"}]
+    assert res == [{"siret": SIRET}]
 
 
-@patch("mass_validator.tasks.check_siret")
+@patch("mass_validator.tasks.get_active_sirets")
 def test_check_sirets_suceed(mock_get):
-    mock_get.return_value = True
+    mock_get.return_value = {SIRET}
 
-    res = check_sirets([{"siret": "1234"}])
+    res = check_sirets([{"siret": SIRET}])
 
     assert res == []
+
+
+@patch("mass_validator.tasks.get_active_sirets")
+def test_check_sirets_malformed(mock_get):
+    mock_get.return_value = set()
+
+    res = check_sirets([{"siret": "40290416300044", "row_numbers": [2, 4]}, {"siret": SIRET, "row_numbers": [3]}])
+
+    assert res == [
+        {"siret": "40290416300044", "row_number": 2},
+        {"siret": SIRET, "row_number": 3},
+        {"siret": "40290416300044", "row_number": 4},
+    ]
+    # checksum failures never reach the registry
+    mock_get.assert_called_once_with([SIRET])
+
+
+@patch("mass_validator.tasks.get_active_sirets")
+def test_check_sirets_chunks(mock_get, settings):
+    settings.SIRET_CHECK_CHUNK_SIZE = 2
+    mock_get.side_effect = lambda sirets: {s for s in sirets if s != siret(3)}
+    data = [{"siret": siret(i), "row_number": i} for i in range(1, 6)]
+
+    res = check_sirets(data)
+
+    assert mock_get.call_count == 3
+    assert res == [{"siret": siret(3), "row_number": 3}]
+
+
+@patch("mass_validator.tasks.check_sirets_async")
+def test_check_sirets_async_engine(mock_check, settings):
+    settings.SIRET_CHECK_ENGINE = "async"
+    mock_check.return_value = [{"siret": SIRET}]
+
+    res = check_sirets([{"siret": SIRET}])
+
+    assert res == [{"siret": SIRET}]
+    assert mock_check.call_count == 1
+
+
+@patch("mass_validator.tasks.get_active_sirets")
+def test_dispatch_check_sirets_shards(mock_get, settings):
+    settings.SIRET_CHECK_SHARD_SIZE = 2
+    mock_get.side_effect = lambda sirets: {s for s in sirets if s not in [siret(2), siret(5)]}
+    data = [{"siret": siret(i), "row_number": i} for i in range(1, 6)]
+
+    with patch("mass_validator.tasks.merge_siret_errors.run", wraps=merge_siret_errors.run) as mock_merge:
+        task_id = dispatch_check_sirets(data)
+
+    assert task_id
+    assert mock_get.call_count == 3
+    mock_merge.assert_called_once_with(
+        [[{"siret": siret(2), "row_number": 2}], [], [{"siret": siret(5), "row_number": 5}]]
+    )
+
+
+@patch("mass_validator.tasks.get_active_sirets")
+def test_dispatch_check_sirets_dedup(mock_get):
+    mock_get.return_value = set()
+    data = [{"siret": siret(i % 2), "row_number": i} for i in range(1, 6)]
+
+    dispatch_check_sirets(data)
+
+    mock_get.assert_called_once_with([siret(1), siret(0)])
+
+
+def test_merge_siret_errors():
+    assert merge_siret_errors(
+        [[{"siret": siret(2), "row_numbers": [2, 6]}], [], [{"siret": siret(5), "row_numbers": [5]}]]
+    ) == [
+        {"siret": siret(2), "row_number": 2},
+        {"siret": siret(5), "row_number": 5},
+        {"siret": siret(2), "row_number": 6},
+    ]
+
+
+def test_shards_progress():
+    metas = {
+        # a siret in error on 2 rows
+        "a": {"status": "SUCCESS", "result": [{"siret": "1", "row_number": 2}, {"siret": "1", "row_number": 5}]},
+        "b": {"status": "PROGRESS", "result": {"progress": 50, "rows_done": 50, "errors": 2, "eta": 3.0}},
+        "c": None,
+    }
+
+    class FakeBackend:
+        def get_key_for_task(self, task_id):
+            return task_id
+
+        def mget(self, keys):
+            return [metas[key] for key in keys]
+
+        def decode_result(self, value):
+            return value
+
+    with patch("mass_validator.progress.app") as mock_app:
+        mock_app.backend = FakeBackend()
+        progress = shards_progress(["a", "b", "c"], [100, 100, 50])
+
+    assert progress == {"progress": 60, "rows_done": 150, "rows_total": 250, "errors": 3, "eta": 3.0}
+
+
+def test_progress_reporter(settings):
+    settings.PROGRESS_MIN_INTERVAL = 1
+    settings.PROGRESS_MIN_DELTA = 10
+    now = [0.0]
+
+    class FakeTask:
+        def __init__(self):
+            self.states = []
+            self.request = SimpleNamespace(id="task")
+
+        def update_state(self, state, meta):
+            self.states.append(meta)
+
+    task = FakeTask()
+    reporter = ProgressReporter(task, 1000, clock=lambda: now[0])
+
+    for done in range(1, 1001):
+        now[0] = done / 1000
+        reporter.update(done, errors=done // 100)
+
+    # a first write, then one per 10% step instead of one per row
+    assert len(task.states) == 11
+    assert task.states[0] == {"progress": 0, "rows_done": 1, "rows_total": 1000, "errors": 0, "eta": 1.0}
+    assert task.states[-1]["progress"] == 100
+
+    now[0] = 2.5
+    reporter.update(1000, errors=10)
+    assert len(task.states) == 12
+
+
+def test_validate_creation_upload(settings):
+    key = save_upload(ContentFile((settings.BASE_DIR / "tst_files" / "create_etabs_not_ok.xlsx").read_bytes()))
+
+    with patch("mass_validator.tasks.dispatch_check_sirets") as dispatch:
+        report = validate_creation_upload(key)
+
+    assert not dispatch.called
+    with pytest.raises(FileNotFoundError):
+        open_upload(key)
+    assert report["siret_task_id"] is None
+    assert [error["field_name"] for error in report["errors"]] == ["siret", "collectorTypes", "siret"]
@@ -0,0 +1,126 @@
+import json
+import logging
+from itertools import count
+
+import pytest
+from django.urls import reverse
+
+from ..fields import hash_answer
+from ..timing import NO_TIMER, StageTimer, logger, stage_timer
+from .test_views import IMPORT_ETAB_OK, MODIF_ETAB_NOT_OK, MODIF_ETAB_OK
+
+
+@pytest.fixture()
+def timing_logs(caplog, monkeypatch):
+    """Timing lines, as dicts"""
+    # the timing logger does not propagate to the root logger caplog listens to
+    monkeypatch.setattr(logger, "propagate", True)
+    caplog.set_level(logging.INFO, logger=logger.name)
+
+    def lines():
+        return [json.loads(record.getMessage()) for record in caplog.records if record.name == logger.name]
+
+    return lines
+
+
+def test_stage_timer(timing_logs):
+    ticks = count()
+    timer = StageTimer("update", clock=lambda: next(ticks) / 1000)
+
+    with timer.stage("from_worksheet"):
+        pass
+    with timer.stage("validate"):
+        pass
+    with timer.stage("from_worksheet"):
+        pass
+    timer.count(rows=12, errors=1)
+
+    assert timer.stages == {"from_worksheet": pytest.approx(0.002), "validate": pytest.approx(0.001)}
+    assert timer.server_timing() == "from_worksheet;dur=2.0, validate;dur=1.0, total;dur=7.0"
+
+    timer.log()
+    assert timing_logs() == [
+        {
+            "event": "upload_validation",
+            "kind": "update",
+            "total_ms": 8.0,
+            "stages_ms": {"from_worksheet": 2.0, "validate": 1.0},
+            "rows": 12,
+            "errors": 1,
+        }
+    ]
+
+
+def test_stage_timer_disabled(settings):
+    settings.STAGE_TIMING_ENABLED = False
+
+    assert stage_timer("update") is NO_TIMER
+
+
+def post(client, url, path):
+    with open(path, "rb") as upload:
+        return client.post(url, {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)})
+
+
+@pytest.mark.django_db
+def test_update_upload_timings(anon_client, timing_logs):
+    res = post(anon_client, reverse("validate_update_file"), MODIF_ETAB_OK)
+
+    stages = [timing.split(";")[0] for timing in res["Server-Timing"].split(", ")]
+    assert stages == [
+        "receive_upload",
+        "report_cache",
+        "load_workbook",
+        "validate_header",
+        "from_worksheet",
+        "validate",
+        "as_json",
+        "total",
+    ]
+    (line,) = timing_logs()
+    assert line["kind"] == "update"
+    assert line["cached"] is False
+    assert line["rows"] == 12
+    assert line["errors"] == 0
+
+
+@pytest.mark.django_db
+def test_update_upload_errors_count(anon_client, timing_logs):
+    post(anon_client, reverse("validate_update_file"), MODIF_ETAB_NOT_OK)
+    res = post(anon_client, reverse("validate_update_file"), MODIF_ETAB_NOT_OK)
+
+    assert "from_worksheet" not in res["Server-Timing"]
+    first, cached = timing_logs()
+    assert first["errors"] > 0
+    assert cached["cached"] is True
+
+
+@pytest.mark.django_db
+def test_create_upload_timings(anon_client, timing_logs):
+    res = post(anon_client, "/", IMPORT_ETAB_OK)
+
+    assert "save_upload;dur=" in res["Server-Timing"]
+    assert "dispatch;dur=" in res["Server-Timing"]
+    # tasks are eager in tests, the task line comes first
+    task_line, view_line = timing_logs()
+    assert view_line["task_id"] == task_line["task_id"]
+    assert set(task_line["stages_ms"]) == {
+        "load_workbook",
+        "validate_header",
+        "from_worksheet",
+        "validate",
+        "cross_tab",
+        "dispatch",
+    }
+    assert task_line["errors"] == 0
+
+
+@pytest.mark.django_db
+def test_timings_disabled(anon_client, settings, timing_logs):
+    settings.STAGE_TIMING_ENABLED = False
+
+    res = post(anon_client, reverse("validate_update_file"), MODIF_ETAB_OK)
+
+    assert res.status_code == 200
+    assert "Server-Timing" not in res
+    assert timing_logs() == []
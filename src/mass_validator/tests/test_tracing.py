@@ -0,0 +1,91 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from .. import tracing
+from .test_timing import post
+from .test_views import IMPORT_ETAB_OK
+
+
+@pytest.fixture()
+def spans(settings, monkeypatch):
+    """Finished spans"""
+    exporter = InMemorySpanExporter()
+    settings.TRACING_EXPORTER = "memory"
+    monkeypatch.setattr(tracing, "span_processor", lambda exporter_name: SimpleSpanProcessor(exporter))
+    tracing.reset_tracer()
+
+    yield exporter.get_finished_spans
+    tracing.reset_tracer()
+
+
+def ancestors(span, finished):
+    by_id = {span.context.span_id: span for span in finished}
+    names = []
+    while span.parent is not None:
+        span = by_id[span.parent.span_id]
+        names.append(span.name)
+    return names
+
+
+@pytest.mark.django_db
+def test_upload_trace(anon_client, spans):
+    post(anon_client, "/", IMPORT_ETAB_OK)
+
+    finished = spans()
+    by_name = {span.name: span for span in finished}
+    validation = "mass_validator.tasks.validate_creation_upload"
+    assert ancestors(by_name[validation], finished) == ["dispatch", "upload create"]
+    assert ancestors(by_name["resolve_statuses"], finished)[-3:] == [validation, "dispatch", "upload create"]
+    assert by_name["resolve_statuses"].attributes["sirets.count"] > 0
+    # all spans of an upload share its trace
+    assert len({span.context.trace_id for span in finished}) == 1
+
+
+def test_task_trace_context(spans):
+    """Published tasks spans continue the trace of the publisher, after a span covering the queue wait"""
+    headers = {}
+    with tracing.span("publisher") as publisher:
+        tracing.inject_trace_context(headers=headers)
+    request = SimpleNamespace(traceparent=headers["traceparent"], published_at=time.time() - 2)
+    task = SimpleNamespace(name="some.task", request=request)
+
+    tracing.start_task_span(task_id="abc", task=task)
+    with tracing.span("lookup"):
+        pass
+    tracing.end_task_span(task_id="abc", state="SUCCESS")
+
+    finished = {span.name: span for span in spans()}
+    queued, run = finished["queued some.task"], finished["some.task"]
+    assert queued.parent.span_id == run.parent.span_id == publisher.get_span_context().span_id
+    assert (queued.end_time - queued.start_time) / 1e9 >= 2
+    assert finished["lookup"].parent.span_id == run.context.span_id
+    assert run.attributes["celery.state"] == "SUCCESS"
+
+
+def test_file_exporter(settings, tmp_path):
+    settings.TRACING_EXPORTER = tracing.EXPORTER_FILE
+    settings.TRACING_FILE = str(tmp_path / "traces.jsonl")
+    tracing.reset_tracer()
+
+    with tracing.span("upload update", **{"upload.kind": "update"}):
+        trace_id = tracing.current_trace_id()
+    tracing.reset_tracer()
+
+    with open(settings.TRACING_FILE) as traces:
+        (line,) = [json.loads(line) for line in traces]
+    assert line["name"] == "upload update"
+    assert line["context"]["trace_id"] == f"0x{trace_id}"
+
+
+def test_tracing_disabled(settings):
+    settings.TRACING_EXPORTER = ""
+
+    with tracing.span("upload update") as span:
+        span.set_attribute("ignored", True)
+        assert tracing.current_trace_id() is None
+    assert tracing.get_tracer() is None
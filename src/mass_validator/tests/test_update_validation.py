@@ -3,7 +3,7 @@ from ..validator.row_models import EtabUpdateRow
 
 def test_etab():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
         "wasteProcessorTypes": None,
@@ -16,7 +16,7 @@ def test_etab():
 
 def test_etab_wp_1():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
         "wasteProcessorTypes": ["PLOP"],
@@ -29,7 +29,7 @@ def test_etab_wp_1():
 
 def test_etab_wp_2():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
         "wasteProcessorTypes": ["OTHER_DANGEROUS_WASTES"],
@@ -42,7 +42,7 @@ def test_etab_wp_2():
 
 def test_etab_wp_3():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER", "WASTEPROCESSOR"],
         "collectorTypes": None,
         "wasteProcessorTypes": ["OTHER_DANGEROUS_WASTES"],
@@ -55,7 +55,7 @@ def test_etab_wp_3():
 
 def test_etab_coll_1():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER"],
         "collectorTypes": ["PLOP"],
         "wasteProcessorTypes": None,
@@ -68,7 +68,7 @@ def test_etab_coll_1():
 
 def test_etab_coll_2():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER"],
         "collectorTypes": [
             "DEEE_WASTES",
@@ -83,7 +83,7 @@ def test_etab_coll_2():
 
 def test_etab_coll_3():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": [
             "PRODUCER",
             "COLLECTOR",
@@ -101,7 +101,7 @@ def test_etab_coll_3():
 
 def test_etab_vhl_1():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
         "wasteProcessorTypes": None,
@@ -114,7 +114,7 @@ def test_etab_vhl_1():
 
 def test_etab_vhl_2():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": ["PRODUCER"],
         "collectorTypes": None,
         "wasteProcessorTypes": None,
@@ -127,7 +127,7 @@ def test_etab_vhl_2():
 
 def test_etab_vhl_3():
     row = {
-        "siret": "1OO00000000048",
+        "siret": "40290416300043",
         "companyTypes": [
             "PRODUCER",
             "WASTE_VEHICLES",
@@ -1,12 +1,20 @@
+import io
 import json
+import re
+import zipfile
 from http.cookies import SimpleCookie
+from unittest.mock import patch
 
 import pytest
 from django.conf import settings
 from django.core import signing
 from django.urls import reverse
 
+from .. import parsing, views
 from ..fields import hash_answer
+from ..validator.constants import ETABLISSEMENTS_UPDATE_FIELDS
+from ..validator.search_api import SiretSearchError
+from .test_sources import repeated_rows_ods, rewrite_xlsx
 
 pytestmark = pytest.mark.django_db
 
@@ -14,6 +22,7 @@ IMPORT_ETAB_OK = settings.BASE_DIR / "tst_files" / "create_etabs_ok.xlsx"
 IMPORT_ETAB_NOT_OK = settings.BASE_DIR / "tst_files" / "create_etabs_not_ok.xlsx"
 MODIF_ETAB_OK = settings.BASE_DIR / "tst_files" / "modif_etabs_ok.xlsx"
 MODIF_ETAB_NOT_OK = settings.BASE_DIR / "tst_files" / "modif_etabs_not_ok.xlsx"
+MODIF_ETAB_OK_CSV = settings.BASE_DIR / "tst_files" / "modif_etabs_ok.csv"
 
 
 def test_upload_view_get(anon_client):
@@ -39,6 +48,7 @@ def test_upload_create_view_post_fail(anon_client):
         res = anon_client.post(
             "/",
             {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)},
+            follow=True,
         )
     assert res.status_code == 200
     content = res.content.decode()
@@ -166,6 +176,46 @@ def test_upload_update_and_convert_view_post(anon_client):
     assert json_dict == expected_json_dict
 
 
+def test_upload_update_csv_and_convert_view_post(anon_client):
+    value = signing.get_cookie_signer(salt="validator_connected").sign("connected")
+    with open(MODIF_ETAB_OK_CSV, "rb") as upload:
+        setattr(anon_client, "cookies", SimpleCookie({"validator_connected": value}))
+        res = anon_client.post(
+            reverse("validate_update_file"),
+            {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)},
+            follow=True,
+        )
+    assert res.status_code == 200
+    assert "erreurs" not in res.content.decode()
+    assert json.loads(res.context["json_export"]) == expected_json_dict
+
+
+def test_upload_create_csv_view_post(anon_client):
+    with open(MODIF_ETAB_OK_CSV, "rb") as upload:
+        res = anon_client.post(
+            "/",
+            {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)},
+            follow=True,
+        )
+    assert res.status_code == 200
+    assert res.context["parse_error"]
+
+
+def test_upload_update_csv_undecodable(anon_client):
+    with open(MODIF_ETAB_OK_CSV, "rb") as f:
+        # utf-8 according to the sample the encoding is guessed from, not past it
+        upload = io.BytesIO(f.read() + "Déchets;;;;\r\n".encode("cp1252"))
+    upload.name = "modif.csv"
+
+    with patch("mass_validator.validator.csv_reader.SAMPLE_SIZE", 64):
+        res = anon_client.post(
+            reverse("validate_update_file"), {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}
+        )
+
+    assert res.status_code == 200
+    assert res.context["parse_error"]
+
+
 def test_upload_update_view_post_not_ok(anon_client):
     with open(MODIF_ETAB_NOT_OK, "rb") as upload:
         res = anon_client.post(
@@ -189,6 +239,46 @@ def test_upload_update_view_post_not_ok(anon_client):
     assert errors[1].field_name == "collectorTypes"
 
 
+def test_upload_same_file_twice_uses_cached_report(anon_client):
+    with patch("mass_validator.parsing.load_create_xlsx", wraps=parsing.load_create_xlsx) as load:
+        for _ in range(2):
+            with open(IMPORT_ETAB_NOT_OK, "rb") as upload:
+                res = anon_client.post(
+                    "/",
+                    {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)},
+                    follow=True,
+                )
+            assert "Le champ companyTypes doit contenir COLLECTOR." in res.content.decode()
+
+    assert load.call_count == 1
+
+
+def test_failed_task_is_not_served_from_cache(anon_client):
+    def upload():
+        with open(IMPORT_ETAB_OK, "rb") as f:
+            return anon_client.post("/", {"file": f, "captcha_0": 2, "captcha_1": hash_answer(2)}).url
+
+    with patch("mass_validator.tasks.check_creation_file", side_effect=RuntimeError("worker lost")):
+        failed_url = upload()
+
+    # the upload is validated again, instead of redirecting to the failed task until the report expires
+    assert upload() != failed_url
+
+
+def test_upload_report_cache_disabled(anon_client, settings):
+    settings.VALIDATION_REPORT_CACHE_TTL = 0
+    with patch("mass_validator.views.load_update_xlsx", wraps=views.load_update_xlsx) as load:
+        for _ in range(2):
+            with open(MODIF_ETAB_NOT_OK, "rb") as upload:
+                res = anon_client.post(
+                    reverse("validate_update_file"),
+                    {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)},
+                )
+            assert len(res.context["errors"]) == 2
+
+    assert load.call_count == 2
+
+
 def test_log_me_in(anon_client):
     url = reverse("log_me_in")
 
@@ -199,3 +289,114 @@ def test_log_me_in(anon_client):
     assert res.status_code == 302
 
     assert "validator_connected" in res.cookies.keys()
+
+
+def declared_rows_xlsx(path, rows):
+    """Copy of the xlsx file at `path` whose first sheet announces `rows` rows"""
+    with zipfile.ZipFile(path) as archive:
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+    sheet = re.sub(r'<dimension ref="[^"]+"', f'<dimension ref="A1:K{rows}"', sheet)
+    return rewrite_xlsx(path, {"xl/worksheets/sheet1.xml": sheet})
+
+
+def test_upload_update_declared_rows(anon_client):
+    upload = declared_rows_xlsx(MODIF_ETAB_OK, 1_000_000)
+    upload.name = "modif.xlsx"
+
+    res = anon_client.post(
+        reverse("validate_update_file"), {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}
+    )
+
+    assert res.context["too_many_rows_error"]
+    assert "from_worksheet" not in res["Server-Timing"]
+
+
+def far_row_xlsx(path, sheet):
+    """Copy of the xlsx file at `path` whose `sheet` has no dimension and ends with a row far below its data"""
+    with zipfile.ZipFile(path) as archive:
+        content = archive.read(sheet).decode()
+    content = re.sub(r"<dimension [^>]+/>", "", content)
+    content = content.replace("</sheetData>", '<row r="5000000"><c r="A5000000"><v>1</v></c></row></sheetData>')
+    return rewrite_xlsx(path, {sheet: content})
+
+
+def test_upload_update_undeclared_rows(anon_client):
+    upload = far_row_xlsx(MODIF_ETAB_OK, "xl/worksheets/sheet1.xml")
+    upload.name = "modif.xlsx"
+
+    res = anon_client.post(
+        reverse("validate_update_file"), {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}
+    )
+
+    assert res.context["too_many_rows_error"]
+
+
+def test_upload_update_repeated_rows_ods(anon_client):
+    upload = repeated_rows_ods(ETABLISSEMENTS_UPDATE_FIELDS, 1_000_000)
+    upload.seek(0)
+    upload.name = "modif.ods"
+
+    res = anon_client.post(
+        reverse("validate_update_file"), {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}
+    )
+
+    assert res.context["too_many_rows_error"]
+
+
+def test_upload_update_zip_bomb(anon_client):
+    upload = rewrite_xlsx(MODIF_ETAB_OK, {"xl/media/padding.bin": b"\x00" * 50_000_000})
+    upload.name = "modif.xlsx"
+
+    res = anon_client.post(
+        reverse("validate_update_file"), {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}
+    )
+
+    assert res.context["parse_error"]
+
+
+def test_check_creation_file_declared_rows():
+    # blank formatted rows are tolerated
+    report = parsing.check_creation_file(declared_rows_xlsx(IMPORT_ETAB_OK, 2000))
+    assert not report["too_many_rows_error"]
+
+    report = parsing.check_creation_file(declared_rows_xlsx(IMPORT_ETAB_OK, 10_000))
+    assert report["too_many_rows_error"]
+
+
+def test_check_creation_file_roles_rows():
+    report = parsing.check_creation_file(far_row_xlsx(IMPORT_ETAB_OK, "xl/worksheets/sheet2.xml"))
+
+    assert report["too_many_rows_error"]
+
+
+def test_check_creation_file_truncated_sheet():
+    with zipfile.ZipFile(IMPORT_ETAB_OK) as archive:
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+
+    report = parsing.check_creation_file(rewrite_xlsx(IMPORT_ETAB_OK, {"xl/worksheets/sheet1.xml": sheet[:3000]}))
+
+    assert report["parse_error"]
+
+
+def test_failed_validation_task(anon_client):
+    with (
+        patch("mass_validator.tasks.check_creation_file", side_effect=RuntimeError("worker lost")),
+        open(IMPORT_ETAB_OK, "rb") as upload,
+    ):
+        res = anon_client.post("/", {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}, follow=True)
+
+    assert res.status_code == 200
+    assert res.context["parse_error"]
+
+
+def test_failed_siret_check(anon_client, settings):
+    settings.SIRET_CHECK_ENGINE = "sync"
+    with (
+        patch("mass_validator.tasks.check_sirets_sync", side_effect=SiretSearchError(["40290416300043"])),
+        open(IMPORT_ETAB_OK, "rb") as upload,
+    ):
+        res = anon_client.post("/", {"file": upload, "captcha_0": 2, "captcha_1": hash_answer(2)}, follow=True)
+
+    assert res.status_code == 200
+    assert res.context["siret_check_error"]
+    assert "La vérification des sirets n'a pas pu aboutir" in res.content.decode()
@@ -0,0 +1,123 @@
+import io
+import zipfile
+
+import pytest
+from django.conf import settings
+from openpyxl import Workbook, load_workbook
+
+from ..validator.constants import MAX_ETAB_CREATE_COL, MAX_ROLE_COL
+from ..validator.row_models import EtabCreateRows, RoleRows
+from ..validator.xlsx_reader import StreamingWorkbook, TooManyRowsException, column_index
+
+FIXTURES = ["create_etabs_ok.xlsx", "create_etabs_not_ok.xlsx", "modif_etabs_ok.xlsx", "modif_etabs_not_ok.xlsx"]
+
+
+def test_column_index():
+    assert column_index("A1") == 1
+    assert column_index("G12") == 7
+    assert column_index("AA3") == 27
+
+
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_rows_match_openpyxl(fixture):
+    path = settings.BASE_DIR / "tst_files" / fixture
+    expected = load_workbook(path, read_only=True, data_only=True)
+    workbook = StreamingWorkbook(path)
+
+    assert workbook.sheetnames == expected.sheetnames
+    for ws, expected_ws in zip(workbook.worksheets, expected.worksheets):
+        for max_col in [MAX_ROLE_COL, MAX_ETAB_CREATE_COL]:
+            assert list(ws.iter_rows(max_col=max_col, values_only=True)) == list(
+                expected_ws.iter_rows(max_col=max_col, values_only=True)
+            )
+
+
+def test_from_worksheet_drop_in():
+    path = settings.BASE_DIR / "tst_files" / "create_etabs_ok.xlsx"
+    expected = load_workbook(path, read_only=True, data_only=True)
+    workbook = StreamingWorkbook(path)
+
+    assert EtabCreateRows.from_worksheet(workbook.worksheets[0]) == EtabCreateRows.from_worksheet(
+        expected.worksheets[0]
+    )
+    assert RoleRows.from_worksheet(workbook.worksheets[1]) == RoleRows.from_worksheet(expected.worksheets[1])
+
+
+def test_missing_rows_and_cells():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "etablissements"
+    ws["A1"] = "siret"
+    ws["C1"] = True
+    ws["B4"] = 1.5
+    ws["E4"] = "ignored"
+    buffer = io.BytesIO()
+    wb.save(buffer)
+
+    rows = list(StreamingWorkbook(buffer).worksheets[0].iter_rows(min_row=1, max_col=3, values_only=True))
+
+    assert rows == [("siret", None, True), (None, None, None), (None, None, None), (None, 1.5, None)]
+
+
+def test_cells_not_supported():
+    workbook = StreamingWorkbook(settings.BASE_DIR / "tst_files" / "create_etabs_ok.xlsx")
+
+    with pytest.raises(TypeError):
+        next(workbook.worksheets[0].iter_rows(values_only=False))
+
+
+def sheet_xlsx(sheet):
+    """Xlsx file whose first sheet xml is `sheet`"""
+    wb = Workbook()
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    patched = io.BytesIO()
+    with zipfile.ZipFile(buffer) as src, zipfile.ZipFile(patched, "w") as dst:
+        for item in src.infolist():
+            data = sheet.encode() if item.filename == "xl/worksheets/sheet1.xml" else src.read(item.filename)
+            dst.writestr(item, data)
+    return patched
+
+
+def test_inline_strings():
+    sheet = (
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        '<row r="1"><c r="A1" t="inlineStr"><is><t>siret</t></is></c><c r="B1"><v>12</v></c></row>'
+        "</sheetData></worksheet>"
+    )
+
+    rows = list(StreamingWorkbook(sheet_xlsx(sheet)).worksheets[0].iter_rows(max_col=2))
+
+    assert rows == [("siret", 12)]
+
+
+def test_row_limit():
+    # no dimension, a single row far below the header
+    sheet = (
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        '<row r="1"><c r="A1"><v>1</v></c></row><row r="5000000"><c r="A5000000"><v>2</v></c></row>'
+        "</sheetData></worksheet>"
+    )
+    worksheet = StreamingWorkbook(sheet_xlsx(sheet)).worksheets[0]
+    assert worksheet.declared_rows is None
+
+    worksheet.row_limit = 10
+    rows = worksheet.iter_rows(max_col=1)
+    assert next(rows) == (1,)
+    # raised before the missing rows are padded
+    with pytest.raises(TooManyRowsException):
+        next(rows)
+
+
+def test_not_a_zip():
+    with pytest.raises(zipfile.BadZipFile):
+        StreamingWorkbook(io.BytesIO(b"siret;role\n"))
+
+
+def test_declared_rows():
+    path = settings.BASE_DIR / "tst_files" / "create_etabs_ok.xlsx"
+
+    etabs, roles = StreamingWorkbook(path).worksheets
+
+    assert etabs.declared_rows == 11
+    assert roles.declared_rows == 126
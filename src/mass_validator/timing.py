@@ -0,0 +1,93 @@
+"""
+Stage durations of an upload validation, sent back in a `Server-Timing` header, logged as one json line and recorded
+as metrics. Each stage is also a span when tracing is enabled.
+
+    timer = stage_timer(KIND_UPDATE)
+    with timer.stage("from_worksheet"):
+        ...
+    timer.count(rows=len(etab_rows))
+
+With `STAGE_TIMING_ENABLED = False`, `stage_timer` returns `NO_TIMER`, whose stages are a shared no-op context.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+from . import tracing
+from .metrics import observe_stages
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    def __init__(self, kind, clock=time.perf_counter):
+        self.kind = kind
+        self.clock = clock
+        self.started_at = clock()
+        # durations in seconds, by stage, summed when a stage runs several times
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = self.clock()
+        try:
+            with tracing.span(name, **{"upload.kind": self.kind}):
+                yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + self.clock() - start
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def server_timing(self):
+        timings = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        timings.append(f"total;dur={(self.clock() - self.started_at) * 1000:.1f}")
+        return ", ".join(timings)
+
+    def log(self):
+        line = {
+            "event": "upload_validation",
+            "kind": self.kind,
+            "total_ms": round((self.clock() - self.started_at) * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            **self.counts,
+        }
+        trace_id = tracing.current_trace_id()
+        if trace_id:
+            line["trace_id"] = trace_id
+        logger.info(json.dumps(line))
+        observe_stages(self.kind, self.stages, self.counts)
+
+    def report(self, response):
+        """Set the `Server-Timing` header of `response` and log the timings"""
+        response["Server-Timing"] = self.server_timing()
+        self.log()
+
+
+class NoTimer:
+    def stage(self, name):
+        return NO_STAGE
+
+    def count(self, **counts):
+        pass
+
+    def log(self):
+        pass
+
+    def report(self, response):
+        pass
+
+
+NO_STAGE = nullcontext()
+NO_TIMER = NoTimer()
+
+
+def stage_timer(kind):
+    if not settings.STAGE_TIMING_ENABLED:
+        return NO_TIMER
+    return StageTimer(kind)
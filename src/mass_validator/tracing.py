@@ -0,0 +1,166 @@
+"""
+OpenTelemetry traces of uploads, from the web request through celery tasks down to elasticsearch requests.
+
+Enabled by `TRACING_EXPORTER`: "console", "file" (json lines appended to `TRACING_FILE`) or "otlp" (to
+`TRACING_OTLP_ENDPOINT`). Stages timed by `timing` get a span each.
+
+The trace context travels in celery message headers, as W3C `traceparent`: tasks spans are children of the span which
+published them, preceded by a `queued` span covering the time spent waiting for a worker.
+"""
+
+import os
+import threading
+
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun, worker_process_shutdown
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+EXPORTER_CONSOLE = "console"
+EXPORTER_FILE = "file"
+EXPORTER_OTLP = "otlp"
+
+SERVICE_NAME = "td-mass-validator"
+
+NO_SPAN = trace.NonRecordingSpan(trace.INVALID_SPAN_CONTEXT)
+
+
+class FileSpanExporter(SpanExporter):
+    """Spans appended to `path` as json lines, the file is only open while spans are written"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a") as out:
+            out.writelines(span.to_json(indent=None) + "\n" for span in spans)
+        return SpanExportResult.SUCCESS
+
+
+def span_processor(exporter):
+    if exporter == EXPORTER_CONSOLE:
+        return SimpleSpanProcessor(ConsoleSpanExporter(service_name=SERVICE_NAME))
+    if exporter == EXPORTER_FILE:
+        return SimpleSpanProcessor(FileSpanExporter(settings.TRACING_FILE))
+    if exporter == EXPORTER_OTLP:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT or None))
+    raise ImproperlyConfigured(f"Unknown TRACING_EXPORTER {exporter}")
+
+
+_provider = None
+_provider_pid = None
+_provider_lock = threading.Lock()
+
+
+def get_tracer():
+    """
+    Process-wide tracer, None when tracing is disabled.
+
+    Like the elasticsearch client, the provider is not shared across a fork: batch exporters run a thread, which the
+    child process does not have.
+    """
+    global _provider, _provider_pid
+    if not settings.TRACING_EXPORTER:
+        return None
+    pid = os.getpid()
+    if _provider is None or _provider_pid != pid:
+        with _provider_lock:
+            if _provider is None or _provider_pid != pid:
+                provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+                provider.add_span_processor(span_processor(settings.TRACING_EXPORTER))
+                _provider = provider
+                _provider_pid = pid
+    return _provider.get_tracer(__name__)
+
+
+def reset_tracer():
+    """Flush and forget the current provider, a new one is built on next use"""
+    global _provider, _provider_pid
+    if _provider is not None and _provider_pid == os.getpid():
+        _provider.shutdown()
+    _provider = None
+    _provider_pid = None
+
+
+@worker_process_shutdown.connect
+def flush_spans(**kwargs):
+    # prefork children exit without running atexit handlers
+    if _provider is not None and _provider_pid == os.getpid():
+        _provider.force_flush()
+
+
+def span(name, **attributes):
+    """Context manager of a child span of the current one, yielding the span, a no-op when tracing is disabled"""
+    tracer = get_tracer()
+    if tracer is None:
+        return trace.use_span(NO_SPAN)
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+def current_trace_id():
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None
+    return trace.format_trace_id(span_context.trace_id)
+
+
+@before_task_publish.connect
+def inject_trace_context(headers=None, **kwargs):
+    if headers is not None and get_tracer() is not None:
+        propagate.inject(headers)
+
+
+_task_spans = {}
+
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    tracer = get_tracer()
+    if tracer is None:
+        return
+
+    carrier = {key: getattr(task.request, key, None) for key in ["traceparent", "tracestate"]}
+    carrier = {key: value for key, value in carrier.items() if value}
+    # eager tasks are not published, they run within the caller span
+    parent = propagate.extract(carrier) if carrier else context.get_current()
+
+    # stamped by `metrics.stamp_published_at`
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        tracer.start_span(f"queued {task.name}", context=parent, start_time=int(published_at * 1e9)).end()
+
+    task_span = tracer.start_span(
+        task.name, context=parent, kind=trace.SpanKind.CONSUMER, attributes={"celery.task_id": task_id}
+    )
+    token = context.attach(trace.set_span_in_context(task_span, parent))
+    _task_spans[task_id] = (task_span, token)
+
+
+@task_failure.connect
+def record_task_failure(task_id=None, exception=None, **kwargs):
+    item = _task_spans.get(task_id)
+    if item is not None and exception is not None:
+        item[0].record_exception(exception)
+        item[0].set_status(trace.StatusCode.ERROR)
+
+
+@task_postrun.connect
+def end_task_span(task_id=None, state=None, **kwargs):
+    item = _task_spans.pop(task_id, None)
+    if item is None:
+        return
+    task_span, token = item
+    task_span.set_attribute("celery.state", state or "")
+    context.detach(token)
+    task_span.end()
@@ -0,0 +1,98 @@
+import asyncio
+
+from django.conf import settings
+from elasticsearch7 import AsyncElasticsearch
+
+from ..metrics import elasticsearch_request
+from ..tracing import span
+from .helpers import chunks
+from .search_api import CERT_PATH, SiretSearchError, msearch_body, read_responses, resolve_statuses, retry_delay
+
+
+def get_async_client():
+    """Client bound to the running event loop, its pool is sized after the allowed concurrency"""
+    return AsyncElasticsearch(
+        settings.TD_COMPANY_ELASTICSEARCH_URL,
+        ca_certs=CERT_PATH,
+        maxsize=settings.SIRET_CHECK_CONCURRENCY,
+        timeout=settings.TD_COMPANY_ELASTICSEARCH_TIMEOUT,
+        max_retries=settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES,
+        retry_on_timeout=settings.TD_COMPANY_ELASTICSEARCH_RETRY_ON_TIMEOUT,
+    )
+
+
+async def search_statuses_async(es, sirets):
+    """Async counterpart of `search_api.search_statuses`"""
+    statuses = {}
+    pending = list(sirets)
+    for attempt in range(settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(retry_delay(attempt))
+        with (
+            span("elasticsearch msearch", **{"db.system": "elasticsearch", "sirets.count": len(pending)}),
+            elasticsearch_request(len(pending)),
+        ):
+            resp = await es.msearch(body=msearch_body(pending), index=settings.TD_COMPANY_ELASTICSEARCH_INDEX)
+        fetched, pending = read_responses(pending, resp["responses"])
+        statuses.update(fetched)
+        if not pending:
+            return statuses
+    raise SiretSearchError(pending, statuses)
+
+
+async def search_chunks_async(sirets, on_fetched):
+    """Search `sirets` by chunks, at most `SIRET_CHECK_CONCURRENCY` msearch requests being in flight at once"""
+    semaphore = asyncio.Semaphore(settings.SIRET_CHECK_CONCURRENCY)
+    es = get_async_client()
+
+    async def search(chunk):
+        async with semaphore:
+            try:
+                statuses = await search_statuses_async(es, chunk)
+            except SiretSearchError as error:
+                on_fetched(error.statuses)
+                raise
+        on_fetched(statuses)
+
+    tasks = [asyncio.ensure_future(search(chunk)) for chunk in chunks(sirets, settings.SIRET_CHECK_CHUNK_SIZE)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # a failed search leaves its siblings running, they are cancelled before the client is closed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await es.close()
+
+
+def fetch_statuses_async(sirets, on_fetched):
+    """Async transport of `search_api.resolve_statuses`"""
+    asyncio.run(search_chunks_async(sirets, on_fetched))
+
+
+def check_sirets_async(data, on_progress=None):
+    """
+    Run the async engine from sync code, errors are returned in `data` order.
+
+    :param data: [{"siret": row.siret, "row_number": row.index}]
+    :param on_progress: called with the number of rows checked and rows in error so far
+    """
+    rows_per_siret = {}
+    for el in data:
+        rows_per_siret[el["siret"]] = rows_per_siret.get(el["siret"], 0) + 1
+    rows_done = 0
+    rows_in_error = 0
+
+    def on_resolved(statuses):
+        nonlocal rows_done, rows_in_error
+        for siret, status in statuses.items():
+            rows_done += rows_per_siret[siret]
+            if not status:
+                rows_in_error += rows_per_siret[siret]
+        if on_progress:
+            on_progress(rows_done, rows_in_error)
+
+    statuses = resolve_statuses(list(rows_per_siret), fetch_statuses_async, on_resolved=on_resolved)
+    if on_progress and rows_done < len(data):
+        on_progress(len(data), len(data) - rows_done + rows_in_error)
+    return [el for el in data if not statuses.get(el["siret"])]
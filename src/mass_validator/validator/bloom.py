@@ -0,0 +1,110 @@
+import math
+import mmap
+import os
+import struct
+from hashlib import blake2b
+
+from django.conf import settings
+
+MAGIC = b"TDBLOOM1"
+# magic, number of bits, number of hashes, number of items
+HEADER = struct.Struct("<8sQIQ")
+
+POLICY_ACCEPT = "accept"
+POLICY_CONFIRM = "confirm"
+
+
+def optimal_parameters(capacity, error_rate):
+    """Bits and hashes count for `capacity` items at `error_rate` false positive probability"""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+def positions(item, bits, hashes):
+    """Kirsch-Mitzenmacher double hashing: h1 + i * h2"""
+    digest = blake2b(item.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def build_bloom_filter(items, path, capacity, error_rate=0.001):
+    """
+    Write a bloom filter of `items` to `path`, sized for `capacity` items.
+
+    The file is written beside `path` then moved in place. Returns the number of items added.
+    """
+    bits, hashes = optimal_parameters(capacity, error_rate)
+    array = bytearray((bits + 7) // 8)
+    count = 0
+    for item in items:
+        for position in positions(item, bits, hashes):
+            array[position >> 3] |= 1 << (position & 7)
+        count += 1
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, bits, hashes, count))
+        f.write(array)
+    os.replace(tmp_path, path)
+    return count
+
+
+class BloomFilter:
+    """
+    Read-only, memory-mapped bloom filter.
+
+    Pages are mapped from the page cache, prefork children share a single copy of the filter.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.bits, self.hashes, self.count = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a siret bloom filter")
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, item):
+        mm = self.mm
+        offset = HEADER.size
+        for position in positions(item, self.bits, self.hashes):
+            if not mm[offset + (position >> 3)] & (1 << (position & 7)):
+                self.misses += 1
+                return False
+        self.hits += 1
+        return True
+
+    def stats(self):
+        return {"items": self.count, "size": len(self.mm), "hits": self.hits, "misses": self.misses}
+
+
+_bloom = None
+
+
+def get_bloom_filter():
+    global _bloom
+    path = settings.SIRET_BLOOM_FILTER_PATH
+    if not path:
+        return None
+    if _bloom is None or _bloom.path != str(path):
+        _bloom = BloomFilter(path)
+    return _bloom
+
+
+def bloom_statuses(sirets):
+    """
+    {siret: is_active} of the sirets the bloom filter policy trusts it for.
+
+    "accept" trusts probable hits as active, definite misses are left out for the full lookup path, as the filter may
+    be older than the index. "confirm" trusts definite misses as inactive, probable hits are left out to be confirmed.
+    """
+    bloom = get_bloom_filter()
+    if bloom is None:
+        return {}
+    if settings.SIRET_BLOOM_POLICY == POLICY_CONFIRM:
+        return {siret: False for siret in sirets if siret not in bloom}
+    return {siret: True for siret in sirets if siret in bloom}
@@ -77,5 +77,27 @@ MAX_ETAB_CREATE_COL = 7
 MAX_ETAB_UPDATE_COL = 5
 MIN_ROLE_ROW = 1
 MAX_ROLE_COL = 3
+# above, files are only accepted in large-file mode
+MAX_ETAB_ROWS = 500
+SIRET_LENGTH = 14
+# La Poste establishments share this siren, their sirets don't follow the Luhn checksum
+LA_POSTE_SIREN = "356000000"
+# Trackdéchets test establishments, not registered in SIRENE
+TEST_SIRET_PREFIX = "000000"
+
+# SIRENE etatAdministratifEtablissement of open establishments
+ACTIVE = "A"
 ERROR_STR = "💣 [red]Error[/red]"
 VALID_STR = "[green]✔[/green]"
+
+ERROR_FIELD = "field"
+ERROR_SIRET_MISSING_FROM_ETAB = "siret_missing_from_etab"
+ERROR_SIRET_HAS_NO_ADMIN = "siret_has_no_admin"
+ERROR_DUPLICATE_ROLE = "duplicate_role"
+
+ERROR_TYPES = [
+    ERROR_FIELD,
+    ERROR_SIRET_MISSING_FROM_ETAB,
+    ERROR_SIRET_HAS_NO_ADMIN,
+    ERROR_DUPLICATE_ROLE,
+]
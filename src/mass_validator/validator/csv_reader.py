@@ -0,0 +1,103 @@
+"""
+Streaming csv reader.
+
+Csv files are read record by record, whatever their size only one record is held in memory. Encoding and dialect are
+guessed from the first bytes of the file. A csv file holds a single sheet, titled after `title`.
+"""
+
+import codecs
+import csv
+import io
+
+from .xlsx_reader import TooManyRowsException
+
+SAMPLE_SIZE = 64 * 1024
+DELIMITERS = ";,\t|"
+
+
+def detect_encoding(sample):
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # the sample may end in the middle of a multibyte character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return "cp1252"
+    return "utf-8"
+
+
+def detect_dialect(text):
+    """The delimiter is read from the header line, list values holding commas would fool the sniffer otherwise"""
+    header = text.partition("\n")[0]
+    delimiter = max(DELIMITERS, key=header.count)
+    if not header.count(delimiter):
+        delimiter = ";"  # what french spreadsheets export by default
+    try:
+        return csv.Sniffer().sniff(text, delimiters=delimiter)
+    except csv.Error:
+        return type("Dialect", (csv.excel,), {"delimiter": delimiter})
+
+
+class CsvWorksheet:
+    # rows counts are not announced, see `StreamingWorksheet.declared_rows`
+    declared_rows = None
+    # see `StreamingWorksheet.row_limit`
+    row_limit = None
+
+    def __init__(self, workbook, title):
+        self.workbook = workbook
+        self.title = title
+
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True):
+        """Yield rows as tuples of values, empty strings being read as None, see `StreamingWorksheet.iter_rows`"""
+        if not values_only:
+            raise TypeError("Streaming worksheets only yield values, values_only must be True")
+
+        file = self.workbook.file
+        file.seek(0)
+        text = io.TextIOWrapper(file, encoding=self.workbook.encoding, newline="")
+        try:
+            for row_number, record in enumerate(csv.reader(text, self.workbook.dialect), start=1):
+                if max_row is not None and row_number > max_row:
+                    break
+                if self.row_limit is not None and row_number > self.row_limit:
+                    raise TooManyRowsException(f"{self.title} has rows past {self.row_limit}")
+                if row_number < min_row:
+                    continue
+                values = tuple(value or None for value in record[:max_col])
+                if max_col:
+                    values += (None,) * (max_col - len(values))
+                yield values
+        finally:
+            # leave the underlying file open, it belongs to the caller
+            text.detach()
+
+
+class CsvWorkbook:
+    """
+    Read-only workbook exposing `sheetnames` and `worksheets` like openpyxl does.
+
+    :param file: binary file-like object, seekable
+    :param title: title of the single worksheet
+    """
+
+    def __init__(self, file, title):
+        self.file = getattr(file, "file", file)  # django uploaded files wrap the actual file object
+
+        self.file.seek(0)
+        sample = self.file.read(SAMPLE_SIZE)
+        self.file.seek(0)
+        if b"\x00" in sample:
+            raise ValueError("Binary file")
+
+        self.encoding = detect_encoding(sample)
+        decoded = codecs.getincrementaldecoder(self.encoding)(errors="replace").decode(sample, final=False)
+        self.dialect = detect_dialect(decoded)
+        self.worksheets = [CsvWorksheet(self, title)]
+
+    @property
+    def sheetnames(self):
+        return [ws.title for ws in self.worksheets]
+
+    def close(self):
+        pass
@@ -0,0 +1,68 @@
+"""
+Email addresses validation, same rules as django's `EmailValidator`, memoized.
+
+Role sheets repeat the same addresses across sirets, and most addresses share a handful of domains: results are kept in a
+bounded LRU keyed by address, domain part checks in another one keyed by domain.
+"""
+
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.validators import EmailValidator
+
+# RFC 3696 section 3
+MAX_LENGTH = 320
+
+
+class EmailChecker:
+    def __init__(self, maxsize, domain_maxsize):
+        self.validator = EmailValidator()
+        # django regexes are lazy objects, each attribute access goes through a proxy
+        self.user_re = re.compile(self.validator.user_regex.pattern, self.validator.user_regex.flags)
+        self.is_valid = lru_cache(maxsize=maxsize)(self.check_address)
+        self.domain_is_valid = lru_cache(maxsize=domain_maxsize)(self.check_domain)
+
+    def check_address(self, email):
+        if not email or "@" not in email or len(email) > MAX_LENGTH:
+            return False
+
+        user_part, domain_part = email.rsplit("@", 1)
+        if not self.user_re.match(user_part):
+            return False
+        return domain_part in self.validator.domain_allowlist or self.domain_is_valid(domain_part)
+
+    def check_domain(self, domain_part):
+        return self.validator.validate_domain_part(domain_part)
+
+    def stats(self):
+        """Counters of the current process"""
+        stats = {}
+        for name, cached in [("address", self.is_valid), ("domain", self.domain_is_valid)]:
+            info = cached.cache_info()
+            lookups = info.hits + info.misses
+            stats[name] = {
+                "hits": info.hits,
+                "misses": info.misses,
+                "size": info.currsize,
+                "hit_rate": round(info.hits / lookups, 3) if lookups else None,
+            }
+        return stats
+
+    def clear(self):
+        self.is_valid.cache_clear()
+        self.domain_is_valid.cache_clear()
+
+
+_checker = None
+
+
+def get_email_checker():
+    global _checker
+    if _checker is None:
+        _checker = EmailChecker(settings.EMAIL_CHECK_CACHE_MAXSIZE, settings.EMAIL_CHECK_DOMAIN_CACHE_MAXSIZE)
+    return _checker
+
+
+def email_is_valid(email):
+    return get_email_checker().is_valid(email)
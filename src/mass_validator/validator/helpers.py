@@ -1,7 +1,24 @@
 import os
+from functools import lru_cache
 from itertools import islice
 
-from mass_validator.validator.constants import TYPES_FIELDS
+from mass_validator.validator.constants import (
+    COLLECTOR_TYPES,
+    COMPANY_TYPES,
+    LA_POSTE_SIREN,
+    SIRET_LENGTH,
+    TEST_SIRET_PREFIX,
+    TYPES_FIELDS,
+    USER_ROLES,
+    WASTE_PROCESSOR_TYPES,
+    WASTE_VEHICLE_TYPES,
+)
+
+# rows share these strings instead of holding their own copies
+KNOWN_VALUES = {
+    value: value
+    for value in COMPANY_TYPES + COLLECTOR_TYPES + WASTE_PROCESSOR_TYPES + WASTE_VEHICLE_TYPES + USER_ROLES
+}
 
 
 def quote(v):
@@ -16,58 +33,113 @@ def format_csv_row(lst):
     return f + ";" + os.linesep
 
 
+def chunks(lst, size):
+    """Split `lst` in successive lists of at most `size` items"""
+    for i in range(0, len(lst), size):
+        yield lst[i : i + size]
+
+
+def iter_chunks(iterable, size):
+    """Like `chunks`, for iterables which can't be sliced, e.g. worksheet rows"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def luhn_checksum_is_valid(digits):
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if i % 2:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
+
+
+def siret_is_well_formed(siret):
+    """14 digits passing the Luhn checksum, La Poste sirets digits sum being a multiple of 5 instead"""
+    siret = str(siret)
+    if len(siret) != SIRET_LENGTH or not siret.isdigit():
+        return False
+    if siret.startswith(TEST_SIRET_PREFIX):
+        return True
+    if siret.startswith(LA_POSTE_SIREN):
+        return sum(int(digit) for digit in siret) % 5 == 0
+    return luhn_checksum_is_valid(siret)
+
+
 def phone_formatter(phone):
     """0612345678 -> 06 12 34 56 78"""
-    chunks = []
-    iterator = iter(phone)
-    while chunk := "".join(islice(iterator, 2)):
-        chunks.append(chunk)
-    return " ".join(chunks)
-
-
-def process_field(value, field_name):
-    """Preprocess fields to avoid manual fixes"""
-    if value is None:
-        return value
-    if field_name == "role":
-        return str(value).upper().strip()
-    if field_name == "contactPhone":
-        cleaned = (
-            str(value)
-            .replace(" ", "")
-            .replace("/", "")
-            .replace("\u200b", "")
-            .replace(".", "")
-            .replace(",", "")
-            .strip()
-        )
-
-        # is 0 missing due to any excel joke?
-        if len(cleaned) == 9 and not cleaned.startswith("0"):
-            cleaned = f"0{cleaned}"
-        return phone_formatter(cleaned)
-    if field_name in TYPES_FIELDS:
-        return str(value).replace(" ", "").upper().split(",")
-    if field_name in ["email", "contactEmail"]:
-        return str(value).replace(" ", "").strip().lower()
-    if field_name == "siret":
-        return str(value).replace(" ", "").replace(".", "").strip().lower()
-    return str(value).strip()
+    return " ".join([phone[i : i + 2] for i in range(0, len(phone), 2)])
 
 
 def clean_from_funky_chars(value):
     """Yes, our customers are that funny"""
-    if not isinstance(value, str):
-        return value
     return value.replace("\u200b", "").replace("\xa0", "")
 
 
-def dict_read(row, fields_config):
-    """Co,vert row read form openpyxl to dict according to field_config file names"""
-    data = {}
+# Preprocess fields to avoid manual fixes. Normalizers are only called with filled cells.
+
+
+def normalize_text(value):
+    return clean_from_funky_chars(str(value).strip())
+
+
+def normalize_role(value):
+    role = clean_from_funky_chars(str(value).upper().strip())
+    return KNOWN_VALUES.get(role, role)
+
+
+def normalize_phone(value):
+    cleaned = (
+        str(value).replace(" ", "").replace("/", "").replace("\u200b", "").replace(".", "").replace(",", "").strip()
+    )
+
+    # is 0 missing due to any excel joke?
+    if len(cleaned) == 9 and not cleaned.startswith("0"):
+        cleaned = f"0{cleaned}"
+    return clean_from_funky_chars(phone_formatter(cleaned))
+
+
+def normalize_types(value):
+    return [KNOWN_VALUES.get(c_type, c_type) for c_type in str(value).replace(" ", "").upper().split(",")]
+
+
+def normalize_email(value):
+    return clean_from_funky_chars(str(value).replace(" ", "").strip().lower())
+
+
+def normalize_siret(value):
+    return clean_from_funky_chars(str(value).replace(" ", "").replace(".", "").strip().lower())
+
+
+FIELD_NORMALIZERS = {
+    "role": normalize_role,
+    "contactPhone": normalize_phone,
+    "email": normalize_email,
+    "contactEmail": normalize_email,
+    "siret": normalize_siret,
+    **{field_name: normalize_types for field_name in TYPES_FIELDS},
+}
+
+
+@lru_cache
+def column_normalizers(fields):
+    """Normalizer of each column of a sheet laid out as `fields`, a tuple"""
+    return tuple(FIELD_NORMALIZERS.get(field_name, normalize_text) for field_name in fields)
+
 
-    for i, cell in enumerate(row):
-        field_name = fields_config[i]
+def dict_read(row, fields_config, normalizers=None):
+    """
+    Convert a row of values to dict according to field_config file names.
 
-        data[field_name] = clean_from_funky_chars(process_field(cell.value, field_name))
-    return data
+    :param normalizers: `column_normalizers(fields_config)`, resolved once per sheet by callers reading many rows
+    """
+    if normalizers is None:
+        normalizers = column_normalizers(tuple(fields_config))
+    return {
+        field_name: None if value is None else normalize(value)
+        for field_name, normalize, value in zip(fields_config, normalizers, row)
+    }
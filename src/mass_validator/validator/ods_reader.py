@@ -0,0 +1,155 @@
+"""
+Streaming ods reader.
+
+`content.xml` is iterparsed out of the zip archive and rows come out as plain tuples of values, like the xlsx reader.
+Repeated rows and cells are expanded lazily so the million empty rows spreadsheets append to a table cost nothing.
+Repeats are counted rather than looped over, and only expanded up to `max_col` columns and the worksheet `row_limit`.
+"""
+
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from .xlsx_reader import TooManyRowsException, cast_number
+
+TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+OFFICE_NS = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+
+CONTENT_PATH = "content.xml"
+
+TABLE_TAG = f"{{{TABLE_NS}}}table"
+ROW_TAG = f"{{{TABLE_NS}}}table-row"
+CELL_TAGS = {f"{{{TABLE_NS}}}table-cell", f"{{{TABLE_NS}}}covered-table-cell"}
+PARAGRAPH_TAG = f"{{{TEXT_NS}}}p"
+NAME_ATTR = f"{{{TABLE_NS}}}name"
+ROWS_REPEATED_ATTR = f"{{{TABLE_NS}}}number-rows-repeated"
+COLUMNS_REPEATED_ATTR = f"{{{TABLE_NS}}}number-columns-repeated"
+VALUE_TYPE_ATTR = f"{{{OFFICE_NS}}}value-type"
+VALUE_ATTR = f"{{{OFFICE_NS}}}value"
+BOOLEAN_VALUE_ATTR = f"{{{OFFICE_NS}}}boolean-value"
+DATE_VALUE_ATTR = f"{{{OFFICE_NS}}}date-value"
+TIME_VALUE_ATTR = f"{{{OFFICE_NS}}}time-value"
+
+NUMBER_TYPES = {"float", "percentage", "currency"}
+
+# columns of a LibreOffice sheet, wider repeats are cut when no `max_col` is given
+MAX_COLUMNS = 16384
+
+
+def cell_value(cell):
+    value_type = cell.get(VALUE_TYPE_ATTR)
+    if value_type is None:
+        return None
+    if value_type in NUMBER_TYPES:
+        return cast_number(cell.get(VALUE_ATTR))
+    if value_type == "boolean":
+        return cell.get(BOOLEAN_VALUE_ATTR) == "true"
+    if value_type == "date":
+        return cell.get(DATE_VALUE_ATTR)
+    if value_type == "time":
+        return cell.get(TIME_VALUE_ATTR)
+    return "\n".join("".join(p.itertext()) for p in cell.iter(PARAGRAPH_TAG)) or None
+
+
+def row_values(row, max_col):
+    values = []
+    pending = 0  # empty cells are only materialized when followed by a value
+    width = max_col or MAX_COLUMNS
+    for cell in row:
+        if cell.tag not in CELL_TAGS:
+            continue
+        repeat = min(int(cell.get(COLUMNS_REPEATED_ATTR, 1)), width)
+        value = cell_value(cell)
+        if value is None:
+            pending += repeat
+        else:
+            values.extend([None] * pending)
+            values.extend([value] * repeat)
+            pending = 0
+        if len(values) + pending >= width:
+            break
+
+    if max_col:
+        return tuple(values[:max_col]) + (None,) * (max_col - len(values))
+    return tuple(values)
+
+
+class OdsWorksheet:
+    # rows counts are not announced, see `StreamingWorksheet.declared_rows`
+    declared_rows = None
+    # see `StreamingWorksheet.row_limit`
+    row_limit = None
+
+    def __init__(self, workbook, title):
+        self.workbook = workbook
+        self.title = title
+
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True):
+        """Yield rows as tuples of values, see `StreamingWorksheet.iter_rows`"""
+        if not values_only:
+            raise TypeError("Streaming worksheets only yield values, values_only must be True")
+
+        empty_row = (None,) * max_col if max_col else ()
+        row_number = 0
+        pending = 0  # empty rows are only yielded when followed by a row with values
+        in_table = False
+
+        with self.workbook.archive.open(CONTENT_PATH) as source:
+            for event, element in iterparse(source, events=("start", "end")):
+                if element.tag == TABLE_TAG:
+                    if event == "start":
+                        in_table = element.get(NAME_ATTR) == self.title
+                    elif in_table:
+                        return
+                    continue
+                if event != "end" or element.tag != ROW_TAG or not in_table:
+                    continue
+
+                repeat = int(element.get(ROWS_REPEATED_ATTR, 1))
+                values = row_values(element, max_col)
+                element.clear()
+
+                first = row_number + 1
+                row_number += repeat
+                last = row_number if max_row is None else min(row_number, max_row)
+                count = max(last - max(first, min_row) + 1, 0)
+                if not any(value is not None for value in values):
+                    # trailing empty rows are never yielded, however many a table ends with
+                    pending += count
+                elif count:
+                    if self.row_limit is not None and last > self.row_limit:
+                        raise TooManyRowsException(f"{self.title} has rows past {self.row_limit}")
+                    for _ in range(pending):
+                        yield empty_row
+                    pending = 0
+                    for _ in range(count):
+                        yield values
+                if max_row is not None and row_number >= max_row:
+                    return
+
+
+class OdsWorkbook:
+    """
+    Read-only workbook exposing `sheetnames` and `worksheets` like openpyxl does.
+
+    :param file: path or file-like object of an ods file
+    """
+
+    def __init__(self, file):
+        self.archive = zipfile.ZipFile(file)
+
+        titles = []
+        with self.archive.open(CONTENT_PATH) as source:
+            for event, element in iterparse(source, events=("start", "end")):
+                if event == "start" and element.tag == TABLE_TAG:
+                    titles.append(element.get(NAME_ATTR))
+                elif event == "end" and element.tag == ROW_TAG:
+                    element.clear()
+        self.worksheets = [OdsWorksheet(self, title) for title in titles]
+
+    @property
+    def sheetnames(self):
+        return [ws.title for ws in self.worksheets]
+
+    def close(self):
+        self.archive.close()
@@ -1,17 +1,22 @@
-import re
 from itertools import chain
 
 import attr
-from django.core.exceptions import ValidationError
-from django.core.validators import EmailValidator
+from django.conf import settings
 
+from .columnar import ENGINE_COLUMNAR, failing_checks
 from .constants import (
     COLLECTOR_TYPES,
     COMPANY_TYPES,
+    ERROR_DUPLICATE_ROLE,
+    ERROR_FIELD,
+    ERROR_SIRET_HAS_NO_ADMIN,
+    ERROR_SIRET_MISSING_FROM_ETAB,
     ERROR_STR,
+    ERROR_TYPES,
     ETABLISSEMENTS_CREATE_FIELDS,
     ETABLISSEMENTS_UPDATE_FIELDS,
     MAX_ETAB_CREATE_COL,
+    MAX_ETAB_ROWS,
     MAX_ETAB_UPDATE_COL,
     MAX_ROLE_COL,
     MIN_ETAB_ROW,
@@ -22,7 +27,8 @@ from .constants import (
     WASTE_PROCESSOR_TYPES,
     WASTE_VEHICLE_TYPES,
 )
-from .helpers import dict_read, format_csv_row, quote
+from .helpers import column_normalizers, dict_read, format_csv_row, quote
+from .schema import ETAB_CREATE_CHECKS, ETAB_UPDATE_CHECKS, ROLE_CHECKS, etab_siret_check
 
 company_types = ",".join(COMPANY_TYPES)
 collector_types = ",".join(COLLECTOR_TYPES)
@@ -30,33 +36,48 @@ waste_processor_types = ",".join(WASTE_PROCESSOR_TYPES)
 waste_vehicles_types = ",".join(WASTE_VEHICLE_TYPES)
 user_roles = ",".join(USER_ROLES)
 
-phone_re = re.compile(r"^(0[1-9])(?:[ _.-]?(\d{2})){4}$")
-
 ETABLISSEMENTS_TAB = "Établissements"
 ROLES_TAB = "Rôles"
 
-ERROR_FIELD = "field"
-ERROR_SIRET_MISSING_FROM_ETAB = "siret_missing_from_etab"
-ERROR_SIRET_HAS_NO_ADMIN = "siret_has_no_admin"
-ERROR_DUPLICATE_ROLE = "duplicate_role"
-
-ERROR_TYPES = [
-    ERROR_FIELD,
-    ERROR_SIRET_MISSING_FROM_ETAB,
-    ERROR_SIRET_HAS_NO_ADMIN,
-    ERROR_DUPLICATE_ROLE,
-]
+# shared by rows without errors, which are most of them
+NO_ERRORS = ()
 
 
 class BaseRow:
+    # rows are slotted, a big file holds hundreds of thousands of them
+    __slots__ = ()
+
     @property
     def is_valid(self):
         if not self.validated:
             raise Exception("Not validated yet")
         return not self.errors
 
-    def siret_is_valid(self):
-        return len(str(self.siret)) == 14
+    def add_error(self, error):
+        if self.errors is NO_ERRORS:
+            self.errors = []
+        self.errors.append(error)
+
+    def add_check_error(self, check):
+        self.add_error(
+            RowError(
+                row_number=self.index,
+                field_name=check.field_name,
+                field_value=getattr(self, check.field_name),
+                tab=self.tab_name,
+                error_type=check.error_type,
+            )
+        )
+
+    def validate_fields(self, checks):
+        """Run `checks` compiled from a `schema`, errors come in their order"""
+        for check in checks:
+            if not check.row_is_valid(self):
+                self.add_check_error(check)
+        self.validated = True
+
+    def validate(self, *args):
+        self.validate_fields(self.column_checks(*args))
 
     @classmethod
     def from_dict(cls, idx, the_dict):
@@ -67,9 +88,49 @@ class BaseRow:
 
 
 class BaseRows:
+    # worksheet layout, set by subclasses
+    row_class = None
+    fields = None
+    min_row = None
+    max_col = None
+
     def __iter__(self):
         yield from self.rows
 
+    @classmethod
+    def iter_worksheet(cls, worksheet):
+        """Yield non empty rows one by one, the header row being skipped"""
+        idx = 1
+        normalizers = column_normalizers(tuple(cls.fields))
+        for row in worksheet.iter_rows(min_row=cls.min_row, max_col=cls.max_col, values_only=True):
+            data = dict_read(row, cls.fields, normalizers)
+
+            if idx != 1:
+                row = cls.row_class.from_dict(idx, data)
+
+                if row:
+                    yield row
+            idx += 1
+
+    @classmethod
+    def from_worksheet(cls, worksheet):
+        return cls(rows=list(cls.iter_worksheet(worksheet)))
+
+    @classmethod
+    def validate_rows(cls, rows, *args):
+        """Validate `rows` with the engine picked by `VALIDATION_ENGINE`, see `columnar`"""
+        checks = cls.row_class.column_checks(*args)
+        if settings.VALIDATION_ENGINE != ENGINE_COLUMNAR:
+            for row in rows:
+                row.validate_fields(checks)
+            return
+
+        failures = failing_checks(rows, checks)
+        for position, row in enumerate(rows):
+            for check in failures.get(position, []):
+                row.add_check_error(check)
+            row.validated = True
+
     def append(self, row):
         if not self.header:
             self.header = row
@@ -81,7 +142,7 @@ class BaseRows:
         return chain.from_iterable(errors)
 
 
-@attr.s()
+@attr.s(slots=True)
 class RowError:
     row_number = attr.ib()
     field_name = attr.ib()
@@ -103,9 +164,19 @@ class RowError:
     def as_str(self):
         return f"{self.field_name.capitalize()} error on row n°{self.row_number} value={self.field_value}"
 
+    def as_dict(self):
+        """What error tables display, json serializable for task results"""
+        return {
+            "tab": self.tab,
+            "row_number": self.row_number,
+            "field_name": self.field_name,
+            "displayable_value": self.displayable_value,
+            "verbose": self.verbose,
+        }
+
     def verbose_error_field(self):
         error_config = {
-            "siret": "Format de siret incorrect, un siret est composé de 14 chiffres",
+            "siret": "Format de siret incorrect, un siret est composé de 14 chiffres et sa clé de contrôle doit être valide",
             "companyTypes": f"Le champ companyTypes accepte uniquement les valeurs {company_types} séparées par des virgules",
             "collectorTypes": f"Le champ collectorTypes accepte uniquement les valeurs {collector_types} séparées par des virgules. Le champ companyTypes doit contenir COLLECTOR.",
             "wasteProcessorTypes": f"Le champ collectorTypes accepte uniquement les valeurs {waste_processor_types} séparées par des virgules.Le champ companyTypes doit contenir WASTE_PROCESSOR.",
@@ -137,7 +208,7 @@ class RowError:
         return self.verbose_error_field()
 
 
-@attr.s()
+@attr.s(slots=True)
 class SiretError:
     siret = attr.ib()
     row_number = attr.ib()
@@ -147,7 +218,7 @@ class SiretError:
         return "Ce siret est non diffusible"
 
 
-@attr.s()
+@attr.s(slots=True)
 class EtabCreateRow(BaseRow):
     index = attr.ib()
     siret = attr.ib(default="")
@@ -162,10 +233,14 @@ class EtabCreateRow(BaseRow):
     contact = attr.ib(default="")
     website = attr.ib(default="")
 
-    errors = attr.ib(default=attr.Factory(list))
+    errors = attr.ib(default=NO_ERRORS)
     validated = attr.ib(default=False)
     tab_name = ETABLISSEMENTS_TAB
 
+    @classmethod
+    def column_checks(cls):
+        return ETAB_CREATE_CHECKS
+
     def as_str(self):
         return f"{self.siret} {self.givenName} {self.contactEmail}"
 
@@ -202,118 +277,9 @@ class EtabCreateRow(BaseRow):
         ]
         return format_csv_row(quoted)
 
-    def company_types_are_valid(self):
-        if not self.companyTypes:
-            return False
-        return all([c_type in COMPANY_TYPES for c_type in self.companyTypes])
-
-    def collector_types_are_valid(self):
-        if not self.collectorTypes:
-            return True
-        if "COLLECTOR" not in self.companyTypes:
-            return False
-        return all([c_type in COLLECTOR_TYPES for c_type in self.collectorTypes])
-
-    def waste_processor_types_are_valid(self):
-        if not self.wasteProcessorTypes:
-            return True
-        if "WASTEPROCESSOR" not in self.companyTypes:
-            return False
-
-        return all([c_type in WASTE_PROCESSOR_TYPES for c_type in self.wasteProcessorTypes])
-
-    def waste_vehicle_types_are_valid(self):
-        if not self.wasteVehiclesTypes:
-            return True
-        if "WASTE_VEHICLES" not in self.companyTypes:
-            return False
-        return all([c_type in WASTE_VEHICLE_TYPES for c_type in self.wasteVehiclesTypes])
-
-    def phone_number_is_valid(self):
-        if not self.contactPhone:
-            return True
-        return phone_re.match(self.contactPhone) is not None
-
-    def email_is_valid(self):
-        if not self.contactEmail:
-            return True
-        try:
-            EmailValidator()(
-                self.contactEmail,
-            )
-            return True
-        except ValidationError:
-            return False
-
-    def validate(self):
-        if not self.siret_is_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="siret",
-                    field_value=self.siret,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.company_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="companyTypes",
-                    field_value=self.companyTypes,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.collector_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="collectorTypes",
-                    field_value=self.collectorTypes,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.waste_processor_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="wasteProcessorTypes",
-                    field_value=self.wasteProcessorTypes,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.waste_vehicle_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="wasteVehiclesTypes",
-                    field_value=self.wasteVehiclesTypes,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.phone_number_is_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="contactPhone",
-                    field_value=self.contactPhone,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.email_is_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="contactEmail",
-                    field_value=self.contactEmail,
-                    tab=self.tab_name,
-                )
-            )
-        self.validated = True
-
     def validate_has_admin(self, admin_sirets):
         if self.siret not in admin_sirets:
-            self.errors.append(
+            self.add_error(
                 RowError(
                     row_number=self.index,
                     field_name="siret",
@@ -327,6 +293,11 @@ class EtabCreateRow(BaseRow):
 
 @attr.s()
 class EtabCreateRows(BaseRows):
+    row_class = EtabCreateRow
+    fields = ETABLISSEMENTS_CREATE_FIELDS
+    min_row = MIN_ETAB_ROW
+    max_col = MAX_ETAB_CREATE_COL
+
     header = attr.ib(default="")
     rows = attr.ib(default=attr.Factory(list))
     is_valid = attr.ib(default=False)
@@ -349,11 +320,11 @@ class EtabCreateRows(BaseRows):
         if len(self.rows) < 10:
             self.has_enough_rows = False
             return
-        if len(self.rows) > 500:
+        if len(self.rows) > MAX_ETAB_ROWS:
             self.has_too_many_rows = True
             return
+        self.validate_rows(self.rows)
         for row in self:
-            row.validate()
             if not row.is_valid:
                 self.is_valid = False
 
@@ -370,33 +341,22 @@ class EtabCreateRows(BaseRows):
             ret.append(row.as_csv())
         return ret
 
-    @classmethod
-    def from_worksheet(cls, worksheet):
-        etab_rows = []
-        idx = 1
-        for row in worksheet.iter_rows(min_row=MIN_ETAB_ROW, max_col=MAX_ETAB_CREATE_COL):
-            data = dict_read(row, ETABLISSEMENTS_CREATE_FIELDS)
-
-            if idx != 1:
-                etab_row = EtabCreateRow.from_dict(idx, data)
-
-                if etab_row:
-                    etab_rows.append(etab_row)
-            idx += 1
-
-        return cls(rows=etab_rows)
 
-
-@attr.s()
+@attr.s(slots=True)
 class RoleRow(BaseRow):
     index = attr.ib()
     siret = attr.ib()
     email = attr.ib()
     role = attr.ib()
-    errors = attr.ib(default=attr.Factory(list))
+    errors = attr.ib(default=NO_ERRORS)
     validated = attr.ib(default=False)
     tab_name = ROLES_TAB
 
+    @classmethod
+    def column_checks(cls, etab_sirets):
+        role_check, siret_check, email_check = ROLE_CHECKS
+        return [role_check, siret_check, etab_siret_check(etab_sirets), email_check]
+
     def as_str(self):
         return f"{self.siret} {self.role} {self.email}"
 
@@ -417,66 +377,8 @@ class RoleRow(BaseRow):
         ]
         return format_csv_row(quoted)
 
-    def role_is_valid(self):
-        return self.role in ["MEMBER", "ADMIN"]
-
-    def siret_belongs_to(self, etab_sirets):
-        return self.siret in etab_sirets
-
-    def email_is_valid(self):
-        if not self.email:
-            return False
-
-        try:
-            EmailValidator()(
-                self.email,
-            )
-            return True
-        except ValidationError:
-            return False
-
-    def validate(self, etab_sirets):
-        if not self.role_is_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="role",
-                    field_value=self.role,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.siret_is_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="siret",
-                    field_value=self.siret,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.siret_belongs_to(etab_sirets):
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="siret",
-                    field_value=self.siret,
-                    tab=ROLES_TAB,
-                    error_type=ERROR_SIRET_MISSING_FROM_ETAB,
-                )
-            )
-        if not self.email_is_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="email",
-                    field_value=self.email,
-                    tab=self.tab_name,
-                )
-            )
-        self.validated = True
-
     def mark_as_duplicate(self):
-        self.errors.append(
+        self.add_error(
             RowError(
                 row_number=self.index,
                 field_name="email",
@@ -489,6 +391,11 @@ class RoleRow(BaseRow):
 
 @attr.s()
 class RoleRows(BaseRows):
+    row_class = RoleRow
+    fields = ROLES_FIELDS
+    min_row = MIN_ROLE_ROW
+    max_col = MAX_ROLE_COL
+
     header = attr.ib(default="")
     rows = attr.ib(default=attr.Factory(list))
     is_valid = attr.ib(default=False)
@@ -506,8 +413,8 @@ class RoleRows(BaseRows):
 
     def validate(self, etab_sirets):
         self.is_valid = True
+        self.validate_rows(self.rows, etab_sirets)
         for row in self:
-            row.validate(etab_sirets)
             if not row.is_valid:
                 self.is_valid = False
 
@@ -526,22 +433,8 @@ class RoleRows(BaseRows):
         if duplicates_idx:
             self.is_valid = False
 
-    @classmethod
-    def from_worksheet(cls, worksheet):
-        role_rows = []
-        idx = 1
-        for row in worksheet.iter_rows(min_row=MIN_ROLE_ROW, max_col=MAX_ROLE_COL):
-            data = dict_read(row, ROLES_FIELDS)
-            if idx != 1:
-                role_row = RoleRow.from_dict(idx, data)
-
-                if role_row:
-                    role_rows.append(role_row)
-            idx += 1
-        return cls(rows=role_rows)
-
 
-@attr.s()
+@attr.s(slots=True)
 class EtabUpdateRow(BaseRow):
     index = attr.ib()
     siret = attr.ib(default="")
@@ -551,10 +444,14 @@ class EtabUpdateRow(BaseRow):
     wasteProcessorTypes = attr.ib(default=attr.Factory(list))
     wasteVehiclesTypes = attr.ib(default=attr.Factory(list))
 
-    errors = attr.ib(default=attr.Factory(list))
+    errors = attr.ib(default=NO_ERRORS)
     validated = attr.ib(default=False)
     tab_name = ETABLISSEMENTS_TAB
 
+    @classmethod
+    def column_checks(cls):
+        return ETAB_UPDATE_CHECKS
+
     def as_str(self):
         return f"{self.siret}"
 
@@ -599,104 +496,14 @@ class EtabUpdateRow(BaseRow):
         }
         return res
 
-    def company_types_are_valid(self):
-        if not self.companyTypes:
-            return False
-        return all([c_type in COMPANY_TYPES for c_type in self.companyTypes])
-
-    def collector_types_are_valid(self):
-        if not self.collectorTypes:
-            return True
-        if "COLLECTOR" not in self.companyTypes:
-            return False
-        matches = [c_type in COLLECTOR_TYPES for c_type in self.collectorTypes]
-        return all(matches) and len(matches)
-
-    def waste_processor_types_are_valid(self):
-        if not self.wasteProcessorTypes:
-            return True
-        if "WASTEPROCESSOR" not in self.companyTypes:
-            return False
-        matches = [c_type in WASTE_PROCESSOR_TYPES for c_type in self.wasteProcessorTypes]
-        return all(matches) and len(matches)
-
-    def waste_vehicle_types_are_valid(self):
-        if not self.wasteVehiclesTypes:
-            return True
-        if "WASTE_VEHICLES" not in self.companyTypes:
-            return False
-        matches = [c_type in WASTE_VEHICLE_TYPES for c_type in self.wasteVehiclesTypes]
-        return all(matches) and len(matches)
-
-    def validate(self):
-        if not self.siret_is_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="siret",
-                    field_value=self.siret,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.company_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="companyTypes",
-                    field_value=self.companyTypes,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.collector_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="collectorTypes",
-                    field_value=self.collectorTypes,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.waste_processor_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="wasteProcessorTypes",
-                    field_value=self.wasteProcessorTypes,
-                    tab=self.tab_name,
-                )
-            )
-        if not self.waste_vehicle_types_are_valid():
-            self.errors.append(
-                RowError(
-                    row_number=self.index,
-                    field_name="wasteVehiclesTypes",
-                    field_value=self.wasteVehiclesTypes,
-                    tab=self.tab_name,
-                )
-            )
-        # if not self.phone_number_is_valid():
-        #     self.errors.append(
-        #         RowError(
-        #             row_number=self.index,
-        #             field_name="contactPhone",
-        #             field_value=self.contactPhone,
-        #             tab=self.tab_name,
-        #         )
-        #     )
-        # if not self.email_is_valid():
-        #     self.errors.append(
-        #         RowError(
-        #             row_number=self.index,
-        #             field_name="contactEmail",
-        #             field_value=self.contactEmail,
-        #             tab=self.tab_name,
-        #         )
-        #     )
-        self.validated = True
-
 
 @attr.s()
 class EtabUpdateRows(BaseRows):
+    row_class = EtabUpdateRow
+    fields = ETABLISSEMENTS_UPDATE_FIELDS
+    min_row = MIN_ETAB_ROW
+    max_col = MAX_ETAB_UPDATE_COL
+
     header = attr.ib(default="")
     rows = attr.ib(default=attr.Factory(list))
     is_valid = attr.ib(default=False)
@@ -719,11 +526,11 @@ class EtabUpdateRows(BaseRows):
         if len(self.rows) < 3:
             self.has_enough_rows = False
             return
-        if len(self.rows) > 500:
+        if len(self.rows) > MAX_ETAB_ROWS:
             self.has_too_many_rows = True
             return
+        self.validate_rows(self.rows)
         for row in self:
-            row.validate()
             if not row.is_valid:
                 self.is_valid = False
 
@@ -739,19 +546,3 @@ class EtabUpdateRows(BaseRows):
         for row in self:
             ret.append(row.as_json())
         return ret
-
-    @classmethod
-    def from_worksheet(cls, worksheet):
-        etab_rows = []
-        idx = 1
-        for row in worksheet.iter_rows(min_row=MIN_ETAB_ROW, max_col=MAX_ETAB_UPDATE_COL):
-            data = dict_read(row, ETABLISSEMENTS_UPDATE_FIELDS)
-
-            if idx != 1:
-                etab_row = EtabUpdateRow.from_dict(idx, data)
-
-                if etab_row:
-                    etab_rows.append(etab_row)
-            idx += 1
-
-        return cls(rows=etab_rows)
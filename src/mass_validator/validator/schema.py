@@ -0,0 +1,139 @@
+"""
+Validation rules of each sheet, declared field by field.
+
+Rules are compiled once, at import, into `ColumnCheck`s run by both engines: row by row by `BaseRow.validate`, column
+by column by `columnar`. A new field only needs a rule here.
+"""
+
+import re
+
+import attr
+
+from .columnar import ColumnCheck
+from .constants import (
+    COLLECTOR_TYPES,
+    COMPANY_TYPES,
+    ERROR_FIELD,
+    ERROR_SIRET_MISSING_FROM_ETAB,
+    WASTE_PROCESSOR_TYPES,
+    WASTE_VEHICLE_TYPES,
+)
+from .emails import email_is_valid
+from .helpers import siret_is_well_formed
+
+KIND_SIRET = "siret"
+KIND_CHOICE = "choice"
+KIND_CHOICES = "choices"  # comma separated values, read as lists
+KIND_PHONE = "phone"
+KIND_EMAIL = "email"
+
+phone_re = re.compile(r"^(0[1-9])(?:[ _.-]?(\d{2})){4}$")
+
+
+@attr.s(frozen=True)
+class FieldRule:
+    field_name = attr.ib()
+    kind = attr.ib()
+    required = attr.ib(default=False)
+    choices = attr.ib(default=())
+    # filled values require companyTypes to hold this type
+    company_type = attr.ib(default=None)
+
+
+def value_validator(rule):
+    """Check of a filled value of `rule` field"""
+    if rule.kind == KIND_SIRET:
+        return siret_is_well_formed
+    if rule.kind == KIND_CHOICE:
+        return frozenset(rule.choices).__contains__
+    if rule.kind == KIND_CHOICES:
+        choices = frozenset(rule.choices)
+        return choices.issuperset
+    if rule.kind == KIND_PHONE:
+        match = phone_re.match
+        return lambda value: match(value) is not None
+    if rule.kind == KIND_EMAIL:
+        return email_is_valid
+    raise ValueError(f"Unknown rule kind {rule.kind}")
+
+
+def compile_rule(rule):
+    value_is_valid = value_validator(rule)
+    field_name = rule.field_name
+    required = rule.required
+    company_type = rule.company_type
+
+    if company_type is None:
+
+        def is_valid(value):
+            if not value:
+                return not required
+            return value_is_valid(value)
+
+        def row_is_valid(row):
+            return is_valid(getattr(row, field_name))
+
+        columns = (field_name,)
+    else:
+
+        def is_valid(value, company_types):
+            if not value:
+                return not required
+            if not company_types or company_type not in company_types:
+                return False
+            return value_is_valid(value)
+
+        def row_is_valid(row):
+            return is_valid(getattr(row, field_name), row.companyTypes)
+
+        columns = (field_name, "companyTypes")
+
+    return ColumnCheck(
+        field_name=field_name,
+        is_valid=is_valid,
+        row_is_valid=row_is_valid,
+        columns=columns,
+        error_type=ERROR_FIELD,
+    )
+
+
+def compile_schema(schema):
+    return [compile_rule(rule) for rule in schema]
+
+
+def etab_siret_check(etab_sirets):
+    """Roles sirets must be listed in the establishments tab"""
+    etab_sirets = frozenset(etab_sirets)
+    return ColumnCheck(
+        field_name="siret",
+        is_valid=etab_sirets.__contains__,
+        row_is_valid=lambda row: row.siret in etab_sirets,
+        columns=("siret",),
+        error_type=ERROR_SIRET_MISSING_FROM_ETAB,
+    )
+
+
+ETAB_TYPES_SCHEMA = [
+    FieldRule("siret", KIND_SIRET, required=True),
+    FieldRule("companyTypes", KIND_CHOICES, required=True, choices=COMPANY_TYPES),
+    FieldRule("collectorTypes", KIND_CHOICES, choices=COLLECTOR_TYPES, company_type="COLLECTOR"),
+    FieldRule("wasteProcessorTypes", KIND_CHOICES, choices=WASTE_PROCESSOR_TYPES, company_type="WASTEPROCESSOR"),
+    FieldRule("wasteVehiclesTypes", KIND_CHOICES, choices=WASTE_VEHICLE_TYPES, company_type="WASTE_VEHICLES"),
+]
+
+ETAB_CREATE_SCHEMA = ETAB_TYPES_SCHEMA + [
+    FieldRule("contactPhone", KIND_PHONE),
+    FieldRule("contactEmail", KIND_EMAIL),
+]
+
+ETAB_UPDATE_SCHEMA = ETAB_TYPES_SCHEMA
+
+ROLE_SCHEMA = [
+    FieldRule("role", KIND_CHOICE, required=True, choices=["MEMBER", "ADMIN"]),
+    FieldRule("siret", KIND_SIRET, required=True),
+    FieldRule("email", KIND_EMAIL, required=True),
+]
+
+ETAB_CREATE_CHECKS = compile_schema(ETAB_CREATE_SCHEMA)
+ETAB_UPDATE_CHECKS = compile_schema(ETAB_UPDATE_SCHEMA)
+ROLE_CHECKS = compile_schema(ROLE_SCHEMA)
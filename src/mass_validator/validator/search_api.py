@@ -1,21 +1,254 @@
+import os
+import threading
+import time
+
+from celery.signals import worker_process_init
 from django.conf import settings
-from elasticsearch7 import Elasticsearch
+from elasticsearch7 import Elasticsearch, Urllib3HttpConnection
 
-ACTIVE = "A"
+from ..metrics import elasticsearch_request
+from ..tracing import span
+from .bloom import bloom_statuses
+from .constants import ACTIVE
+from .helpers import chunks
+from .siret_cache import get_cache
+from .snapshot import needs_fallback, snapshot_statuses
 
 CERT_PATH = str(settings.BASE_DIR / "certs.pem")
 
+# seconds before searching failed msearch items again, doubled on each attempt
+ITEM_RETRY_DELAY = 0.25
 
-def check_siret(siret):
-    es = Elasticsearch(settings.TD_COMPANY_ELASTICSEARCH_URL, ca_certs=CERT_PATH)
 
-    query = {"bool": {"must": [{"match": {"siret": siret}}]}}
-    resp = es.search(index=settings.TD_COMPANY_ELASTICSEARCH_INDEX, query=query)
-    try:
-        hits = resp["hits"]["hits"]
-    except IndexError:
-        return False
+class SiretSearchError(Exception):
+    """Elasticsearch did not answer for some sirets, their status is unknown"""
+
+    def __init__(self, sirets, statuses=None):
+        super().__init__(f"{len(sirets)} sirets could not be searched")
+        self.sirets = sirets
+        # statuses of the sirets searched successfully alongside
+        self.statuses = statuses or {}
+
+
+class StatsConnection(Urllib3HttpConnection):
+    """Keep-alive connection counting failed requests, for pool stats"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failed = 0
+
+    def perform_request(self, *args, **kwargs):
+        try:
+            return super().perform_request(*args, **kwargs)
+        except Exception:
+            self.failed += 1
+            raise
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Process-wide elasticsearch client, created lazily.
+
+    The connection pool must not be shared across a fork: a client inherited from the parent process is dropped
+    and rebuilt in the child.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = Elasticsearch(
+                settings.TD_COMPANY_ELASTICSEARCH_URL,
+                ca_certs=CERT_PATH,
+                connection_class=StatsConnection,
+                maxsize=settings.TD_COMPANY_ELASTICSEARCH_MAXSIZE,
+                timeout=settings.TD_COMPANY_ELASTICSEARCH_TIMEOUT,
+                max_retries=settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES,
+                retry_on_timeout=settings.TD_COMPANY_ELASTICSEARCH_RETRY_ON_TIMEOUT,
+            )
+            _client_pid = pid
+    return _client
+
+
+@worker_process_init.connect
+def reset_client(**kwargs):
+    """Forget any client inherited from the parent process, a fresh one is built on first use"""
+    global _client, _client_pid
+    _client = None
+    _client_pid = None
+
+
+def pool_stats():
+    """Connection pool stats of the current process client"""
+    stats = {"open": 0, "created": 0, "requests": 0, "reused": 0, "failed": 0}
+    if _client is None or _client_pid != os.getpid():
+        return stats
+    for connection in _client.transport.connection_pool.connections:
+        pool = connection.pool
+        stats["open"] += sum(1 for conn in pool.pool.queue if conn is not None) if pool.pool else 0
+        stats["created"] += pool.num_connections
+        stats["requests"] += pool.num_requests
+        stats["failed"] += getattr(connection, "failed", 0)
+    stats["reused"] = max(stats["requests"] - stats["created"], 0)
+    return stats
+
+
+def siret_query(siret):
+    return {"bool": {"must": [{"match": {"siret": siret}}]}}
+
+
+def has_active_hit(hits):
     for hit in hits:
         if hit.get("_source", {}).get("etatAdministratifEtablissement", None) == ACTIVE:
             return True
     return False
+
+
+def search_siret(siret):
+    es = get_client()
+
+    resp = es.search(index=settings.TD_COMPANY_ELASTICSEARCH_INDEX, query=siret_query(siret))
+    try:
+        hits = resp["hits"]["hits"]
+    except IndexError:
+        return False
+    return has_active_hit(hits)
+
+
+def msearch_body(sirets):
+    """One `search_siret` query per siret, responses come back in request order"""
+    body = []
+    for siret in sirets:
+        body.append({})
+        body.append({"query": siret_query(siret)})
+    return body
+
+
+def read_responses(sirets, responses):
+    """
+    {siret: is_active} of the successful items of a msearch response, and the sirets of the failed ones.
+
+    A failed item, e.g. `{"error": ..., "status": 429}` when elasticsearch throttles, tells nothing about its siret:
+    it must not be read as an inactive one.
+    """
+    statuses = {}
+    failed = []
+    for position, siret in enumerate(sirets):
+        response = responses[position] if position < len(responses) else {"error": "missing response"}
+        if "error" in response or response.get("status", 200) >= 400:
+            failed.append(siret)
+        else:
+            statuses[siret] = has_active_hit(response.get("hits", {}).get("hits", []))
+    return statuses, failed
+
+
+def retry_delay(attempt):
+    return ITEM_RETRY_DELAY * 2 ** (attempt - 1)
+
+
+def search_statuses(sirets):
+    """
+    {siret: is_active} of a batch of sirets, in a single `_msearch` round trip.
+
+    Failed items are searched again, up to `TD_COMPANY_ELASTICSEARCH_MAX_RETRIES` times with a growing delay.
+
+    :raises SiretSearchError: when some sirets still fail
+    """
+    if not sirets:
+        return {}
+    es = get_client()
+
+    statuses = {}
+    pending = list(sirets)
+    for attempt in range(settings.TD_COMPANY_ELASTICSEARCH_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(retry_delay(attempt))
+        with (
+            span("elasticsearch msearch", **{"db.system": "elasticsearch", "sirets.count": len(pending)}),
+            elasticsearch_request(len(pending)),
+        ):
+            resp = es.msearch(body=msearch_body(pending), index=settings.TD_COMPANY_ELASTICSEARCH_INDEX)
+        fetched, pending = read_responses(pending, resp["responses"])
+        statuses.update(fetched)
+        if not pending:
+            return statuses
+    raise SiretSearchError(pending, statuses)
+
+
+def search_active_sirets(sirets):
+    """Subset of `sirets` referencing an active establishment, see `search_statuses`"""
+    return {siret for siret, status in search_statuses(sirets).items() if status}
+
+
+def check_siret(siret):
+    return siret in get_active_sirets([siret])
+
+
+def resolve_statuses(sirets, fetch, on_resolved=None):
+    """
+    {siret: is_active} of `sirets`, from the snapshot, the bloom filter and the cache first, elasticsearch last.
+
+    Engines only differ by their transport: `fetch(sirets, on_fetched)` searches the sirets left in elasticsearch,
+    calling `on_fetched(statuses)` with each batch of results, which are cached. Sirets elasticsearch fails to answer
+    for raise `SiretSearchError`, they are never reported inactive nor cached, the statuses found alongside are
+    passed to `on_fetched` first. `on_resolved(statuses)` is called with
+    each batch of newly known statuses. Sirets unknown to the snapshot are missing from the result when elasticsearch
+    fallback is disabled.
+    """
+    statuses = {}
+
+    def resolved(batch):
+        statuses.update(batch)
+        if batch and on_resolved:
+            on_resolved(batch)
+
+    with span("resolve_statuses", **{"sirets.count": len(sirets)}) as current:
+        resolved(snapshot_statuses(sirets))
+        if not needs_fallback():
+            return statuses
+
+        resolved(bloom_statuses([siret for siret in sirets if siret not in statuses]))
+
+        cache = get_cache() if settings.SIRET_CACHE_ENABLED else None
+        unknown = [siret for siret in sirets if siret not in statuses]
+        if cache and unknown:
+            resolved(cache.get_many(unknown))
+            unknown = [siret for siret in unknown if siret not in statuses]
+        current.set_attribute("sirets.unknown", len(unknown))
+        if not unknown:
+            return statuses
+
+        def fetched(batch):
+            if cache:
+                cache.set_many(batch)
+            resolved(batch)
+
+        fetch(unknown, fetched)
+    return statuses
+
+
+def fetch_statuses(sirets, on_fetched):
+    """Sync transport of `resolve_statuses`: one msearch per `SIRET_CHECK_CHUNK_SIZE` sirets, in turn"""
+    for chunk in chunks(sirets, settings.SIRET_CHECK_CHUNK_SIZE):
+        try:
+            statuses = search_statuses(chunk)
+        except SiretSearchError as error:
+            on_fetched(error.statuses)
+            raise
+        on_fetched(statuses)
+
+
+def get_active_sirets(sirets):
+    """
+    Return the subset of `sirets` referencing an active establishment, see `resolve_statuses`.
+
+    With the snapshot backend, elasticsearch is only queried for sirets unknown to the snapshot, if allowed.
+    """
+    statuses = resolve_statuses(sirets, fetch_statuses)
+    return {siret for siret, status in statuses.items() if status}
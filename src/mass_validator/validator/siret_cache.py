@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+
+from ..metrics import CACHE_SIRET, observe_cache
+
+REDIS_PREFIX = "siret_status:"
+REDIS_STATS_KEY = "siret_status_stats"
+
+LOCAL_HITS = "local_hits"
+REDIS_HITS = "redis_hits"
+MISSES = "misses"
+
+ACTIVE_VALUE = b"1"
+INACTIVE_VALUE = b"0"
+
+
+class LRUCache:
+    """Bounded in-process LRU, each entry having its own expiry"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class SiretCache:
+    """
+    Two tiers siret status cache: an in-process LRU in front of a redis tier shared by all workers.
+
+    Inactive or unknown sirets are cached as well (negative caching), with their own, shorter, ttl.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(settings.SIRET_CACHE_LOCAL_MAXSIZE)
+        self.counters = {LOCAL_HITS: 0, REDIS_HITS: 0, MISSES: 0}
+        # counters not yet added to the shared ones, sent along with the next redis lookup
+        self.unsent = {LOCAL_HITS: 0, REDIS_HITS: 0, MISSES: 0}
+        self._redis = None
+
+    @property
+    def redis(self):
+        url = getattr(settings, "CELERY_BROKER_URL", None)
+        if not url:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(url)
+        return self._redis
+
+    def local_ttl(self, active):
+        return settings.SIRET_CACHE_LOCAL_ACTIVE_TTL if active else settings.SIRET_CACHE_LOCAL_INACTIVE_TTL
+
+    def redis_ttl(self, active):
+        return settings.SIRET_CACHE_REDIS_ACTIVE_TTL if active else settings.SIRET_CACHE_REDIS_INACTIVE_TTL
+
+    def get_many(self, sirets):
+        """Return a {siret: is_active} dict of cached statuses, missing sirets are left out"""
+        found = {}
+        remaining = []
+        for siret in sirets:
+            status = self.local.get(siret)
+            if status is None:
+                remaining.append(siret)
+            else:
+                found[siret] = status
+        local_hits = len(found)
+
+        redis_hits = 0
+        if remaining and self.redis is not None:
+            unsent = {}
+            try:
+                with self.redis.pipeline(transaction=False) as pipe:
+                    unsent = self.send_counters(pipe)
+                    pipe.mget([f"{REDIS_PREFIX}{siret}" for siret in remaining])
+                    values = pipe.execute()[-1]
+            except redis.RedisError:
+                self.count_unsent(unsent)
+                values = [None] * len(remaining)
+            for siret, value in zip(remaining, values):
+                if value is None:
+                    continue
+                status = value == ACTIVE_VALUE
+                found[siret] = status
+                self.local.set(siret, status, self.local_ttl(status))
+                redis_hits += 1
+
+        self.count(local_hits, redis_hits, len(sirets) - len(found))
+        return found
+
+    def set_many(self, statuses):
+        """Store a {siret: is_active} dict in both tiers"""
+        for siret, status in statuses.items():
+            self.local.set(siret, status, self.local_ttl(status))
+        if not statuses or self.redis is None:
+            return
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for siret, status in statuses.items():
+                    value = ACTIVE_VALUE if status else INACTIVE_VALUE
+                    pipe.set(f"{REDIS_PREFIX}{siret}", value, ex=self.redis_ttl(status))
+                pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def count(self, local_hits, redis_hits, misses):
+        observe_cache(CACHE_SIRET, local_hits + redis_hits, misses)
+        self.counters[LOCAL_HITS] += local_hits
+        self.counters[REDIS_HITS] += redis_hits
+        self.counters[MISSES] += misses
+        self.count_unsent({LOCAL_HITS: local_hits, REDIS_HITS: redis_hits, MISSES: misses})
+
+    def count_unsent(self, counters):
+        for key, value in counters.items():
+            self.unsent[key] += value
+
+    def send_counters(self, pipe):
+        """Queue the unsent counters on `pipe`, saving a round trip of their own, and return them"""
+        unsent = self.unsent
+        self.unsent = {LOCAL_HITS: 0, REDIS_HITS: 0, MISSES: 0}
+        for key, value in unsent.items():
+            if value:
+                pipe.hincrby(REDIS_STATS_KEY, key, value)
+        return unsent
+
+    def stats(self):
+        """Counters of the current process, and shared ones aggregated over all processes when redis is available"""
+        stats = {"local_size": len(self.local), "local": dict(self.counters)}
+        if self.redis is not None:
+            with self.redis.pipeline(transaction=False) as pipe:
+                self.send_counters(pipe)
+                pipe.hgetall(REDIS_STATS_KEY)
+                shared = pipe.execute()[-1]
+            stats["shared"] = {k.decode(): int(v) for k, v in shared.items()}
+            stats["redis_size"] = sum(1 for _ in self.redis.scan_iter(match=f"{REDIS_PREFIX}*", count=1000))
+        return stats
+
+    def flush(self):
+        self.local.clear()
+        self.counters = {LOCAL_HITS: 0, REDIS_HITS: 0, MISSES: 0}
+        self.unsent = {LOCAL_HITS: 0, REDIS_HITS: 0, MISSES: 0}
+        if self.redis is None:
+            return
+        keys = list(self.redis.scan_iter(match=f"{REDIS_PREFIX}*", count=1000))
+        keys.append(REDIS_STATS_KEY)
+        self.redis.delete(*keys)
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = SiretCache()
+    return _cache
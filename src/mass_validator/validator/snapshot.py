@@ -0,0 +1,110 @@
+import csv
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+
+from .constants import ACTIVE
+from .helpers import chunks
+
+BACKEND_ELASTICSEARCH = "elasticsearch"
+BACKEND_SNAPSHOT = "snapshot"
+
+SIRET_COLUMN = "siret"
+STATE_COLUMN = "etatAdministratifEtablissement"
+
+# stay below SQLITE_MAX_VARIABLE_NUMBER on old sqlite builds
+MAX_QUERY_PARAMS = 900
+
+
+class SnapshotMissingException(Exception):
+    pass
+
+
+def build_snapshot(csv_file, path, batch_size=100_000):
+    """
+    Build a siret -> administrative state sqlite table from a SIRENE StockEtablissement csv file.
+
+    The snapshot is written beside `path` then moved in place, readers never see a partial file.
+    Returns the number of establishments stored.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    count = 0
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE etablissements (siret TEXT PRIMARY KEY, state TEXT) WITHOUT ROWID")
+        reader = csv.DictReader(csv_file)
+        batch = []
+        for line in reader:
+            batch.append((line[SIRET_COLUMN], line[STATE_COLUMN]))
+            if len(batch) >= batch_size:
+                conn.executemany("INSERT OR REPLACE INTO etablissements VALUES (?, ?)", batch)
+                count += len(batch)
+                batch = []
+        conn.executemany("INSERT OR REPLACE INTO etablissements VALUES (?, ?)", batch)
+        count += len(batch)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return count
+
+
+class Snapshot:
+    """Read-only access to a snapshot, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            if not os.path.exists(self.path):
+                raise SnapshotMissingException(f"No SIRENE snapshot at {self.path}")
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True)
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get_states(self, sirets):
+        """Return a {siret: administrative state} dict, sirets missing from the snapshot are left out"""
+        states = {}
+        for chunk in chunks(list(sirets), MAX_QUERY_PARAMS):
+            placeholders = ",".join("?" * len(chunk))
+            query = f"SELECT siret, state FROM etablissements WHERE siret IN ({placeholders})"  # nosec B608
+            states.update(self.conn.execute(query, chunk).fetchall())
+        return states
+
+
+_snapshot = None
+
+
+def get_snapshot():
+    global _snapshot
+    path = str(settings.SIRENE_SNAPSHOT_PATH)
+    if _snapshot is None or _snapshot.path != path:
+        _snapshot = Snapshot(path)
+    return _snapshot
+
+
+def snapshot_statuses(sirets):
+    """
+    {siret: is_active} for the sirets known by the snapshot, when it is the configured backend.
+
+    Sirets absent from the snapshot are left out so that the caller can fall back to elasticsearch.
+    """
+    if settings.SIRET_CHECK_BACKEND != BACKEND_SNAPSHOT:
+        return {}
+    states = get_snapshot().get_states(sirets)
+    return {siret: state == ACTIVE for siret, state in states.items()}
+
+
+def needs_fallback():
+    return settings.SIRET_CHECK_BACKEND != BACKEND_SNAPSHOT or settings.SIRENE_SNAPSHOT_ES_FALLBACK
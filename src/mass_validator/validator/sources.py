@@ -0,0 +1,108 @@
+"""
+Row sources: uploaded files are opened according to their first bytes, not their name.
+
+All workbooks expose `sheetnames` and `worksheets`, worksheets yield tuples of values from
+`iter_rows(min_row, max_row, max_col, values_only=True)`, so `*Rows.from_worksheet` accept any of them. Worksheets also
+expose `declared_rows`, the rows count announced by the file, None when the format does not announce it, and take a
+`row_limit`: reading a row past it raises `TooManyRowsException`.
+
+Archives are checked from their central directory before any part is decompressed, see `check_archive`.
+"""
+
+import zipfile
+
+from django.conf import settings
+
+from .csv_reader import CsvWorkbook
+from .ods_reader import OdsWorkbook
+from .xlsx_reader import StreamingWorkbook
+
+FORMAT_XLSX = "xlsx"
+FORMAT_ODS = "ods"
+FORMAT_CSV = "csv"
+
+ZIP_MAGIC = b"PK\x03\x04"
+OLE2_MAGIC = b"\xd0\xcf\x11\xe0"  # legacy xls
+ODS_MIMETYPE = b"application/vnd.oasis.opendocument.spreadsheet"
+
+XLSX_WORKSHEETS_DIR = "xl/worksheets/"
+# parts smaller than this are cheap to decompress, whatever their compression ratio
+RATIO_MIN_SIZE = 1024 * 1024
+
+# a csv file is a single sheet, named after the only tab of the templates it can stand for
+CSV_SHEET_TITLE = "etablissements"
+
+
+class UnsupportedFormatException(ValueError):
+    pass
+
+
+class UnsafeArchiveException(ValueError):
+    pass
+
+
+def sniff_format(file):
+    file.seek(0)
+    head = file.read(len(ZIP_MAGIC))
+    file.seek(0)
+
+    if head == ZIP_MAGIC:
+        with zipfile.ZipFile(file) as archive:
+            names = archive.namelist()
+            if "mimetype" in names and archive.read("mimetype").strip() == ODS_MIMETYPE:
+                return FORMAT_ODS
+        file.seek(0)
+        return FORMAT_XLSX
+    if head == OLE2_MAGIC:
+        raise UnsupportedFormatException("Legacy xls files are not supported")
+    return FORMAT_CSV
+
+
+def is_xlsx_worksheet(name):
+    return name.startswith(XLSX_WORKSHEETS_DIR) and name.endswith(".xml") and "/_rels/" not in name
+
+
+def check_archive(archive, file_format):
+    """
+    Reject archives too costly to decompress: uncompressed size, compression ratio of each part and sheets count.
+
+    Sizes are the ones declared by the central directory, `zipfile` never decompresses a part beyond its declared size.
+
+    :raises UnsafeArchiveException:
+    """
+    infos = archive.infolist()
+    if sum(info.file_size for info in infos) > settings.UPLOAD_MAX_UNCOMPRESSED_SIZE:
+        raise UnsafeArchiveException("Archive too large once uncompressed")
+
+    max_ratio = settings.UPLOAD_MAX_COMPRESSION_RATIO
+    for info in infos:
+        if info.file_size > RATIO_MIN_SIZE and info.file_size > max(info.compress_size, 1) * max_ratio:
+            raise UnsafeArchiveException(f"{info.filename} compression ratio too high")
+
+    if (
+        file_format == FORMAT_XLSX
+        and sum(is_xlsx_worksheet(info.filename) for info in infos) > settings.UPLOAD_MAX_SHEETS
+    ):
+        raise UnsafeArchiveException("Too many sheets")
+
+
+def open_workbook(file):
+    """
+    Open an xlsx, ods or csv file.
+
+    :param file: binary file-like object, seekable
+    :raises UnsupportedFormatException: for legacy xls and binary files
+    :raises UnsafeArchiveException: see `check_archive`
+    """
+    file_format = sniff_format(file)
+    if file_format in [FORMAT_XLSX, FORMAT_ODS]:
+        with zipfile.ZipFile(file) as archive:
+            check_archive(archive, file_format)
+    if file_format == FORMAT_ODS:
+        return OdsWorkbook(file)
+    if file_format == FORMAT_XLSX:
+        return StreamingWorkbook(file)
+    try:
+        return CsvWorkbook(file, CSV_SHEET_TITLE)
+    except ValueError as e:
+        raise UnsupportedFormatException(str(e))
@@ -0,0 +1,223 @@
+"""
+Streaming xlsx reader.
+
+Sheets are iterparsed straight out of the zip archive and rows come out as plain tuples of values, shared strings
+being read (and interned) once per workbook. Only what the validators need is supported: no styles, so date
+formatted cells are returned as their serial number, and formulas are returned as their cached value.
+"""
+
+import posixpath
+import sys
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+SHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+WORKBOOK_PATH = "xl/workbook.xml"
+SHARED_STRINGS_REL = f"{REL_NS}/sharedStrings"
+
+SHEET_TAG = f"{{{SHEET_NS}}}sheet"
+SI_TAG = f"{{{SHEET_NS}}}si"
+DIMENSION_TAG = f"{{{SHEET_NS}}}dimension"
+SHEET_DATA_TAG = f"{{{SHEET_NS}}}sheetData"
+ROW_TAG = f"{{{SHEET_NS}}}row"
+CELL_TAG = f"{{{SHEET_NS}}}c"
+VALUE_TAG = f"{{{SHEET_NS}}}v"
+TEXT_TAG = f"{{{SHEET_NS}}}t"
+RUN_TAG = f"{{{SHEET_NS}}}r"
+INLINE_STRING_TAG = f"{{{SHEET_NS}}}is"
+RELATIONSHIP_TAG = f"{{{PACKAGE_REL_NS}}}Relationship"
+RID_ATTR = f"{{{REL_NS}}}id"
+
+
+class TooManyRowsException(Exception):
+    """A worksheet row lies past the worksheet `row_limit`"""
+
+
+def column_index(reference):
+    """`C12` -> 3"""
+    index = 0
+    for char in reference:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+def row_index(reference):
+    """`C12` -> 12, None for a whole column reference"""
+    digits = "".join(char for char in reference if char.isdigit())
+    return int(digits) if digits else None
+
+
+def cast_number(value):
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def text_content(element):
+    """Plain text of a `si` or `is` element, phonetic runs excluded"""
+    snippets = []
+    for child in element:
+        if child.tag == TEXT_TAG:
+            snippets.append(child.text or "")
+        elif child.tag == RUN_TAG:
+            snippets.append(child.findtext(TEXT_TAG, ""))
+    return "".join(snippets).replace("x005F_", "")
+
+
+def read_shared_strings(source):
+    strings = []
+    for _, element in iterparse(source):
+        if element.tag == SI_TAG:
+            strings.append(sys.intern(text_content(element)))
+            element.clear()
+    return strings
+
+
+def cell_value(cell, shared_strings):
+    data_type = cell.get("t", "n")
+    if data_type == "inlineStr":
+        inline = cell.find(INLINE_STRING_TAG)
+        return text_content(inline) if inline is not None else None
+
+    value = cell.findtext(VALUE_TAG) or None
+    if value is None:
+        return None
+    if data_type == "n":
+        return cast_number(value)
+    if data_type == "s":
+        return shared_strings[int(value)]
+    if data_type == "b":
+        return bool(int(value))
+    return value
+
+
+class StreamingWorksheet:
+    # rows past this one raise `TooManyRowsException` while read, set from the upload limits
+    row_limit = None
+
+    def __init__(self, workbook, title, path):
+        self.workbook = workbook
+        self.title = title
+        self.path = path
+
+    @property
+    def declared_rows(self):
+        """
+        Last row of the sheet `dimension`, blank formatted rows included.
+
+        The dimension precedes the sheet data, only the head of the sheet is decompressed.
+        """
+        with self.workbook.archive.open(self.path) as source:
+            for _, element in iterparse(source, events=("start",)):
+                if element.tag == DIMENSION_TAG:
+                    return row_index(element.get("ref", "").split(":")[-1])
+                if element.tag == SHEET_DATA_TAG:
+                    break
+        return None
+
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True):
+        """
+        Yield rows as tuples of values, mimicking openpyxl read-only worksheets: missing rows and cells are filled
+        with None, rows are padded or cut to `max_col` columns. Rows past `row_limit` raise before any padding.
+
+        Only values are supported, `values_only` is there to match openpyxl signature.
+        """
+        if not values_only:
+            raise TypeError("Streaming worksheets only yield values, values_only must be True")
+
+        shared_strings = self.workbook.shared_strings
+        empty_row = (None,) * max_col if max_col else ()
+        counter = min_row
+        row_number = 0
+
+        with self.workbook.archive.open(self.path) as source:
+            for _, element in iterparse(source):
+                if element.tag != ROW_TAG:
+                    continue
+
+                row_number = int(element.get("r", row_number + 1))
+                if max_row is not None and row_number > max_row:
+                    break
+                if self.row_limit is not None and row_number > self.row_limit:
+                    raise TooManyRowsException(f"{self.title} has rows past {self.row_limit}")
+                if row_number < min_row:
+                    element.clear()
+                    continue
+
+                # some rows are missing
+                while counter < row_number:
+                    counter += 1
+                    yield empty_row
+
+                values = {}
+                column = 0
+                for cell in element.iter(CELL_TAG):
+                    reference = cell.get("r")
+                    column = column_index(reference) if reference else column + 1
+                    if max_col and column > max_col:
+                        continue
+                    values[column] = cell_value(cell, shared_strings)
+                element.clear()
+
+                width = max_col or max(values, default=0)
+                counter += 1
+                yield tuple(values.get(column) for column in range(1, width + 1))
+
+
+class StreamingWorkbook:
+    """
+    Read-only workbook exposing `sheetnames` and `worksheets` like openpyxl does.
+
+    :param file: path or file-like object of an xlsx file, `zipfile.BadZipFile` is raised if it is not a zip archive
+    """
+
+    def __init__(self, file):
+        self.archive = zipfile.ZipFile(file)
+        self._shared_strings = None
+
+        targets = {}
+        with self.archive.open(self.part_rels_path(WORKBOOK_PATH)) as rels:
+            for rel in parse(rels).getroot().iter(RELATIONSHIP_TAG):
+                targets[rel.get("Id")] = (rel.get("Type"), self.resolve(WORKBOOK_PATH, rel.get("Target")))
+
+        self.shared_strings_path = next(
+            (target for rel_type, target in targets.values() if rel_type == SHARED_STRINGS_REL), None
+        )
+
+        with self.archive.open(WORKBOOK_PATH) as workbook:
+            self.worksheets = [
+                StreamingWorksheet(self, sheet.get("name"), targets[sheet.get(RID_ATTR)][1])
+                for sheet in parse(workbook).getroot().iter(SHEET_TAG)
+            ]
+
+    @staticmethod
+    def part_rels_path(path):
+        folder, name = posixpath.split(path)
+        return posixpath.join(folder, "_rels", f"{name}.rels")
+
+    @staticmethod
+    def resolve(path, target):
+        if target.startswith("/"):
+            return target[1:]
+        return posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+
+    @property
+    def sheetnames(self):
+        return [ws.title for ws in self.worksheets]
+
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if self.shared_strings_path:
+                with self.archive.open(self.shared_strings_path) as source:
+                    self._shared_strings = read_shared_strings(source)
+        return self._shared_strings
+
+    def close(self):
+        self.archive.close()
@@ -1,213 +1,256 @@
+import io
 import json
 from zipfile import BadZipFile
 
 from celery.result import AsyncResult
-from django.http import HttpResponseRedirect
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect
 from django.urls import reverse_lazy
 from django.views.generic import FormView, TemplateView
-from openpyxl import load_workbook
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from core.celery_app import app
 
+from . import metrics, tracing
 from .forms import LogMeInForm, UploadCreationForm, UploadUpdateForm
-from .tasks import check_sirets
-from .validator.constants import ETABLISSEMENTS_CREATE_FIELDS, ETABLISSEMENTS_UPDATE_FIELDS, ROLES_FIELDS
-from .validator.row_models import EtabCreateRows, EtabUpdateRows, RoleRows
+from .large_files import KIND_CREATE, KIND_UPDATE, ErrorPages, get_export, is_large_file, save_upload
+from .parsing import (
+    ROW_READING_ERRORS,
+    FileReadingException,
+    InvalidHeaderException,
+    TabException,
+    TooManyRowsException,
+    first_row,
+    load_update_xlsx,
+    validate_header,
+)
+from .progress import shards_progress
+from .reports import get_report, set_report
+from .tasks import validate_creation_upload, validate_large_file
+from .timing import NO_TIMER, stage_timer
+from .validator.constants import ETABLISSEMENTS_UPDATE_FIELDS, MAX_ETAB_ROWS
+from .validator.row_models import EtabUpdateRows
+
+
+class StageTimingMixin:
+    """
+    Uploads are timed stage by stage, timings are sent in a `Server-Timing` header and logged, see `timing`.
 
+    Stages are timed with `self.timer`, a no-op outside uploads or when `STAGE_TIMING_ENABLED` is off.
+    """
 
-class FileReadingException(Exception):
-    pass
+    timer = NO_TIMER
+    report_kind = None
 
+    def post(self, request, *args, **kwargs):
+        # the request span is the root of the upload trace, tasks it dispatches included
+        with tracing.span(f"upload {self.report_kind}", **{"http.route": request.path}):
+            self.timer = stage_timer(self.report_kind)
+            with self.timer.stage("receive_upload"):
+                _ = request.FILES  # parse multipart inside the "receive_upload" stage
+            response = super().post(request, *args, **kwargs)
+            self.timer.report(response)
+        return response
 
-class TabException(Exception):
-    pass
 
+def task_failed(task_id):
+    """Whether the task, or the siret check a creation file validation went on with, failed"""
+    if not task_id:
+        return False
+    job = AsyncResult(task_id, app=app)
+    if job.failed():
+        return True
+    result = job.result if job.successful() else None
+    return isinstance(result, dict) and task_failed(result.get("siret_task_id"))
 
-class InvalidHeaderException(Exception):
-    pass
 
+class CachedReportMixin:
+    """
+    Validation outcomes are cached by upload digest, re-uploading the same file skips parsing and validation.
 
-def load_create_xlsx(file):
-    try:
-        wb = load_workbook(
-            filename=file,
-            read_only=True,
-            keep_links=False,
-            data_only=True,
-            keep_vba=False,
-        )
-    except ValueError:
-        raise FileReadingException
-    sheetnames = wb.sheetnames
-    if len(sheetnames) != 2:
-        raise TabException
-    if sheetnames[0] != "etablissements":
-        raise TabException
-    if sheetnames[1] != "roles":
-        raise TabException
-    return wb
-
-
-def load_update_xlsx(file):
-    try:
-        wb = load_workbook(
-            filename=file,
-            read_only=True,
-            keep_links=False,
-            data_only=True,
-            keep_vba=False,
-        )
-    except ValueError:
-        raise FileReadingException
-    sheetnames = wb.sheetnames
+    The digest is computed while the file is received, see `HashingUploadHandler`.
+    """
 
-    if len(sheetnames) != 1:
-        raise TabException
-    if sheetnames[0] != "etablissements":
-        raise TabException
+    report_kind = None
+    report_fields = (
+        "errors",
+        "parse_error",
+        "enough_rows_error",
+        "too_many_rows_error",
+        "large_file_task_id",
+    )
+    # report fields holding a task id
+    task_fields = ("large_file_task_id",)
+
+    def upload_digest(self):
+        return getattr(self.request, "upload_digests", {}).get("file")
+
+    def report_cache_kind(self):
+        # connected users are not subject to the same rows limit
+        return f"{self.report_kind}:{int(bool(self.request.connected))}"
+
+    def restore_report(self):
+        report = get_report(self.report_cache_kind(), self.upload_digest())
+        # a failed task is dispatched again rather than served until the report expires
+        if report is None or any(task_failed(report.get(field)) for field in self.task_fields):
+            return False
+        for field in self.report_fields:
+            setattr(self, field, report[field])
+        return True
+
+    def store_report(self):
+        report = {field: getattr(self, field) for field in self.report_fields}
+        set_report(self.report_cache_kind(), self.upload_digest(), report)
+
+    def parse_or_restore(self, file):
+        metrics.observe_upload(self.report_kind, file.size)
+        with self.timer.stage("report_cache"):
+            restored = self.restore_report()
+        self.timer.count(cached=restored)
+        metrics.observe_cache(metrics.CACHE_REPORT, int(restored), int(not restored))
+        if not restored:
+            self.parse(file)
+            with self.timer.stage("report_cache"):
+                self.store_report()
+
+
+class LargeFileMixin:
+    """
+    Connected users may upload files above `MAX_ETAB_ROWS` rows, up to `LARGE_FILE_MAX_ROWS`.
 
-    return wb
+    Those are handed over to `validate_large_file`, see `large_files`.
+    """
 
+    def max_rows(self):
+        return settings.LARGE_FILE_MAX_ROWS if self.request.connected else MAX_ETAB_ROWS
 
-def validate_header(first_row, expected_header):
-    """Validate first worksheet row matches `expected_header`"""
+    def start_large_file(self, file, worksheet, rows_class):
+        """
+        Launch the large-file validation of a connected user file above `MAX_ETAB_ROWS` rows.
 
-    header = [cell.value for cell in first_row]
+        Only the first `MAX_ETAB_ROWS` rows are read here, the task counts the others and checks the rows limit.
 
-    if header != expected_header:
-        raise InvalidHeaderException
+        :return: True when the file is handed over to a task
+        """
+        if not self.request.connected:
+            return False
 
+        with self.timer.stage("count_rows"):
+            if not is_large_file(worksheet, rows_class):
+                return False
 
-class ValidateCreationFileView(FormView):
+        with self.timer.stage("dispatch"):
+            self.large_file_task_id = validate_large_file.delay(self.report_kind, save_upload(file)).id
+        return True
+
+    def large_file_url(self):
+        return reverse_lazy("large_file_result", args=[self.large_file_task_id])
+
+
+class ValidateCreationFileView(StageTimingMixin, CachedReportMixin, FormView):
     """
-    Performs form submission and main validation.
-    If validation fails, display error messages in a table
-    If validation succeeds, launch an async task and redirects to a view polling results from the queue.
+    Performs form submission.
+    The file is saved and handed over to an async task validating it, whatever its size, then the user is redirected
+    to a view polling results from the queue: file errors, or siret api validation errors.
     """
 
     form_class = UploadCreationForm
     template_name = "mass_validator/validate_create.html"
-
-    @property
-    def has_errors(self):
-        return self.errors or self.parse_error or self.enough_rows_error or self.too_many_rows_error
+    report_kind = KIND_CREATE
+    report_fields = ("async_task_id",)
+    task_fields = ("async_task_id",)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.errors = []
-        self.parse_error = False
-        self.parse_error_message = ""
-        self.enough_rows_error = False
-        self.too_many_rows_error = False
         self.async_task_id = None
 
-    def check_sirets_exists(self, etab_rows):
-        to_check = [{"siret": row.siret, "row_number": row.index} for row in etab_rows]
-
-        async_task = check_sirets.delay(to_check)
-
-        self.async_task_id = async_task.id
-
     def parse(self, file):
-        try:
-            wb = load_create_xlsx(file)
-        except (BadZipFile, KeyError, TabException, FileReadingException):
-            self.parse_error = True
-            return
+        with self.timer.stage("save_upload"):
+            key = save_upload(file)
+        with self.timer.stage("dispatch"):
+            self.async_task_id = validate_creation_upload.delay(key, bool(self.request.connected)).id
 
-        ws_etablissements = wb.worksheets[0]
-
-        ws_roles = wb.worksheets[1]
-        etab_first_row = ws_etablissements[1][: len(ETABLISSEMENTS_CREATE_FIELDS)]
-        role_first_row = ws_roles[1][: len(ROLES_FIELDS)]
-
-        # performs header validation, exits if it fails
-        try:
-            validate_header(etab_first_row, ETABLISSEMENTS_CREATE_FIELDS)
-            validate_header(role_first_row, ROLES_FIELDS)
-        except InvalidHeaderException:
-            self.parse_error = True
-            return
-
-        etab_rows = EtabCreateRows.from_worksheet(ws_etablissements)
+    def form_valid(self, form):
+        file = self.request.FILES["file"]
 
-        etab_rows.validate()
+        self.parse_or_restore(file)
+        # file stages are timed and logged by the task
+        self.timer.count(task_id=self.async_task_id)
 
-        # exits if customer is too lazy
-        if not etab_rows.has_enough_rows:
-            self.enough_rows_error = True
-            return
-
-        # exits if too many rows
-        if etab_rows.has_too_many_rows:
-            self.too_many_rows_error = True
-            return
+        return HttpResponseRedirect(self.get_success_url())
 
-        role_rows = RoleRows.from_worksheet(ws_roles)
+    def get_success_url(self):
+        return reverse_lazy("pollable_result", args=[self.async_task_id])
 
-        role_rows.validate(etab_rows.sirets())
 
-        # main validation
-        if not etab_rows.is_valid:
-            self.errors.extend(etab_rows.get_errors())
-        if not role_rows.is_valid:
-            self.errors.extend(role_rows.get_errors())
+STATE_RUNNING = "running"
+STATE_DONE = "done"
 
-        # This validation can occur when both tabs are already validated
-        if etab_rows.is_valid and role_rows.is_valid:
-            etab_rows.validate_have_admin(role_rows.admin_sirets())
-            if not etab_rows.is_valid:
-                self.errors.extend(etab_rows.get_errors())
 
-        # only performs api checks if everything else passes
-        if not self.has_errors:
-            # async task
-            self.check_sirets_exists(etab_rows)
+def sirets_result_context(task_id, siret_check=False):
+    """
+    Progress, then result of a creation file validation, followed by the siret check it went on with.
 
-    def form_valid(self, form):
-        file = self.request.FILES["file"]
+    A failed validation is reported as a file which could not be read, a failed siret check as a check to run again.
+    """
+    job = AsyncResult(task_id, app=app)
+    ctx = {"task_id": task_id}
 
-        self.parse(file)
+    if not job.ready():
+        result = job.result
+        if isinstance(result, dict) and "shards" in result:
+            ctx.update(shards_progress(result["shards"], result["shard_sizes"]))
+        elif isinstance(result, dict):
+            ctx.update(result)
+        else:
+            ctx.update({"progress": 0.0})
+        ctx.update({"state": STATE_RUNNING})
+        return ctx
 
-        if self.has_errors:
-            return self.error_page()
-        # if form valid, redirect to a page polling siret api validation
-        return HttpResponseRedirect(self.get_success_url())
+    if job.failed():
+        if siret_check:
+            ctx["siret_check_error"] = True
+        else:
+            ctx.update({"parse_error": True, "has_errors": True})
+        ctx.update({"progress": 100.0, "state": STATE_DONE})
+        return ctx
 
-    def error_page(self):
-        return self.render_to_response(
-            {
-                "errors": self.errors,
-                "parse_error": self.parse_error,
-                "has_errors": self.has_errors,
-                "enough_rows_error": self.enough_rows_error,
-                "too_many_rows_error": self.too_many_rows_error,
-            }
+    result = job.get()
+    if isinstance(result, dict):
+        # report of `validate_creation_upload`
+        if result["siret_task_id"]:
+            return sirets_result_context(result["siret_task_id"], siret_check=True)
+        if result["large_file_task_id"]:
+            ctx["redirect_url"] = reverse_lazy("large_file_result", args=[result["large_file_task_id"]])
+        ctx.update(result)
+        ctx["has_errors"] = bool(
+            result["errors"] or result["parse_error"] or result["enough_rows_error"] or result["too_many_rows_error"]
         )
-
-    def get_success_url(self):
-        if self.async_task_id:
-            return reverse_lazy("pollable_result", args=[self.async_task_id])
-        return reverse_lazy("create_result")
+    else:
+        ctx.update({"siret_errors": result})
+    ctx.update({"progress": 100.0, "state": STATE_DONE})
+    return ctx
 
 
 class CreateResultView(TemplateView):
-    """Optional `task_id` trigger result polling in template"""
+    """Optional `task_id` trigger result polling in template, results are rendered right away when available"""
 
     template_name = "mass_validator/create_result.html"
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx.update({"task_id": self.kwargs.get("task_id", None)})
+        task_id = self.kwargs.get("task_id", None)
+        ctx.update(sirets_result_context(task_id) if task_id else {"task_id": None})
         return ctx
 
-
-STATE_RUNNING = "running"
-STATE_DONE = "done"
+    def render_to_response(self, context, **response_kwargs):
+        if context.get("redirect_url"):
+            return HttpResponseRedirect(context["redirect_url"])
+        return super().render_to_response(context, **response_kwargs)
 
 
 class CheckSiretView(TemplateView):
-    """View to be called by CreateResultView template to render api call results when done"""
+    """View to be called by CreateResultView template to render validation results when done"""
 
     template_name = "mass_validator/_sirets_result.html"
 
@@ -217,29 +260,24 @@ class CheckSiretView(TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        job = AsyncResult(self.task_id, app=app)
-        done = job.ready()
-
-        result = job.result
-
-        if isinstance(result, dict):
-            progress = result.get("progress", 0)
-        else:
-            progress = 100.0 if done else 0.0
-
-        ctx.update({"progress": progress})
-
-        if not job.ready():
-            ctx.update({"state": STATE_RUNNING})
-        else:
-            ctx.update({"siret_errors": job.get(), "state": STATE_DONE})
+        ctx.update(sirets_result_context(self.task_id))
         return ctx
 
+    def render_to_response(self, context, **response_kwargs):
+        if context.get("redirect_url"):
+            # polled by htmx, which follows the redirection
+            response = HttpResponse()
+            response["HX-Redirect"] = context["redirect_url"]
+            return response
+        return super().render_to_response(context, **response_kwargs)
+
 
-class ValidateUpdateFileView(FormView):
+class ValidateUpdateFileView(StageTimingMixin, CachedReportMixin, LargeFileMixin, FormView):
     form_class = UploadUpdateForm
     template_name = "mass_validator/validate_update.html"
     success_url = "/"
+    report_kind = KIND_UPDATE
+    report_fields = (*CachedReportMixin.report_fields, "json_export")
 
     @property
     def has_errors(self):
@@ -252,7 +290,7 @@ class ValidateUpdateFileView(FormView):
         self.parse_error_message = ""
         self.enough_rows_error = False
         self.too_many_rows_error = False
-        self.async_task_id = None
+        self.large_file_task_id = None
         self.json_export = []
 
     def error_page(self):
@@ -263,6 +301,7 @@ class ValidateUpdateFileView(FormView):
                 "has_errors": self.has_errors,
                 "enough_rows_error": self.enough_rows_error,
                 "too_many_rows_error": self.too_many_rows_error,
+                "max_rows": self.max_rows(),
             }
         )
 
@@ -275,26 +314,43 @@ class ValidateUpdateFileView(FormView):
 
     def parse(self, file):
         try:
-            wb = load_update_xlsx(file)
+            with self.timer.stage("load_workbook"):
+                wb = load_update_xlsx(file, self.max_rows())
         except (BadZipFile, KeyError, TabException, FileReadingException):
             self.parse_error = True
             return
+        except TooManyRowsException:
+            self.too_many_rows_error = True
+            return
 
-        ws_etablissements = wb.worksheets[0]
-
-        etab_first_row = ws_etablissements[1][: len(ETABLISSEMENTS_UPDATE_FIELDS)]
+        try:
+            self.parse_rows(file, wb.worksheets[0])
+        except ROW_READING_ERRORS:
+            self.parse_error = True
+        except TooManyRowsException:
+            self.too_many_rows_error = True
 
+    def parse_rows(self, file, ws_etablissements):
+        """Header and rows checks of `parse`"""
         # performs header validation, exits if it fails
         try:
-            validate_header(etab_first_row, ETABLISSEMENTS_UPDATE_FIELDS)
+            with self.timer.stage("validate_header"):
+                etab_first_row = first_row(ws_etablissements, len(ETABLISSEMENTS_UPDATE_FIELDS))
+                validate_header(etab_first_row, ETABLISSEMENTS_UPDATE_FIELDS)
 
         except InvalidHeaderException:
             self.parse_error = True
             return
 
-        etab_rows = EtabUpdateRows.from_worksheet(ws_etablissements)
+        if self.start_large_file(file, ws_etablissements, EtabUpdateRows):
+            return
+
+        with self.timer.stage("from_worksheet"):
+            etab_rows = EtabUpdateRows.from_worksheet(ws_etablissements)
+        self.timer.count(rows=len(etab_rows.rows))
 
-        etab_rows.validate()
+        with self.timer.stage("validate"):
+            etab_rows.validate()
 
         # exits if customer is too lazy
         if not etab_rows.has_enough_rows:
@@ -308,21 +364,94 @@ class ValidateUpdateFileView(FormView):
 
         if not etab_rows.is_valid:
             self.errors.extend(etab_rows.get_errors())
+            self.timer.count(errors=len(self.errors))
             return
 
-        self.json_export = etab_rows.as_json()
+        with self.timer.stage("as_json"):
+            self.json_export = etab_rows.as_json()
+        self.timer.count(errors=0)
 
     def form_valid(self, form):
         file = self.request.FILES["file"]
 
-        self.parse(file)
+        self.parse_or_restore(file)
 
         if self.has_errors:
             return self.error_page()
 
+        if self.large_file_task_id:
+            return HttpResponseRedirect(self.large_file_url())
+
         return self.success_page()
 
 
+def large_file_context(task_id, page):
+    """Progress of a large file validation, then its result with a page of errors"""
+    job = AsyncResult(task_id, app=app)
+    ctx = {"task_id": task_id}
+
+    if not job.ready():
+        if isinstance(job.result, dict):
+            ctx.update(job.result)
+        ctx.update({"state": STATE_RUNNING})
+        return ctx
+
+    if job.failed():
+        ctx.update({"state": STATE_DONE, "parse_error": True})
+        return ctx
+
+    result = job.get()
+    pages = result["pages"]
+    page = min(max(page, 1), pages or 1)
+    ctx.update(result)
+    ctx.update(
+        {
+            "state": STATE_DONE,
+            "page": page,
+            # a window of pages around the current one, files may have thousands of pages
+            "page_range": range(max(1, page - 5), min(pages, page + 5) + 1),
+            "errors": ErrorPages(task_id).get_page(page) if pages else [],
+        }
+    )
+    return ctx
+
+
+class LargeFileResultView(TemplateView):
+    """Result page of a large file, errors are displayed by pages"""
+
+    template_name = "mass_validator/large_file_result.html"
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        try:
+            page = int(self.request.GET.get("page", 1))
+        except ValueError:
+            page = 1
+        ctx.update(large_file_context(self.kwargs["task_id"], page))
+        return ctx
+
+
+class CheckLargeFileView(LargeFileResultView):
+    """View to be called by LargeFileResultView template to render progress, then results when done"""
+
+    template_name = "mass_validator/_large_file_result.html"
+
+
+def large_file_export(request, task_id):
+    """Json export of a valid large update file, for connected users"""
+    export = get_export(task_id)
+    if not request.connected or export is None:
+        raise Http404
+    return FileResponse(io.BytesIO(export.encode()), as_attachment=True, filename="export.json")
+
+
+def metrics_export(request):
+    """Prometheus metrics of the web processes, behind the `METRICS_TOKEN` bearer token, closed when it is empty"""
+    if not settings.METRICS_TOKEN or request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.exposition(), content_type=CONTENT_TYPE_LATEST)
+
+
 class UpdateResultView(TemplateView):
     template_name = "mass_validator/update_result.html"
 